@@ -0,0 +1,261 @@
+"""
+Admission control for the /get analysis path.
+
+A spike of chats used to queue every request behind model inference until gunicorn's timeout,
+holding the worker threads that /breathing or /knowledge needed. Now each chat first passes:
+
+ - per-client token buckets (ADMISSION_RATE messages per second, bursts of ADMISSION_BURST;
+   0 disables them). A request spends from the bucket of its address (client_address(); set
+   TRUSTED_PROXY_HOPS behind a proxy such as Heroku's router) and, once it has one, of its session
+   id, and needs a token in both. New session ids are free to get, so the address is what bounds a
+   client that drops its cookie. Over the limit, /get answers 429 with Retry-After.
+ - a concurrency limiter: at most ADMISSION_CONCURRENCY analyses run at once per process and up to
+   ADMISSION_QUEUE more wait, each for at most ADMISSION_QUEUE_TIMEOUT_MS. A request that finds the
+   queue full, or times out in it, is shed: /get returns a degraded reply built from the keyword
+   matcher and static tips only (no model, no database) instead of waiting.
+
+Crisis messages (the matcher's 'suicidal' intent) skip both and are always analyzed. A /get_batch
+request takes one slot and spends a token per in-scope message; one larger than the burst needs a
+full bucket and leaves it in debt, so the client waits out the whole cost before its next message.
+
+Slots are handed over first come, first served: release() passes its slot straight to the oldest
+waiter. Waiters are threads (slot()) or asyncio tasks (slot_async(), for asgi.py). stats() counts
+admitted, queued, shed, timed-out, rate-limited and crisis requests for /metrics.
+"""
+import asyncio
+import collections
+import contextlib
+import os
+import threading
+import time
+
+CONCURRENCY = int(os.environ.get('ADMISSION_CONCURRENCY', '32'))
+QUEUE = int(os.environ.get('ADMISSION_QUEUE', '256'))
+QUEUE_TIMEOUT = float(os.environ.get('ADMISSION_QUEUE_TIMEOUT_MS', '2000')) / 1000.0
+RATE = float(os.environ.get('ADMISSION_RATE', '0'))
+BURST = float(os.environ.get('ADMISSION_BURST', '10'))
+MAX_CLIENTS = int(os.environ.get('ADMISSION_MAX_CLIENTS', '100000'))
+# proxies in front of the app that append to X-Forwarded-For (1 behind Heroku's router)
+PROXY_HOPS = int(os.environ.get('TRUSTED_PROXY_HOPS', '0'))
+
+CRISIS_INTENT = 'suicidal'
+
+# outcomes of slot() / slot_async()
+ADMITTED = 'admitted'
+SHED = 'shed'
+RATE_LIMITED = 'rate_limited'
+
+Decision = collections.namedtuple('Decision', 'outcome retry_after')
+
+
+class Limiter:
+    """At most `concurrency` holders at once, with a bounded FIFO of waiters."""
+
+    def __init__(self, concurrency=CONCURRENCY, queue_size=QUEUE, timeout=QUEUE_TIMEOUT):
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._waiters = collections.deque()  # callables that wake a waiter once it owns a slot
+        self.active = 0
+
+    def _enter(self, force, wake):
+        """True when a slot was taken, False when the queue is full, else the queued waiter."""
+        with self._lock:
+            if force or self.active < self.concurrency:
+                self.active += 1
+                return True
+            if len(self._waiters) >= self.queue_size:
+                return False
+            self._waiters.append(wake)
+            return wake
+
+    def _abandon(self, wake):
+        """Withdraw a waiter that timed out; False if release() handed it a slot meanwhile."""
+        with self._lock:
+            try:
+                self._waiters.remove(wake)
+                return True
+            except ValueError:
+                return False
+
+    def acquire(self, force=False):
+        """Take a slot, waiting up to the timeout.
+
+        Returns 'taken' or 'queued' (a slot was obtained, at once or after waiting), 'full' (the
+        queue was full) or 'timeout'.
+        """
+        event = threading.Event()
+        entered = self._enter(force, event.set)
+        if isinstance(entered, bool):
+            return 'taken' if entered else 'full'
+        if event.wait(self.timeout) or not self._abandon(entered):
+            return 'queued'
+        return 'timeout'
+
+    async def acquire_async(self, force=False):
+        """acquire() for a coroutine: waits on the event loop rather than in a thread."""
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+
+        def wake():
+            loop.call_soon_threadsafe(lambda: fut.done() or fut.set_result(True))
+
+        entered = self._enter(force, wake)
+        if isinstance(entered, bool):
+            return 'taken' if entered else 'full'
+        try:
+            await asyncio.wait_for(asyncio.shield(fut), self.timeout)
+            return 'queued'
+        except asyncio.TimeoutError:
+            return 'timeout' if self._abandon(entered) else 'queued'
+        except asyncio.CancelledError:
+            # the client went away: give back a slot that was handed over meanwhile
+            if not self._abandon(entered):
+                self.release()
+            raise
+
+    def release(self):
+        with self._lock:
+            if not self._waiters:
+                self.active -= 1
+                return
+            # the slot passes to the oldest waiter; active stays the same
+            wake = self._waiters.popleft()
+        wake()
+
+    def waiting(self):
+        return len(self._waiters)
+
+
+class TokenBuckets:
+    """Per-client token buckets of `burst` tokens refilled at `rate` per second (LRU-bounded)."""
+
+    def __init__(self, rate=RATE, burst=BURST, max_clients=MAX_CLIENTS):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self._buckets = collections.OrderedDict()  # client -> (tokens, updated_at)
+        self._lock = threading.Lock()
+
+    def take(self, keys, cost=1):
+        """Spend `cost` tokens from the bucket of every one of `keys`, or from none of them.
+
+        Returns 0 when allowed, else the seconds until all of them hold enough. A cost above the
+        burst is allowed from a full bucket and charged in full, leaving the bucket below zero.
+        """
+        if self.rate <= 0:
+            return 0
+        need = min(cost, self.burst)
+        now = time.monotonic()
+        with self._lock:
+            levels = {}
+            for client in keys:
+                tokens, updated_at = self._buckets.pop(client, (self.burst, now))
+                levels[client] = min(self.burst, tokens + (now - updated_at) * self.rate)
+            wait = max((need - tokens) / self.rate for tokens in levels.values())
+            for client, tokens in levels.items():
+                self._buckets[client] = (tokens - cost if wait <= 0 else tokens, now)
+            while len(self._buckets) > self.max_clients:
+                # a forgotten client starts again with a full bucket
+                self._buckets.popitem(last=False)
+        return max(wait, 0)
+
+
+limiter = Limiter()
+buckets = TokenBuckets()
+_stats = collections.Counter()
+_stats_lock = threading.Lock()
+
+
+def _reset():
+    global limiter, buckets, _stats, _stats_lock
+    limiter, buckets, _stats, _stats_lock = Limiter(), TokenBuckets(), collections.Counter(), threading.Lock()
+
+
+def _count(*keys):
+    with _stats_lock:
+        for key in keys:
+            _stats[key] += 1
+
+
+if hasattr(os, 'register_at_fork'):
+    # a forked worker starts with no slots taken, whatever the parent was doing
+    os.register_at_fork(after_in_child=_reset)
+
+
+def is_crisis(text_match):
+    return text_match.intent == CRISIS_INTENT
+
+
+def client_address(remote_addr, forwarded_for=''):
+    """The client's address: with PROXY_HOPS proxies in front, the one the outermost proxy saw."""
+    if PROXY_HOPS and forwarded_for:
+        hops = [hop.strip() for hop in forwarded_for.split(',') if hop.strip()]
+        if len(hops) >= PROXY_HOPS:
+            return hops[-PROXY_HOPS]
+    return remote_addr
+
+
+def clients(address, sid=None):
+    """Rate-limit keys of a request: its address, plus its session id once it has one."""
+    return (('addr', address),) + ((('sid', sid),) if isinstance(sid, str) else ())
+
+
+def _check_rate(keys, crisis, cost):
+    if crisis:
+        _count('crisis')
+        return None
+    retry_after = buckets.take(keys, cost)
+    if retry_after:
+        _count('rate_limited')
+        return Decision(RATE_LIMITED, retry_after)
+    return None
+
+
+def _admitted(state):
+    if state in ('full', 'timeout'):
+        _count('shed', *(['timed_out'] if state == 'timeout' else []))
+        return Decision(SHED, None)
+    _count('admitted', *(['queued'] if state == 'queued' else []))
+    return Decision(ADMITTED, None)
+
+
+@contextlib.contextmanager
+def slot(keys, crisis=False, cost=1):
+    """Admit one analysis for the client `keys` (see clients()).
+
+    Yields a Decision and frees the slot on exit if admitted. `cost` is the number of messages.
+    """
+    decision = _check_rate(keys, crisis, cost)
+    if decision is not None:
+        yield decision
+        return
+    decision = _admitted(limiter.acquire(force=crisis))
+    try:
+        yield decision
+    finally:
+        if decision.outcome == ADMITTED:
+            limiter.release()
+
+
+@contextlib.asynccontextmanager
+async def slot_async(keys, crisis=False, cost=1):
+    """slot() for asgi.py: a queued request waits on the event loop."""
+    decision = _check_rate(keys, crisis, cost)
+    if decision is not None:
+        yield decision
+        return
+    decision = _admitted(await limiter.acquire_async(force=crisis))
+    try:
+        yield decision
+    finally:
+        if decision.outcome == ADMITTED:
+            limiter.release()
+
+
+def stats():
+    with _stats_lock:
+        out = dict(_stats)
+    out.update({'active': limiter.active, 'waiting': limiter.waiting(), 'concurrency': limiter.concurrency})
+    return out
@@ -1,32 +1,39 @@
-from flask import Flask, render_template, request, jsonify, session
-import pickle, os, random, json
-from collections import defaultdict
-from db import get_conn
-from sklearn.feature_extraction.text import TfidfVectorizer
-import numpy as np
+from flask import Flask, Blueprint, Response, render_template, request, jsonify, session
+import hmac, math, os, random, threading
+import admission
+import db
+from db import connection
+import query
+import writebehind
+import inference
+import matcher
+import resources
+import pagination
+import rollups
+import search
+import session_store
+import db_setup
+import http_cache
+import knowledge_base
+import metrics
+import model_registry
+from cache import LRUCache
 from datetime import datetime
 
-app = Flask(__name__)
-app.secret_key = "escapestress_secret_2025"
+# Routes live on a blueprint; create_app() (bottom of this file) builds the Flask app.
+bp = Blueprint('main', __name__)
 
 # ==========================================
 # 1️⃣ Ensure DB Exists
 # ==========================================
 DB_PATH = "stress_chat.db"
-if not os.path.exists(DB_PATH):
-    conn = get_conn()
-    try:
-        cur = conn.cursor()
-        cur.execute("CREATE TABLE IF NOT EXISTS chats (id INTEGER PRIMARY KEY, user TEXT, bot TEXT, label TEXT)")
-        conn.commit()
-    finally:
-        conn.close()
 
 
 def ensure_db_schema():
-    conn = get_conn()
-    try:
+    with connection() as conn:
         cur = conn.cursor()
+        cur.execute("CREATE TABLE IF NOT EXISTS chats (id INTEGER PRIMARY KEY, user TEXT, bot TEXT, label TEXT)")
+        conn.commit()
         try:
             cur.execute("PRAGMA table_info(chats)")
             cols = [r[1] for r in cur.fetchall()]
@@ -35,6 +42,10 @@ def ensure_db_schema():
         if 'label' not in cols:
             cur.execute("ALTER TABLE chats ADD COLUMN label TEXT")
             conn.commit()
+        if cols and 'created_at' not in cols:
+            # older databases predate created_at; new rows get it from the write path
+            cur.execute("ALTER TABLE chats ADD COLUMN created_at TEXT")
+            conn.commit()
         # Ensure journals, users, resources and actions tables exist (safe no-op if db_setup.py already created them)
         try:
             cur.execute("CREATE TABLE IF NOT EXISTS users (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT, email TEXT)")
@@ -45,254 +56,346 @@ def ensure_db_schema():
         except Exception:
             # Some DB backends may raise different errors — ignore here
             pass
-    finally:
-        conn.close()
+        db_setup.ensure_indexes(conn)
+        search.ensure_schema(conn)
+        rollups.ensure_schema(conn)
+        session_store.ensure_schema(conn)
+
 
-ensure_db_schema()
+_schema_ready = False
+_schema_lock = threading.Lock()
+
+
+def init_db():
+    """Run the schema migration once per process (first request, `flask init-db` or gunicorn's master)."""
+    global _schema_ready
+    if _schema_ready:
+        return
+    with _schema_lock:
+        if not _schema_ready:
+            ensure_db_schema()
+            _schema_ready = True
 
 # ==========================================
 # 2️⃣ Load ML Model
 # ==========================================
-MODEL_PATH = os.path.join("model", "emotion_model.pkl")
-if not os.path.exists(MODEL_PATH):
-    raise FileNotFoundError(f"Model not found at {MODEL_PATH}. Run train_model.py first.")
+# versioned models, the ACTIVE pointer and hot reload live in model_registry.py
+
+
+def load_model():
+    """Return the active classifier (anything with classify(texts)), loading it on first use.
+
+    The model is an engine.Engine over an exported, memory-mapped artifact (or the legacy pickle).
+    Loading is deferred until a message needs classifying; under `gunicorn --preload` (see
+    gunicorn.conf.py) it runs once in the master and the forked workers share the loaded model.
+    Later versions are swapped in by model_registry's watcher without a restart.
+    """
+    return model_registry.current().model
+
+
+def classify_messages(texts):
+    return load_model().classify(texts)
+
+
+# concurrent /get requests are classified together in one transform + predict_proba
+batcher = inference.MicroBatcher(classify_messages)
+
+
+def classify_one_by_one(texts):
+    return [batcher.submit(t) for t in texts]
+
+
+# (text_match, prediction) per normalized message; prediction is None for out-of-scope text.
+# The reply text is not cached — dynamic_reply still runs per request.
+classification_cache = LRUCache(
+    maxsize=int(os.environ.get('INFERENCE_CACHE_SIZE', '2048')),
+    ttl=float(os.environ.get('INFERENCE_CACHE_TTL', '600')),
+)
+_cached_model = None
+
+
+def normalize_message(text):
+    # the vectorizer lowercases and tokenizes on words, so case and spacing never change the prediction
+    return ' '.join(text.lower().split())
+
+
+def _invalidate_if_model_changed():
+    # cached predictions belong to the model that made them; drop them when another one is swapped in
+    global _cached_model
+    loaded = model_registry.loaded()
+    if loaded is not _cached_model:
+        # nothing was loaded before: the entries so far came from the model that classifying them loaded
+        if _cached_model is not None:
+            classification_cache.invalidate()
+        _cached_model = loaded
+
+
+def cached_lookups(keys):
+    """Split normalized keys into ({key: cached (text_match, prediction)}, {key: text_match} of the misses)."""
+    _invalidate_if_model_changed()
+    results, todo = {}, {}
+    with metrics.span('match'):
+        for key in dict.fromkeys(keys):
+            hit = classification_cache.get(key)
+            if hit is not None:
+                results[key] = hit
+            else:
+                todo[key] = matcher.match(key)
+    return results, todo
+
+
+def store_lookups(results, todo, predictions):
+    """Add the misses of cached_lookups() to `results` and the cache, given {key: prediction}."""
+    for key, tm in todo.items():
+        results[key] = (tm, predictions.get(key))
+        classification_cache.put(key, results[key])
+
+
+def classify_misses(results, todo, classify=classify_messages):
+    """Classify the in-scope misses of cached_lookups() in one call and store them (store_lookups())."""
+    in_scope = [key for key, tm in todo.items() if tm.in_scope]
+    with metrics.span('classify'):
+        predictions = dict(zip(in_scope, classify(in_scope))) if in_scope else {}
+    store_lookups(results, todo, predictions)
+
 
-vectorizer, model = pickle.load(open(MODEL_PATH, "rb"))
+def text_match_of(key, results, todo):
+    """The matcher result for `key` from cached_lookups(), hit or miss."""
+    return results[key][0] if key in results else todo[key]
 
 # ==========================================
 # 3️⃣ Knowledge Base Loader
 # ==========================================
-KB_PATH = os.path.join(os.path.dirname(__file__), 'knowledge.json')
-if os.path.exists(KB_PATH):
-    with open(KB_PATH, 'r', encoding='utf-8') as f:
-        kb = json.load(f)
-else:
-    kb = []
+# knowledge_base reloads knowledge.json only when its mtime changes
+KB_PATH = knowledge_base.KB_PATH
 
 # ==========================================
 # 4️⃣ Stress Type & Intent Detection
 # ==========================================
+# keyword tables and the single-pass matcher live in matcher.py
 def detect_stress_type(text):
-    t = text.lower()
-    mapping = [
-        ("Anxiety", ["anxious", "panic", "worry", "nervous"]),
-        ("Depression", ["hopeless", "sad", "empty", "alone"]),
-        ("Work/Academic", ["work", "exam", "study", "deadline", "project", "college"]),
-        ("Burnout", ["tired", "exhaust", "overwhelm"]),
-        ("Relationship", ["partner", "friend", "breakup", "love"]),
-    ]
-    for label, kws in mapping:
-        if any(kw in t for kw in kws):
-            return label
-    return "General Stress"
+    return matcher.match(text).stress_type
 
 
 def detect_intent(text):
-    t = text.lower()
-    intents = {
-        'workload': ['work', 'exam', 'deadline', 'project', 'study', 'assignment'],
-        'sleep': ['sleep', 'tired', 'rest', 'insomnia'],
-        'panic': ['panic', 'hypervent', 'shortness of breath'],
-        'relationship': ['partner', 'relationship', 'friend', 'breakup'],
-        'suicidal': ['suicide', 'kill myself', 'worthless', 'end my life']
-    }
-    for intent, kws in intents.items():
-        if any(kw in t for kw in kws):
-            return intent
-    return 'general'
+    return matcher.match(text).intent
 
 
 def is_mental_health_query(text):
-    t = text.lower()
-    keywords = [
-        'stress', 'depress', 'anxious', 'tired', 'sad', 'panic', 'lonely',
-        'hopeless', 'burnout', 'overwhelm', 'fear', 'sleep', 'mental', 'worry'
-    ]
-    if any(kw in t for kw in keywords):
-        return True
-    if detect_intent(text) != 'general':
-        return True
-    if detect_stress_type(text) != 'General Stress':
-        return True
-    return False
+    return matcher.match(text).in_scope
 
 # ==========================================
 # 5️⃣ Random Dynamic Reply Generator
 # ==========================================
-def dynamic_reply(pred, stress_type, intent):
-    responses = {
-        "High Stress": [
-            "That sounds really intense 😞. You’ve been carrying a lot — maybe try a slow breathing exercise?",
-            "It’s okay to pause and breathe. You’re not alone in this 💙.",
-            "Sounds like too much pressure right now. Want to try a short mental reset?",
-            "That must be overwhelming. Take 3 slow breaths and give your body a moment to calm down.",
-            "I know it feels like too much. What’s the biggest thing stressing you right now?"
-        ],
-        "Medium Stress": [
-            "You’re under pressure, but still grounded. Let’s slow things down a bit.",
-            "Seems like you’re holding up fine — want to try a relaxation tip?",
-            "You’ve got a lot going on. Try one small self-care action right now.",
-            "Your stress sounds manageable — still, a short walk could help clear your head.",
-            "You’re doing better than you think. Keep breathing through it."
-        ],
-        "Low Stress": [
-            "Good to hear you’re calm 🌿. Let’s keep that balance going.",
-            "That’s great — stay in this peaceful headspace as long as you can.",
-            "You sound centered and relaxed. Maybe enjoy a quick mindful moment.",
-            "You’re in control — that’s great energy to maintain.",
-            "Keep protecting this calm — it’s precious."
-        ],
-        "Work/Academic": [
-            "Deadlines can be rough. Try focusing on one task for 25 minutes — Pomodoro style.",
-            "Work pressure builds up — short breaks actually boost focus.",
-            "You sound mentally drained. Let’s reset — step away for 5 minutes.",
-            "Overthinking assignments burns energy. Focus on what’s achievable today.",
-            "You’re capable of handling this, just one thing at a time."
-        ],
-        "Relationship": [
-            "That’s emotionally heavy 💔. It’s okay to take time for yourself.",
-            "Relationships get messy — but your mental peace comes first.",
-            "Feeling disconnected hurts. Try writing what you wish you could say — it helps release pain.",
-            "You deserve understanding and comfort, not confusion.",
-            "Even loneliness passes — you’re stronger than you think."
-        ],
-        "Calm/Positive": [
-            "That’s wonderful 😌. Keep that relaxed energy flowing.",
-            "You seem in a good place. Maybe play some calm music to stay grounded.",
-            "Peace looks good on you — keep nurturing it.",
-            "Grateful moments like these are worth holding onto.",
-            "Nice! Keep enjoying this positive state today."
-        ],
-        "General Stress": [
-            "It’s okay to feel stressed. Let’s take a deep breath first.",
-            "We all have heavy days. What’s one thing you can let go of right now?",
-            "Let’s focus on small relief — breathing, stretching, music, or journaling?",
-            "Stress happens, but you don’t have to face it alone.",
-            "Want me to guide a quick relaxation technique?"
-        ]
-    }
-    msg = random.choice(responses.get(pred, responses["General Stress"]))
-    msg += random.choice(["", " Remember, small breaks help big stress.", " You’re doing your best — that’s enough."])
+REPLIES = {
+    "High Stress": [
+        "That sounds really intense 😞. You’ve been carrying a lot — maybe try a slow breathing exercise?",
+        "It’s okay to pause and breathe. You’re not alone in this 💙.",
+        "Sounds like too much pressure right now. Want to try a short mental reset?",
+        "That must be overwhelming. Take 3 slow breaths and give your body a moment to calm down.",
+        "I know it feels like too much. What’s the biggest thing stressing you right now?"
+    ],
+    "Medium Stress": [
+        "You’re under pressure, but still grounded. Let’s slow things down a bit.",
+        "Seems like you’re holding up fine — want to try a relaxation tip?",
+        "You’ve got a lot going on. Try one small self-care action right now.",
+        "Your stress sounds manageable — still, a short walk could help clear your head.",
+        "You’re doing better than you think. Keep breathing through it."
+    ],
+    "Low Stress": [
+        "Good to hear you’re calm 🌿. Let’s keep that balance going.",
+        "That’s great — stay in this peaceful headspace as long as you can.",
+        "You sound centered and relaxed. Maybe enjoy a quick mindful moment.",
+        "You’re in control — that’s great energy to maintain.",
+        "Keep protecting this calm — it’s precious."
+    ],
+    "Work/Academic": [
+        "Deadlines can be rough. Try focusing on one task for 25 minutes — Pomodoro style.",
+        "Work pressure builds up — short breaks actually boost focus.",
+        "You sound mentally drained. Let’s reset — step away for 5 minutes.",
+        "Overthinking assignments burns energy. Focus on what’s achievable today.",
+        "You’re capable of handling this, just one thing at a time."
+    ],
+    "Relationship": [
+        "That’s emotionally heavy 💔. It’s okay to take time for yourself.",
+        "Relationships get messy — but your mental peace comes first.",
+        "Feeling disconnected hurts. Try writing what you wish you could say — it helps release pain.",
+        "You deserve understanding and comfort, not confusion.",
+        "Even loneliness passes — you’re stronger than you think."
+    ],
+    "Calm/Positive": [
+        "That’s wonderful 😌. Keep that relaxed energy flowing.",
+        "You seem in a good place. Maybe play some calm music to stay grounded.",
+        "Peace looks good on you — keep nurturing it.",
+        "Grateful moments like these are worth holding onto.",
+        "Nice! Keep enjoying this positive state today."
+    ],
+    "General Stress": [
+        "It’s okay to feel stressed. Let’s take a deep breath first.",
+        "We all have heavy days. What’s one thing you can let go of right now?",
+        "Let’s focus on small relief — breathing, stretching, music, or journaling?",
+        "Stress happens, but you don’t have to face it alone.",
+        "Want me to guide a quick relaxation technique?"
+    ]
+}
+
+REPLY_ENDINGS = ["", " Remember, small breaks help big stress.", " You’re doing your best — that’s enough."]
+
+
+# labels of the current model (and of the older High/Medium/Low Stress models) by direction
+NEGATIVE_LABELS = {"Negative", "High Stress", "Medium Stress"}
+POSITIVE_LABELS = {"Positive", "Low Stress", "Calm/Positive"}
+
+CONTEXT_ENDINGS = {
+    "persisting": " This has been weighing on you for a few messages now — would talking to someone you trust help?",
+    "lifting": " It sounds a little lighter than earlier — that’s worth noticing.",
+}
+
+
+def context_ending(pred, history):
+    # history is the session's earlier turns, oldest first (see session_store.py)
+    negative = [label in NEGATIVE_LABELS for label, _, _ in history[-3:]]
+    if pred in NEGATIVE_LABELS and negative[-2:] == [True, True] and (len(negative) < 3 or not negative[0]):
+        # said once, on the third negative message in a row
+        return CONTEXT_ENDINGS["persisting"]
+    if pred in POSITIVE_LABELS and negative and negative[-1]:
+        return CONTEXT_ENDINGS["lifting"]
+    return None
+
+
+def dynamic_reply(pred, stress_type, intent, history=()):
+    msg = random.choice(REPLIES.get(pred, REPLIES["General Stress"]))
+    msg += context_ending(pred, history) or random.choice(REPLY_ENDINGS)
     return msg
 
 
+def contextual_stress_type(stress_type, history):
+    """A message without stress keywords ("still can't sleep well") continues the last specific topic."""
+    if stress_type != matcher.GENERAL_STRESS:
+        return stress_type
+    for _, kind, _ in reversed(history):
+        if kind and kind != matcher.GENERAL_STRESS:
+            return kind
+    return stress_type
+
+
 # ==========================================
-# 6️⃣ Main Chat Analysis
+# Tips, action plans and resources (built once at import)
 # ==========================================
-def analyze_emotion_structured(user_input):
-    X = vectorizer.transform([user_input])
-    pred = model.predict(X)[0]
+COPING_TIPS = {
+    'Anxiety': [
+        'Try a 4-4-4 breathing: inhale 4s, hold 4s, exhale 4s.',
+        'Grounding: name 5 things you see, 4 things you can touch.',
+        'If worry is future-focused, schedule a 10-minute "worry time" later.'
+    ],
+    'Depression': [
+        'Try behavioral activation: one small achievable task (e.g., 5-minute walk).',
+        'Connect with a supportive person or write one sentence about how you feel.'
+    ],
+    'Work/Academic': [
+        'Break tasks into 25-minute focus blocks (Pomodoro).',
+        'Prioritize 1–2 tasks for today and let others wait.'
+    ],
+    'Burnout': [
+        'Schedule a real rest: an afternoon without work tasks.',
+        'Say no to one request this week to protect energy.'
+    ],
+    'Relationship': [
+        'Try writing what you need to say before a conversation.',
+        'Set a small, specific boundary and observe what changes.'
+    ],
+    'General Stress': [
+        'Take three slow diaphragmatic breaths.',
+        'Step outside for 5 minutes and notice your surroundings.'
+    ]
+}
 
-    # confidence/probabilities if available
-    confidence = {}
-    try:
-        probs = model.predict_proba(X)[0]
-        classes = model.classes_
-        confidence = {str(c): float(p) for c, p in zip(classes, probs)}
-    except Exception:
-        confidence = {}
-
-    stress_type = detect_stress_type(user_input)
-    intent = detect_intent(user_input)
-    message = dynamic_reply(pred, stress_type, intent)
-
-    # generate tips and short action plan
-    def coping_tips_for(kind):
-        tips_map = {
-            'Anxiety': [
-                'Try a 4-4-4 breathing: inhale 4s, hold 4s, exhale 4s.',
-                'Grounding: name 5 things you see, 4 things you can touch.',
-                'If worry is future-focused, schedule a 10-minute "worry time" later.'
-            ],
-            'Depression': [
-                'Try behavioral activation: one small achievable task (e.g., 5-minute walk).',
-                'Connect with a supportive person or write one sentence about how you feel.'
-            ],
-            'Work/Academic': [
-                'Break tasks into 25-minute focus blocks (Pomodoro).',
-                'Prioritize 1–2 tasks for today and let others wait.'
-            ],
-            'Burnout': [
-                'Schedule a real rest: an afternoon without work tasks.',
-                'Say no to one request this week to protect energy.'
-            ],
-            'Relationship': [
-                'Try writing what you need to say before a conversation.',
-                'Set a small, specific boundary and observe what changes.'
-            ],
-            'General Stress': [
-                'Take three slow diaphragmatic breaths.',
-                'Step outside for 5 minutes and notice your surroundings.'
-            ]
-        }
-        return tips_map.get(kind, tips_map['General Stress'])
-
-    def generate_action_plan(kind, intent_text, user_text):
-        plan = []
-        if kind == 'Anxiety' or intent_text == 'panic':
-            plan = [
-                'Pause and do a 3-minute breathing exercise (4-4-4).',
-                'Ground: name 5 things you see, 4 you can touch, 3 you hear.',
-                'If it continues, consider contacting a trusted person or professional.'
-            ]
-        elif kind == 'Work/Academic' or intent_text == 'workload':
-            plan = [
-                'Identify the single most important task and work on it for 25 minutes.',
-                'Take a 10-minute break and move your body.',
-                'Re-evaluate deadlines and ask for help if needed.'
-            ]
-        else:
-            plan = [
-                'Take 3 slow diaphragmatic breaths to reset.',
-                'Write down the top worry in one sentence.',
-                'Choose one small action you can do in the next 30 minutes.'
-            ]
-        return plan
-
-    def get_resources_for(kind):
-        conn = get_conn()
-        try:
-            cur = conn.cursor()
-            try:
-                cur.execute("SELECT title, url, category FROM resources WHERE category=? OR category='general' ORDER BY id ASC LIMIT 5", (kind,))
-                rows = cur.fetchall()
-            except Exception:
-                # pymysql dict cursor or different param style
-                cur.execute("SELECT title, url, category FROM resources WHERE category=%s OR category='general' ORDER BY id ASC LIMIT 5", (kind,))
-                rows = cur.fetchall()
-        finally:
-            conn.close()
-        out = []
-        for r in rows:
-            if isinstance(r, dict):
-                out.append({"title": r.get('title'), "url": r.get('url'), "category": r.get('category')})
-            else:
-                out.append({"title": r[0], "url": r[1], "category": r[2]})
-        return out
 
-    tips = coping_tips_for(stress_type)
-    action_plan = generate_action_plan(stress_type, intent, user_input)
-    resources = get_resources_for(stress_type)
+def coping_tips_for(kind):
+    return COPING_TIPS.get(kind, COPING_TIPS['General Stress'])
 
-    # DB Logging
-    conn = get_conn()
-    try:
-        cur = conn.cursor()
-        try:
-            cur.execute("INSERT INTO chats (user, bot, label) VALUES (?, ?, ?)", (user_input, message, pred))
-            conn.commit()
-        except Exception:
-            cur.execute("INSERT INTO chats (user, bot, label) VALUES (%s, %s, %s)", (user_input, message, pred))
-            conn.commit()
-    finally:
-        conn.close()
+
+ACTION_PLANS = {
+    'calm_down': [
+        'Pause and do a 3-minute breathing exercise (4-4-4).',
+        'Ground: name 5 things you see, 4 you can touch, 3 you hear.',
+        'If it continues, consider contacting a trusted person or professional.'
+    ],
+    'workload': [
+        'Identify the single most important task and work on it for 25 minutes.',
+        'Take a 10-minute break and move your body.',
+        'Re-evaluate deadlines and ask for help if needed.'
+    ],
+    'default': [
+        'Take 3 slow diaphragmatic breaths to reset.',
+        'Write down the top worry in one sentence.',
+        'Choose one small action you can do in the next 30 minutes.'
+    ],
+}
+
+
+def generate_action_plan(kind, intent_text, user_text):
+    if kind == 'Anxiety' or intent_text == 'panic':
+        return ACTION_PLANS['calm_down']
+    if kind == 'Work/Academic' or intent_text == 'workload':
+        return ACTION_PLANS['workload']
+    return ACTION_PLANS['default']
+
+
+BREATHING_GUIDE = {'type': 'breathing', 'instruction': 'Try 4-4-4 breathing: inhale 4s, hold 4s, exhale 4s for 4 cycles.'}
+
+
+def resources_for(kind):
+    # read-through cache over the resources table (see resources.py)
+    return resources.for_category(kind)
+
+
+# ==========================================
+# 6️⃣ Main Chat Analysis
+# ==========================================
+def analyze_emotion_structured(user_input, prediction=None, text_match=None, sid=None):
+    # prediction is (label, confidence) when the caller already classified a whole batch;
+    # text_match is the matcher result the route computed for its scope check;
+    # sid is the session whose recent turns shape the reply (session_store.py)
+    if prediction is None:
+        with metrics.span('classify'):
+            prediction = batcher.submit(user_input)
+    pred, confidence = prediction
+
+    if text_match is None:
+        text_match = matcher.match(user_input)
+    with metrics.span('session'):
+        history = session_store.context(sid) if sid else []
+    stress_type, intent = contextual_stress_type(text_match.stress_type, history), text_match.intent
+    with metrics.span('reply'):
+        message = dynamic_reply(pred, stress_type, intent, history)
+        # generate tips and short action plan
+        tips = coping_tips_for(stress_type)
+        action_plan = generate_action_plan(stress_type, intent, user_input)
+
+    with metrics.span('resources'):
+        resources = resources_for(stress_type)
+
+    # knowledge base articles most similar to the message (TF-IDF retrieval, see knowledge_base.py)
+    with metrics.span('knowledge'):
+        articles = knowledge_base.related(user_input)
+
+    # DB Logging (queued; written in batches off the request path, with the /trends counters)
+    with metrics.span('db.enqueue'):
+        created_at = datetime.utcnow().isoformat()
+        writebehind.enqueue("INSERT INTO chats (user, bot, label, created_at) VALUES (?, ?, ?, ?)",
+                            (user_input, message, pred, created_at))
+        # the keyword stress type, as backfill() can recompute it from the message alone
+        rollups.record(created_at, pred, text_match.stress_type, intent)
+        if sid:
+            session_store.record(sid, history, pred, stress_type, intent)
 
     guide = None
     if stress_type == 'Anxiety' or intent == 'panic':
-        guide = {'type': 'breathing', 'instruction': 'Try 4-4-4 breathing: inhale 4s, hold 4s, exhale 4s for 4 cycles.'}
+        guide = BREATHING_GUIDE
 
     return {
-        "label": str(pred),
+        "label": pred,
         "message": message,
         "stress_type": stress_type,
         "intent": intent,
@@ -300,50 +403,153 @@ def analyze_emotion_structured(user_input):
         "tips": tips,
         "action_plan": action_plan,
         "resources": resources,
+        "articles": articles,
         "guide": guide
     }
 
+
+def degraded_analysis(user_input, text_match):
+    # the reply for a request shed by admission control: keyword matcher and static tables only,
+    # no model, no database, nothing logged
+    stress_type, intent = text_match.stress_type, text_match.intent
+    guide = BREATHING_GUIDE if stress_type == 'Anxiety' or intent == 'panic' else None
+    return {
+        "label": None,
+        "message": random.choice(REPLIES.get(stress_type, REPLIES["General Stress"])),
+        "stress_type": stress_type,
+        "intent": intent,
+        "confidence": None,
+        "tips": coping_tips_for(stress_type),
+        "action_plan": generate_action_plan(stress_type, intent, user_input),
+        "resources": resources.cached(stress_type) or [],
+        "articles": [],
+        "guide": guide,
+        "degraded": True
+    }
+
 # ==========================================
 # 7️⃣ Routes
 # ==========================================
-@app.route("/")
+OUT_OF_SCOPE = {
+    "label": "OutOfScope",
+    "message": "Let’s focus on how you’re feeling or what’s stressing you today 💬."
+}
+
+RATE_LIMITED = {"error": "Too many messages, please slow down"}
+
+
+@bp.route("/")
 def home():
     return render_template("index.html")
 
 
-@app.route("/get", methods=["POST"])
+@bp.route("/get", methods=["POST"])
 def chat():
     msg = request.form.get("msg", "").strip()
     if not msg:
         return jsonify({"error": "Empty message"}), 400
 
-    if not is_mental_health_query(msg):
-        return jsonify({
-            "label": "OutOfScope",
-            "message": "Let’s focus on how you’re feeling or what’s stressing you today 💬."
-        })
-
-    analysis = analyze_emotion_structured(msg)
+    # the cache (or one matcher scan on a miss) decides scope and crisis before admission
+    key = normalize_message(msg)
+    results, todo = cached_lookups([key])
+    text_match = text_match_of(key, results, todo)
+    if not text_match.in_scope:
+        store_lookups(results, todo, {})
+        return jsonify(OUT_OF_SCOPE)
+
+    with admission.slot(admission_clients(), crisis=admission.is_crisis(text_match)) as decision:
+        if decision.outcome == admission.RATE_LIMITED:
+            return rate_limited(decision)
+        if decision.outcome == admission.SHED:
+            return jsonify(degraded_analysis(msg, text_match))
+        classify_misses(results, todo, classify=classify_one_by_one)
+        text_match, prediction = results[key]
+        analysis = analyze_emotion_structured(msg, prediction=prediction, text_match=text_match,
+                                              sid=session_store.session_id(session))
     return jsonify(analysis)
 
 
-@app.route("/history")
+def admission_clients():
+    """Rate-limit keys of the current request (admission.clients())."""
+    address = admission.client_address(request.remote_addr, request.headers.get('X-Forwarded-For', ''))
+    return admission.clients(address, session.get('sid'))
+
+
+def rate_limited(decision):
+    resp = jsonify(RATE_LIMITED)
+    resp.status_code = 429
+    resp.headers['Retry-After'] = str(math.ceil(decision.retry_after))
+    return resp
+
+
+@bp.route("/get_batch", methods=["POST"])
+def chat_batch():
+    # {"messages": [...]}, a bare JSON list, or repeated msg form fields
+    payload = request.get_json(silent=True)
+    if payload is None:
+        msgs = request.form.getlist("msg")
+    else:
+        msgs = payload.get("messages") if isinstance(payload, dict) else payload
+    if not isinstance(msgs, list) or not msgs:
+        return jsonify({"error": "Expected a non-empty list of messages"}), 400
+    if len(msgs) > inference.MAX_BATCH:
+        return jsonify({"error": f"At most {inference.MAX_BATCH} messages per batch"}), 400
+    for i, m in enumerate(msgs):
+        if not isinstance(m, str):
+            return jsonify({"error": f"messages[{i}] must be a string"}), 400
+    msgs = [m.strip() for m in msgs]
+
+    keys = {m: normalize_message(m) for m in msgs if m}
+    results, todo = cached_lookups(keys.values())
+    matches = {key: text_match_of(key, results, todo) for key in keys.values()}
+    in_scope = [key for key, tm in matches.items() if tm.in_scope]
+    if not in_scope:
+        store_lookups(results, todo, {})
+        return jsonify([OUT_OF_SCOPE if m else {"error": "Empty message"} for m in msgs])
+
+    # the whole batch takes one admission slot and a token per in-scope message, repeats included
+    crisis = any(admission.is_crisis(tm) for tm in matches.values())
+    cost = sum(1 for m in msgs if m and matches[keys[m]].in_scope)
+    with admission.slot(admission_clients(), crisis=crisis, cost=cost) as decision:
+        if decision.outcome == admission.RATE_LIMITED:
+            return rate_limited(decision)
+        shed = decision.outcome == admission.SHED
+        if not shed:
+            # classify every uncached in-scope message in a single pass, then build the replies
+            classify_misses(results, todo)
+        out = []
+        for m in msgs:
+            if not m:
+                out.append({"error": "Empty message"})
+            elif not matches[keys[m]].in_scope:
+                out.append(OUT_OF_SCOPE)
+            elif shed:
+                out.append(degraded_analysis(m, matches[keys[m]]))
+            else:
+                text_match, prediction = results[keys[m]]
+                out.append(analyze_emotion_structured(m, prediction=prediction, text_match=text_match))
+    return jsonify(out)
+
+
+def paged_response(rows, next_cursor):
+    resp = jsonify(rows)
+    if next_cursor is not None:
+        # pass back as ?cursor=... to get the next (older) page
+        resp.headers['X-Next-Cursor'] = str(next_cursor)
+    return resp
+
+
+@bp.route("/history")
 def history():
-    conn = get_conn()
     try:
-        cur = conn.cursor()
-        cur.execute("SELECT user, bot, label FROM chats ORDER BY id DESC LIMIT 50")
-        rows = cur.fetchall()
-    finally:
-        conn.close()
-
-    data = []
-    for r in rows:
-        if isinstance(r, dict):
-            data.append({"user": r.get('user'), "bot": r.get('bot'), "label": r.get('label')})
-        else:
-            data.append({"user": r[0], "bot": r[1], "label": r[2]})
-    return jsonify(data)
+        page = pagination.parse_args(request.args, default_limit=50)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    filters = []
+    if request.args.get('label'):
+        filters.append(("label = ?", request.args['label']))
+    rows, next_cursor = pagination.fetch_page("chats", "id, user, bot, label, created_at", page, filters)
+    return paged_response(rows, next_cursor)
 
 
 # ------------------------------------------
@@ -351,121 +557,292 @@ def history():
 # ------------------------------------------
 
 
-@app.route('/resources_db')
+@bp.route('/resources_db')
 def resources_db():
-    conn = get_conn()
-    try:
-        cur = conn.cursor()
-        try:
-            cur.execute("SELECT id, title, url, category FROM resources ORDER BY id ASC")
-            rows = cur.fetchall()
-        except Exception:
-            cur.execute("SELECT id, title, url, category FROM resources ORDER BY id ASC")
-            rows = cur.fetchall()
-    finally:
-        conn.close()
-
-    out = []
-    for r in rows:
-        if isinstance(r, dict):
-            out.append({"id": r.get('id'), "title": r.get('title'), "url": r.get('url'), "category": r.get('category')})
-        else:
-            out.append({"id": r[0], "title": r[1], "url": r[2], "category": r[3]})
-    return jsonify(out)
+    return http_cache.respond(resources.all_payload(), max_age=300)
 
 
-@app.route('/breathing')
-def breathing():
-    steps = [
-        {"text": "Sit comfortably and place one hand on your belly."},
-        {"text": "Inhale slowly for 4 seconds, feeling your belly rise."},
-        {"text": "Hold gently for 4 seconds."},
-        {"text": "Exhale slowly for 6 seconds, feeling your belly fall."},
-        {"text": "Repeat this 4–6 times until you feel calmer."}
-    ]
-    return jsonify({"steps": steps})
+BREATHING_STEPS = [
+    {"text": "Sit comfortably and place one hand on your belly."},
+    {"text": "Inhale slowly for 4 seconds, feeling your belly rise."},
+    {"text": "Hold gently for 4 seconds."},
+    {"text": "Exhale slowly for 6 seconds, feeling your belly fall."},
+    {"text": "Repeat this 4–6 times until you feel calmer."}
+]
+BREATHING_PAYLOAD = http_cache.Payload({"steps": BREATHING_STEPS})
 
 
-@app.route('/journal', methods=['POST'])
+@bp.route('/breathing')
+def breathing():
+    return http_cache.respond(BREATHING_PAYLOAD, max_age=86400)
+
+
+BOOTSTRAP_JOURNALS = 10
+_bootstrap_static = (None, None)  # ((resources etag, knowledge etag), serialized static parts)
+_bootstrap = (None, None)  # (key, Payload)
+
+
+def bootstrap_payload():
+    """The /bootstrap Payload: resources, breathing steps, knowledge base and the recent journals.
+
+    The static parts are serialized once per change of resources or knowledge.json; a new journal
+    only appends a fresh "journals" list to that text. The Payload (and its compressed variants)
+    is reused until one of them changes.
+    """
+    global _bootstrap_static, _bootstrap
+    journals, _ = pagination.fetch_page("journals", "id, entry, created_at",
+                                        pagination.PageArgs(BOOTSTRAP_JOURNALS, None, None, None))
+    res, kb = resources.all_payload(), knowledge_base.payload()
+    static_key, static = _bootstrap_static
+    if static_key != (res.etag, kb.etag):
+        static_key = (res.etag, kb.etag)
+        static = http_cache.dumps({"breathing": BREATHING_STEPS, "knowledge": kb.data, "resources": res.data})
+        _bootstrap_static = (static_key, static)
+    key = (static_key, tuple(j['id'] for j in journals))
+    cached_key, payload = _bootstrap
+    if cached_key != key:
+        body = f'{static[:-1]},"journals":{http_cache.dumps(journals)}}}\n'.encode('utf-8')
+        data = {"breathing": BREATHING_STEPS, "journals": journals, "knowledge": kb.data, "resources": res.data}
+        payload = http_cache.Payload(data, body=body)
+        _bootstrap = (key, payload)
+    return payload
+
+
+@bp.route('/bootstrap')
+def bootstrap():
+    # one round trip for every panel the page renders on load; revalidated with the ETag each time
+    # because the journals in it change
+    # journal entries are user content: revalidated by the browser, never kept by a shared cache
+    return http_cache.respond(bootstrap_payload(), max_age=0, private=True)
+
+
+@bp.route('/journal', methods=['POST'])
 def save_journal():
-    entry = request.form.get('entry') or (request.get_json(silent=True) or {}).get('entry')
+    payload = request.get_json(silent=True)
+    if payload is not None and not isinstance(payload, dict):
+        return jsonify({"error": "Expected a JSON object"}), 400
+    entry = request.form.get('entry') or (payload or {}).get('entry')
     if not entry:
         return jsonify({"error": "Empty entry"}), 400
     created_at = datetime.utcnow().isoformat()
-    conn = get_conn()
-    try:
-        cur = conn.cursor()
-        try:
-            cur.execute("INSERT INTO journals (entry, created_at) VALUES (?, ?)", (entry, created_at))
-            conn.commit()
-        except Exception:
-            cur.execute("INSERT INTO journals (entry, created_at) VALUES (%s, %s)", (entry, created_at))
-            conn.commit()
-    finally:
-        conn.close()
+    writebehind.enqueue("INSERT INTO journals (entry, created_at) VALUES (?, ?)", (entry, created_at))
     return jsonify({"status": "ok", "created_at": created_at})
 
 
-@app.route('/journal/recent')
+@bp.route('/journal/recent')
 def journal_recent():
-    conn = get_conn()
     try:
-        cur = conn.cursor()
-        cur.execute("SELECT entry, created_at FROM journals ORDER BY id DESC LIMIT 10")
-        rows = cur.fetchall()
-    finally:
-        conn.close()
-    out = []
-    for r in rows:
-        if isinstance(r, dict):
-            out.append({"entry": r.get('entry'), "created_at": r.get('created_at')})
-        else:
-            out.append({"entry": r[0], "created_at": r[1]})
-    return jsonify(out)
+        page = pagination.parse_args(request.args, default_limit=10)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    rows, next_cursor = pagination.fetch_page("journals", "id, entry, created_at", page)
+    return paged_response(rows, next_cursor)
+
+
+@bp.route('/trends')
+def trends():
+    """Chat counts per day/hour by label, stress_type or intent, from the chat_rollups table.
+
+    ?granularity=day|hour&by=label|stress_type|intent&buckets=N, ending with the bucket of ?until=
+    (ISO time, default now).
+    """
+    granularity = request.args.get('granularity', 'day')
+    dimension = request.args.get('by', 'label')
+    if granularity not in rollups.GRANULARITIES or dimension not in rollups.DIMENSIONS:
+        return jsonify({"error": f"granularity must be one of {sorted(rollups.GRANULARITIES)} "
+                                 f"and by one of {list(rollups.DIMENSIONS)}"}), 400
+    until = request.args.get('until') or None
+    try:
+        buckets = int(request.args.get('buckets', 30 if granularity == 'day' else 48))
+    except ValueError:
+        buckets = 0
+    if not 1 <= buckets <= rollups.MAX_BUCKETS:
+        return jsonify({"error": f"buckets must be an integer between 1 and {rollups.MAX_BUCKETS}"}), 400
+    try:
+        since = rollups.window_start(granularity, buckets, until)
+    except ValueError:
+        return jsonify({"error": "until must be an ISO-8601 date or time"}), 400
+    except OverflowError:
+        return jsonify({"error": "until is too early for that many buckets"}), 400
+    data = rollups.trends(granularity, dimension, since, until)
+    data.update({"granularity": granularity, "by": dimension, "since": since})
+    return jsonify(data)
 
 
-@app.route('/user', methods=['POST'])
+@bp.route('/search')
+def search_history():
+    """Ranked full-text search: ?q=...&in=journals|chats, paged with limit/cursor like /history."""
+    scope = request.args.get('in', 'journals')
+    if scope not in search.SCOPES:
+        return jsonify({"error": f"in must be one of {sorted(search.SCOPES)}"}), 400
+    if not search.terms(request.args.get('q')):
+        return jsonify({"error": "Empty query"}), 400
+    try:
+        limit = int(request.args.get('limit', 20))
+        offset = int(request.args['cursor']) if request.args.get('cursor') else 0
+    except ValueError:
+        return jsonify({"error": "limit and cursor must be integers"}), 400
+    if not 1 <= limit <= search.MAX_LIMIT or offset < 0:
+        return jsonify({"error": f"limit must be between 1 and {search.MAX_LIMIT}"}), 400
+    try:
+        since, until = pagination.parse_time(request.args, 'since'), pagination.parse_time(request.args, 'until')
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    rows, next_cursor, truncated = search.search(scope, request.args['q'], limit, offset, since, until)
+    resp = paged_response(rows, next_cursor)
+    if truncated:
+        # only the newest search.RANK_WINDOW matches are ranked; older ones need a narrower query or an earlier until
+        resp.headers['X-Search-Truncated'] = str(search.RANK_WINDOW)
+    return resp
+
+
+@bp.route('/user', methods=['POST'])
 def create_user():
     name = request.form.get('name') or ''
     email = request.form.get('email') or ''
-    conn = get_conn()
-    try:
-        cur = conn.cursor()
-        try:
-            cur.execute("INSERT INTO users (name, email) VALUES (?, ?)", (name, email))
-            conn.commit()
-        except Exception:
-            cur.execute("INSERT INTO users (name, email) VALUES (%s, %s)", (name, email))
-            conn.commit()
-    finally:
-        conn.close()
+    query.execute("INSERT INTO users (name, email) VALUES (?, ?)", (name, email))
     return jsonify({"name": name, "email": email})
 
 
-@app.route('/knowledge')
+@bp.route('/knowledge')
 def knowledge():
-    return jsonify(kb)
+    return http_cache.respond(knowledge_base.payload(), max_age=300)
 
 
-@app.route('/log_action', methods=['POST'])
+@bp.route('/log_action', methods=['POST'])
 def log_action():
-    action_type = request.form.get('action_type') or request.json.get('action_type') if request.get_json(silent=True) else None
-    details = request.form.get('details') or request.json.get('details') if request.get_json(silent=True) else None
+    payload = request.get_json(silent=True)
+    if payload is None:
+        payload = {}
+    elif not isinstance(payload, dict):
+        return jsonify({"error": "Expected a JSON object"}), 400
+    action_type = request.form.get('action_type') or payload.get('action_type')
+    details = request.form.get('details') or payload.get('details')
     created_at = datetime.utcnow().isoformat()
-    conn = get_conn()
-    try:
-        cur = conn.cursor()
-        try:
-            cur.execute("INSERT INTO actions (action_type, details, created_at) VALUES (?, ?, ?)", (action_type, details, created_at))
-            conn.commit()
-        except Exception:
-            cur.execute("INSERT INTO actions (action_type, details, created_at) VALUES (%s, %s, %s)", (action_type, details, created_at))
-            conn.commit()
-    finally:
-        conn.close()
+    writebehind.enqueue("INSERT INTO actions (action_type, details, created_at) VALUES (?, ?, ?)", (action_type, details, created_at))
     return jsonify({"status": "logged"})
 
 
+MAX_ACTIONS = 100
+
+
+@bp.route('/log_actions', methods=['POST'])
+def log_actions():
+    # the page buffers UI events and sends them here in bulk (navigator.sendBeacon posts text/plain)
+    payload = request.get_json(force=True, silent=True)
+    actions = payload.get('actions') if isinstance(payload, dict) else payload
+    if not isinstance(actions, list) or not actions:
+        return jsonify({"error": "Expected a non-empty list of actions"}), 400
+    if len(actions) > MAX_ACTIONS:
+        return jsonify({"error": f"At most {MAX_ACTIONS} actions per request"}), 400
+    created_at = datetime.utcnow().isoformat()
+    rows = []
+    for i, action in enumerate(actions):
+        if not isinstance(action, dict) or not isinstance(action.get('action_type'), str) or not action['action_type']:
+            return jsonify({"error": f"actions[{i}]: action_type must be a non-empty string"}), 400
+        details = action.get('details')
+        if details is not None and not isinstance(details, str):
+            return jsonify({"error": f"actions[{i}]: details must be a string"}), 400
+        rows.append((action['action_type'], details, created_at))
+    # all or nothing: one invalid action rejects the request, the rest commit in one transaction
+    writebehind.enqueue_many("INSERT INTO actions (action_type, details, created_at) VALUES (?, ?, ?)", rows)
+    return jsonify({"status": "logged", "count": len(rows)})
+
+
+def admin_authorized():
+    # admin endpoints are disabled unless ADMIN_TOKEN is set
+    token = os.environ.get('ADMIN_TOKEN')
+    if not token:
+        return False
+    supplied = request.headers.get('X-Admin-Token', '')
+    auth = request.headers.get('Authorization', '')
+    if auth.startswith('Bearer '):
+        supplied = auth[len('Bearer '):]
+    return hmac.compare_digest(supplied.encode(), token.encode())
+
+
+@bp.route('/admin/model', methods=['GET', 'POST'])
+def admin_model():
+    """GET: active model version and load time. POST version=<v>: activate it (reload=1: reload as is)."""
+    if not admin_authorized():
+        return jsonify({"error": "Forbidden"}), 403
+    if request.method == 'POST':
+        payload = request.get_json(silent=True) or {}
+        version = request.form.get('version') or payload.get('version')
+        try:
+            if version:
+                model_registry.activate(version)
+            elif not (request.form.get('reload') or payload.get('reload')):
+                return jsonify({"error": "Expected a version to activate or reload=1"}), 400
+            # this worker switches now; the others follow on their next watcher poll
+            model_registry.reload(force=not version)
+        except (ValueError, FileNotFoundError) as e:
+            return jsonify({"error": str(e)}), 400
+    return jsonify(model_registry.info())
+
+
+@bp.route('/metrics')
+def metrics_endpoint():
+    """Prometheus text exposition of stage timings and pool/cache counters (needs METRICS=1)."""
+    if not metrics.ENABLED:
+        return jsonify({"error": "Metrics are disabled; set METRICS=1"}), 404
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
+def _register_collectors():
+    metrics.add_collector('db', db.pool_stats)
+    metrics.add_collector('writebehind', writebehind.stats)
+    metrics.add_collector('classification_cache', classification_cache.stats)
+    metrics.add_collector('resources_cache', resources.stats)
+    metrics.add_collector('batcher', lambda: {'batches': batcher.batches, 'items': batcher.items})
+    metrics.add_collector('model', model_registry.info)
+    metrics.add_collector('sessions', session_store.stats)
+    metrics.add_collector('admission', admission.stats)
+
+
+# ==========================================
+# 8️⃣ App Factory
+# ==========================================
+def create_app(preload_model=None):
+    """Build the Flask app. preload_model defaults to the PRELOAD_MODEL=1 environment variable."""
+    app = Flask(__name__)
+    app.secret_key = "escapestress_secret_2025"
+    app.register_blueprint(bp)
+    # schema migration happens on the first request instead of at import time
+    app.before_request(init_db)
+    metrics.init_app(app)
+
+    @app.cli.command('init-db')
+    def init_db_command():
+        """Create or migrate the database schema."""
+        init_db()
+        print("Database schema is up to date")
+
+    @app.cli.command('purge-sessions')
+    def purge_sessions_command():
+        """Delete sessions idle for longer than SESSION_TTL (SESSION_STORE=db)."""
+        init_db()
+        print(f"Deleted {session_store.purge()} expired sessions")
+
+    @app.cli.command('backfill-rollups')
+    def backfill_rollups_command():
+        """Rebuild the /trends counters from the chats table."""
+        init_db()
+        print(f"Wrote {rollups.backfill()} rollup rows")
+
+    # parse and index knowledge.json now rather than on the first chat
+    knowledge_base.items()
+    if preload_model is None:
+        preload_model = os.environ.get('PRELOAD_MODEL') == '1'
+    if preload_model:
+        load_model()
+    return app
+
+
+_register_collectors()
+app = create_app()
+
+
 if __name__ == "__main__":
     print("🚀 EscapeStress Chatbot starting...")
     app.run(debug=True, host="127.0.0.1", port=5000)
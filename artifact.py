@@ -0,0 +1,153 @@
+"""
+Exported model artifact: a pickle-free, memory-mappable replacement for emotion_model.pkl.
+
+An artifact is a directory:
+ - meta.json       format version, classes, probability mode and the vectorizer settings
+                   (token pattern, n-gram range, stop words, lowercase, norm, ...)
+ - terms.npy       vocabulary as a sorted fixed-width unicode array
+ - columns.npy     feature column of each entry in terms.npy
+ - idf.npy         IDF weight per feature column
+ - coef.npy        classifier weights, shape (n_classes or 1, n_features)
+ - intercept.npy   classifier intercepts
+
+Models trained on HashingVectorizer features (vectorizer kind 'hashing') have no terms, columns or
+idf: their n-grams are hashed to a column at scoring time.
+
+All arrays are loaded with np.load(mmap_mode='r', allow_pickle=False): nothing executes on load, and
+workers forked from (or started next to) each other share the same page-cache pages instead of each
+holding a Python dict of the vocabulary. load() returns an engine.Engine, which scores messages from
+these arrays with a binary search over terms.npy.
+
+Usage:
+    python artifact.py export model/emotion_model.pkl model/emotion_model
+"""
+import json
+import os
+import sys
+
+import numpy as np
+
+import engine
+
+FORMAT_VERSION = 1
+ARRAYS = ('terms', 'columns', 'idf', 'coef', 'intercept')
+
+
+# ==========================================
+# Export (needs scikit-learn)
+# ==========================================
+def _vectorizer_config(vectorizer):
+    if vectorizer.analyzer not in ('word', 'char', 'char_wb'):
+        raise ValueError("custom analyzers cannot be exported")
+    if vectorizer.tokenizer is not None or vectorizer.preprocessor is not None or callable(vectorizer.strip_accents):
+        raise ValueError("only the default tokenizer, preprocessor and accent stripping can be exported")
+    if vectorizer.input != 'content':
+        raise ValueError("only vectorizers that take the text itself (input='content') can be exported")
+    # stop words only apply to word n-grams
+    stop_words = vectorizer.get_stop_words() if vectorizer.analyzer == 'word' else None
+    config = {
+        'kind': 'hashing' if _is_hashing(vectorizer) else 'tfidf',
+        'analyzer': vectorizer.analyzer,
+        'dtype': np.dtype(vectorizer.dtype).name,
+        'lowercase': bool(vectorizer.lowercase),
+        'strip_accents': vectorizer.strip_accents,
+        'token_pattern': vectorizer.token_pattern,
+        'ngram_range': list(vectorizer.ngram_range),
+        'stop_words': sorted(stop_words) if stop_words else None,
+        'binary': bool(vectorizer.binary),
+        'norm': vectorizer.norm,
+    }
+    if config['kind'] == 'hashing':
+        config.update({'n_features': int(vectorizer.n_features), 'alternate_sign': bool(vectorizer.alternate_sign)})
+    else:
+        config.update({'use_idf': bool(vectorizer.use_idf), 'sublinear_tf': bool(vectorizer.sublinear_tf)})
+    return config
+
+
+def _is_hashing(vectorizer):
+    return type(vectorizer).__name__ == 'HashingVectorizer'
+
+
+def _proba_mode(model):
+    if not hasattr(model, 'predict_proba'):
+        # e.g. LinearSVC or a hinge-loss SGDClassifier: labels only
+        return 'none'
+    # binary models and multinomial logistic regression use a softmax over the decision values;
+    # one-vs-rest models (liblinear, SGDClassifier) normalise per-class sigmoids instead
+    if len(model.classes_) <= 2:
+        return 'softmax'
+    if type(model).__name__ == 'LogisticRegression' and getattr(model, 'solver', None) != 'liblinear' \
+            and getattr(model, 'multi_class', 'auto') != 'ovr':
+        return 'softmax'
+    return 'ovr'
+
+
+def to_arrays(vectorizer, model):
+    """(meta, arrays) for a fitted Tfidf/HashingVectorizer and linear classifier, as stored by export()."""
+    config = _vectorizer_config(vectorizer)
+    arrays = {
+        'coef': np.asarray(model.coef_, dtype=np.float64),
+        'intercept': np.asarray(model.intercept_, dtype=np.float64),
+    }
+    if config['kind'] == 'tfidf':
+        vocab = vectorizer.vocabulary_
+        terms = sorted(vocab)
+        idf = vectorizer.idf_ if config['use_idf'] else np.ones(len(vocab))
+        arrays.update({
+            'terms': np.array(terms, dtype=str),
+            'columns': np.array([vocab[t] for t in terms], dtype=np.int64),
+            'idf': np.asarray(idf, dtype=np.float64),
+        })
+    meta = {
+        'format_version': FORMAT_VERSION,
+        'classes': [str(c) for c in model.classes_],
+        'proba': _proba_mode(model),
+        'n_features': int(arrays['coef'].shape[1]),
+        'vectorizer': config,
+    }
+    return meta, arrays
+
+
+def export(vectorizer, model, path, extra_meta=None):
+    """Write `vectorizer` (a fitted Tfidf/HashingVectorizer) and `model` (a linear classifier) to `path`."""
+    meta, arrays = to_arrays(vectorizer, model)
+    meta.update(extra_meta or {})
+    os.makedirs(path, exist_ok=True)
+    for name, arr in arrays.items():
+        np.save(os.path.join(path, f'{name}.npy'), arr, allow_pickle=False)
+    # meta.json is written last: its presence marks the artifact as complete
+    with open(os.path.join(path, 'meta.json'), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, indent=2)
+    return path
+
+
+# ==========================================
+# Load (numpy only)
+# ==========================================
+def is_artifact(path):
+    return os.path.isfile(os.path.join(path, 'meta.json'))
+
+
+def load(path, mmap=True):
+    """Load an exported artifact as an engine.Engine. Arrays are memory-mapped unless mmap=False."""
+    with open(os.path.join(path, 'meta.json'), encoding='utf-8') as f:
+        meta = json.load(f)
+    if meta.get('format_version') != FORMAT_VERSION:
+        raise ValueError(f"unsupported artifact format {meta.get('format_version')!r} in {path}")
+    arrays = {name: np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r' if mmap else None, allow_pickle=False)
+              for name in ARRAYS if os.path.exists(os.path.join(path, f'{name}.npy'))}
+    return engine.Engine(meta, arrays, path=path)
+
+
+def _export_pickle(pkl_path, out_path):
+    import pickle
+    with open(pkl_path, 'rb') as f:
+        vectorizer, model = pickle.load(f)
+    export(vectorizer, model, out_path)
+    print(f"Exported {pkl_path} -> {out_path}")
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 4 or sys.argv[1] != 'export':
+        sys.exit("usage: python artifact.py export <model.pkl> <artifact_dir>")
+    _export_pickle(sys.argv[2], sys.argv[3])
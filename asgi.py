@@ -0,0 +1,280 @@
+"""
+ASGI entry point: `uvicorn asgi:app --workers 2` serves the same routes as `gunicorn app:app`.
+
+POST /get runs on the event loop: the cache lookup and keyword matcher are microseconds, and the
+classifier call is queued on app.batcher and awaited as a future (MicroBatcher.submit_future), so
+a chat waiting for inference holds no thread. Concurrent chats are classified together in one
+transform + predict_proba on the batcher thread, which also keeps the CPU-bound work to one batch
+at a time per worker. The rest of a reply (reply text, resources read-through, write-behind
+enqueue) runs on a bounded thread pool of ASGI_THREADS. Admission control (admission.py) applies
+as in the Flask route; a queued chat waits on the loop, not in a thread.
+
+Every other route (/history, /journal, /log_action, /search, static files...) is the Flask app
+itself, called through a small WSGI adapter on the same pool: its DB calls block a pool thread,
+never the event loop, and at most ASGI_THREADS of them run at once while further requests wait
+on the loop. Writes are already off the request path (writebehind.py), so no request waits for a
+commit. An async driver (aiosqlite, aiomysql) would run the same blocking sqlite3 / MySQL calls
+on a thread per connection, so the pool is used instead.
+
+The lifespan startup migrates the schema (as gunicorn.conf.py's on_starting does) and the
+shutdown flushes the write-behind queue. Request metrics (METRICS=1) include /get; Server-Timing
+headers are only added to the Flask routes.
+"""
+import asyncio
+import concurrent.futures
+import io
+import logging
+import math
+import os
+import sys
+import time
+import urllib.parse
+
+from werkzeug.http import dump_cookie, parse_cookie
+
+import admission
+import app as chat_app
+import metrics
+import session_store
+import writebehind
+
+log = logging.getLogger(__name__)
+
+THREADS = int(os.environ.get('ASGI_THREADS', '8'))
+
+_executor = None
+
+
+def _reset():
+    global _executor
+    _executor = None
+
+
+if hasattr(os, 'register_at_fork'):
+    # a forked worker (gunicorn -k uvicorn.workers.UvicornWorker --preload) starts its own pool
+    os.register_at_fork(after_in_child=_reset)
+
+
+async def _run(fn, *args):
+    """Run a blocking call on the bounded pool and await its result."""
+    global _executor
+    if _executor is None:
+        _executor = concurrent.futures.ThreadPoolExecutor(max_workers=THREADS, thread_name_prefix='asgi')
+    return await asyncio.get_running_loop().run_in_executor(_executor, fn, *args)
+
+
+# ==========================================
+# Request / response plumbing
+# ==========================================
+async def _read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            break
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body'):
+            break
+    return b''.join(chunks)
+
+
+def _header(scope, name):
+    for key, value in scope['headers']:
+        if key == name:
+            return value.decode('latin-1')
+    return ''
+
+
+async def _respond(send, status, headers, body):
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in headers]})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def _respond_json(send, status, obj, headers=()):
+    # the Flask app's JSON provider, so the body is byte-for-byte what jsonify() would return
+    body = chat_app.app.json.response(obj).get_data()
+    await _respond(send, status, [('content-type', 'application/json'), ('content-length', str(len(body)))]
+                   + list(headers), body)
+
+
+def _session(scope):
+    """Flask's signed session cookie of the request, as a dict ({} when missing or invalid)."""
+    flask_app = chat_app.app
+    value = parse_cookie(_header(scope, b'cookie')).get(flask_app.session_interface.get_cookie_name(flask_app))
+    if not value:
+        return {}
+    try:
+        serializer = flask_app.session_interface.get_signing_serializer(flask_app)
+        return dict(serializer.loads(value, max_age=int(flask_app.permanent_session_lifetime.total_seconds())))
+    except Exception:
+        return {}
+
+
+def _session_cookie(session):
+    """Set-Cookie header storing `session` the way Flask's session interface would."""
+    flask_app = chat_app.app
+    si = flask_app.session_interface
+    value = si.get_signing_serializer(flask_app).dumps(session)
+    # SESSION_COOKIE_* and PERMANENT_SESSION_LIFETIME apply as they do to the Flask routes
+    return ('set-cookie', dump_cookie(si.get_cookie_name(flask_app), value,
+                                      expires=si.get_expiration_time(flask_app, si.session_class(session)),
+                                      domain=si.get_cookie_domain(flask_app), path=si.get_cookie_path(flask_app),
+                                      secure=si.get_cookie_secure(flask_app),
+                                      httponly=si.get_cookie_httponly(flask_app),
+                                      samesite=si.get_cookie_samesite(flask_app),
+                                      partitioned=si.get_cookie_partitioned(flask_app)))
+
+
+# ==========================================
+# WSGI adapter for the Flask routes
+# ==========================================
+def _environ(scope, body):
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': scope['client'][0] if scope.get('client') else '',
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for key, value in scope['headers']:
+        name = key.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            name = 'HTTP_' + name
+            if name in environ:
+                value = environ[name] + ',' + value
+        environ[name] = value
+    environ.setdefault('CONTENT_LENGTH', str(len(body)))
+    return environ
+
+
+def _call_flask(environ):
+    started = []
+
+    def start_response(status, headers, exc_info=None):
+        started[:] = [int(status.split(' ', 1)[0]), headers]
+
+    result = chat_app.app(environ, start_response)
+    try:
+        body = b''.join(result)
+    finally:
+        if hasattr(result, 'close'):
+            result.close()
+    return started[0], started[1], body
+
+
+async def _flask(scope, body, send):
+    status, headers, body = await _run(_call_flask, _environ(scope, body))
+    await _respond(send, status, headers, body)
+
+
+# ==========================================
+# Native routes
+# ==========================================
+def _reply(msg, text_match, prediction, sid):
+    chat_app.init_db()
+    return chat_app.analyze_emotion_structured(msg, prediction=prediction, text_match=text_match, sid=sid)
+
+
+async def chat(scope, body, send):
+    """POST /get without a thread while the message waits for the classifier."""
+    if not _header(scope, b'content-type').startswith('application/x-www-form-urlencoded'):
+        # multipart and other bodies: let Flask's form parser handle them
+        return await _flask(scope, body, send)
+    form = urllib.parse.parse_qs(body.decode('utf-8', 'replace'), keep_blank_values=True)
+    msg = form.get('msg', [''])[0].strip()
+    if not msg:
+        return await _respond_json(send, 400, {"error": "Empty message"})
+
+    key = chat_app.normalize_message(msg)
+    results, todo = chat_app.cached_lookups([key])
+    text_match = chat_app.text_match_of(key, results, todo)
+    if not text_match.in_scope:
+        chat_app.store_lookups(results, todo, {})
+        return await _respond_json(send, 200, chat_app.OUT_OF_SCOPE)
+    session = _session(scope)
+    address = admission.client_address(scope['client'][0] if scope.get('client') else '',
+                                       _header(scope, b'x-forwarded-for'))
+    async with admission.slot_async(admission.clients(address, session.get('sid')),
+                                    crisis=admission.is_crisis(text_match)) as decision:
+        if decision.outcome == admission.RATE_LIMITED:
+            return await _respond_json(send, 429, chat_app.RATE_LIMITED,
+                                       [('retry-after', str(math.ceil(decision.retry_after)))])
+        if decision.outcome == admission.SHED:
+            return await _respond_json(send, 200, chat_app.degraded_analysis(msg, text_match))
+        if key in todo:
+            with metrics.span('classify'):
+                prediction = await asyncio.wrap_future(chat_app.batcher.submit_future(key))
+            chat_app.store_lookups(results, todo, {key: prediction})
+        text_match, prediction = results[key]
+        had_sid = 'sid' in session
+        sid = session_store.session_id(session)
+        reply = await _run(_reply, msg, text_match, prediction, sid)
+    headers = [] if had_sid else [_session_cookie(session)]
+    await _respond_json(send, 200, reply, headers)
+
+
+ROUTES = {
+    ('POST', '/get'): chat,
+}
+
+
+# ==========================================
+# Application
+# ==========================================
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            try:
+                await _run(chat_app.init_db)
+            except Exception as e:
+                await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+                return
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await _run(writebehind.flush)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await _lifespan(receive, send)
+    if scope['type'] != 'http':
+        return
+    body = await _read_body(receive)
+    handler = ROUTES.get((scope['method'], scope['path']))
+    if handler is None:
+        return await _flask(scope, body, send)
+    started = time.perf_counter()
+    response_started = False
+
+    async def tracked_send(message):
+        nonlocal response_started
+        if message['type'] == 'http.response.start':
+            response_started = True
+        await send(message)
+
+    try:
+        await handler(scope, body, tracked_send)
+    except Exception:
+        log.exception("%s %s failed", scope['method'], scope['path'])
+        # once the status line is out, a second http.response.start is a protocol error: the server
+        # drops the connection, which is all that is left to do
+        if not response_started:
+            await _respond(send, 500, [('content-type', 'text/plain')], b'Internal Server Error')
+    if metrics.ENABLED:
+        metrics.requests.labels(scope['path']).observe(time.perf_counter() - started)
@@ -0,0 +1,62 @@
+"""
+Classifier latency: scikit-learn vs the pure-numpy engine (engine.py).
+
+Paths compared, per message and for a batch of --batch messages:
+  sklearn-2pass   what /get used to do: vectorizer.transform + predict, then transform + predict_proba
+  sklearn-batch   inference.classify(): one transform + predict_proba
+  engine          engine.Engine from the exported artifact (memory-mapped arrays)
+
+Usage: python benchmarks/bench_engine.py [--number N] [--batch N]
+"""
+import argparse
+import os
+import pickle
+import sys
+import timeit
+import warnings
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+warnings.filterwarnings('ignore')
+
+import artifact  # noqa: E402
+import inference  # noqa: E402
+
+MESSAGES = [
+    'I feel anxious about exams', 'my partner and I had a fight last night', 'I cannot sleep',
+    'work deadlines keep piling up and I feel overwhelmed', 'I am calm today', 'feeling lonely',
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--number', type=int, default=2000)
+    parser.add_argument('--batch', type=int, default=64)
+    args = parser.parse_args()
+
+    with open(os.path.join(ROOT, 'model', 'emotion_model.pkl'), 'rb') as f:
+        vectorizer, model = pickle.load(f)
+    fast = artifact.load(os.path.join(ROOT, 'model', 'emotion_model'))
+    batch = (MESSAGES * (args.batch // len(MESSAGES) + 1))[:args.batch]
+
+    def two_pass(texts):
+        X = vectorizer.transform(texts)
+        labels = model.predict(X)
+        probs = model.predict_proba(vectorizer.transform(texts))
+        return labels, probs
+
+    paths = {
+        'sklearn-2pass': two_pass,
+        'sklearn-batch': lambda texts: inference.classify(vectorizer, model, texts),
+        'engine': fast.classify,
+    }
+    print(f"{'path':14} {'single us/msg':>14} {f'batch{args.batch} us/msg':>16}")
+    for name, fn in paths.items():
+        single = min(timeit.repeat(lambda: fn(MESSAGES[:1]), number=args.number, repeat=3)) / args.number
+        batched = min(timeit.repeat(lambda: fn(batch), number=max(1, args.number // args.batch),
+                                    repeat=3)) / max(1, args.number // args.batch) / len(batch)
+        print(f"{name:14} {single * 1e6:>14.1f} {batched * 1e6:>16.1f}")
+
+
+if __name__ == '__main__':
+    main()
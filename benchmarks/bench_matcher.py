@@ -0,0 +1,83 @@
+"""
+Microbenchmark: matcher.match() vs the previous per-detector keyword scans.
+
+The "before" path is what a /get request used to do: is_mental_health_query() (which itself
+called detect_intent() and detect_stress_type()) followed by detect_stress_type() and
+detect_intent() again, each lowercasing and scanning the message on its own.
+
+Usage: python benchmarks/bench_matcher.py [--number N]
+"""
+import argparse
+import json
+import os
+import sys
+import timeit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import matcher  # noqa: E402
+
+
+def legacy_stress_type(text):
+    t = text.lower()
+    for label, kws in matcher.STRESS_TYPES:
+        if any(kw in t for kw in kws):
+            return label
+    return matcher.GENERAL_STRESS
+
+
+def legacy_intent(text):
+    t = text.lower()
+    for intent, kws in matcher.INTENTS:
+        if any(kw in t for kw in kws):
+            return intent
+    return matcher.GENERAL_INTENT
+
+
+def legacy_in_scope(text):
+    t = text.lower()
+    if any(kw in t for kw in matcher.SCOPE_KEYWORDS):
+        return True
+    return legacy_intent(text) != matcher.GENERAL_INTENT or legacy_stress_type(text) != matcher.GENERAL_STRESS
+
+
+def legacy_request(text):
+    in_scope = legacy_in_scope(text)
+    return matcher.TextMatch(legacy_stress_type(text), legacy_intent(text), in_scope)
+
+
+def journal_samples():
+    """Journal-length texts built from knowledge.json articles, plus short chat messages."""
+    with open(os.path.join(ROOT, 'knowledge.json'), encoding='utf-8') as f:
+        kb = json.load(f)
+    long_texts = {}
+    for item in kb:
+        body = ' '.join([item['content'], item['how_it_comes'], item['how_it_goes']])
+        long_texts[f"journal:{item['title']}"] = body
+    filler = ' the day went by and i cooked dinner ' * 60
+    long_texts['journal:no keywords'] = filler
+    long_texts['journal:keyword at end'] = filler + ' and at night I could not sleep'
+    short = {
+        'chat:anxious': 'I feel anxious about exams',
+        'chat:out of scope': 'Tell me a joke about cats',
+        'chat:crisis': 'I feel worthless',
+    }
+    return {**short, **long_texts}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--number', type=int, default=2000, help='iterations per sample')
+    args = parser.parse_args()
+
+    print(f"{'sample':45} {'chars':>6} {'before us':>10} {'after us':>10} {'speedup':>8}")
+    for name, text in journal_samples().items():
+        assert legacy_request(text) == matcher.match(text), name
+        before = timeit.timeit(lambda: legacy_request(text), number=args.number) / args.number * 1e6
+        after = timeit.timeit(lambda: matcher.match(text), number=args.number) / args.number * 1e6
+        print(f"{name[:45]:45} {len(text):>6} {before:>10.2f} {after:>10.2f} {before / after:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+"""
+Model load time and per-worker memory: legacy pickle vs exported artifact (artifact.py).
+
+load:  a fresh interpreter loads the model and classifies one message (includes the imports each
+       format needs: scikit-learn for the pickle, numpy only for the artifact).
+fork:  a parent loads the model, forks --workers children (like gunicorn --preload), each child
+       classifies a few hundred messages and reports Rss / Pss / Private memory from
+       /proc/self/smaps_rollup (Linux only). Pss splits shared pages between the processes
+       sharing them, so it is the fair "cost per worker".
+
+Usage: python benchmarks/bench_model_load.py [--runs N] [--workers N]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PKL = os.path.join(ROOT, 'model', 'emotion_model.pkl')
+ARTIFACT = os.path.join(ROOT, 'model', 'emotion_model')
+
+LOADERS = {
+    'pickle': f"""
+import pickle, inference
+with open({PKL!r}, 'rb') as f:
+    model = inference.SklearnModel(*pickle.load(f))
+""",
+    'artifact': f"""
+import artifact
+model = artifact.load({ARTIFACT!r})
+""",
+}
+
+LOAD_PROBE = """
+import json, time, warnings
+warnings.filterwarnings('ignore')
+t0 = time.perf_counter()
+{loader}
+model.classify(['I feel anxious about exams'])
+print(json.dumps({{'load_ms': (time.perf_counter() - t0) * 1000}}))
+"""
+
+FORK_PROBE = """
+import json, os, warnings
+warnings.filterwarnings('ignore')
+{loader}
+MESSAGES = ['I feel anxious about exams', 'my partner and I had a fight', 'I cannot sleep', 'I am calm today'] * 50
+
+def smaps():
+    out = {{}}
+    with open('/proc/self/smaps_rollup') as f:
+        for line in f:
+            parts = line.split()
+            if parts[0].rstrip(':') in ('Rss', 'Pss', 'Private_Clean', 'Private_Dirty'):
+                out[parts[0].rstrip(':')] = int(parts[1])
+    return out
+
+children = []
+for _ in range({workers}):
+    r, w = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(r)
+        for _ in range(5):
+            model.classify(MESSAGES)
+        os.write(w, json.dumps(smaps()).encode())
+        os._exit(0)
+    os.close(w)
+    children.append((pid, r))
+reports = []
+for pid, r in children:
+    with os.fdopen(r) as f:
+        reports.append(json.loads(f.read()))
+    os.waitpid(pid, 0)
+print(json.dumps(reports))
+"""
+
+
+def run(code):
+    out = subprocess.run([sys.executable, '-c', code], cwd=ROOT, capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--workers', type=int, default=4)
+    args = parser.parse_args()
+
+    print(f"{'format':10} {'load ms':>9} {'worker Rss MB':>14} {'worker Pss MB':>14} {'worker private MB':>18}")
+    for name, loader in LOADERS.items():
+        load_ms = statistics.median(run(LOAD_PROBE.format(loader=loader))['load_ms'] for _ in range(args.runs))
+        mem = {}
+        if os.path.exists('/proc/self/smaps_rollup'):
+            reports = run(FORK_PROBE.format(loader=loader, workers=args.workers))
+            for key in ('Rss', 'Pss'):
+                mem[key] = statistics.mean(r[key] for r in reports) / 1024
+            mem['Private'] = statistics.mean(r['Private_Clean'] + r['Private_Dirty'] for r in reports) / 1024
+        print(f"{name:10} {load_ms:>9.1f} {mem.get('Rss', float('nan')):>14.1f} "
+              f"{mem.get('Pss', float('nan')):>14.1f} {mem.get('Private', float('nan')):>18.1f}")
+
+
+if __name__ == '__main__':
+    main()
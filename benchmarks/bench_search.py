@@ -0,0 +1,98 @@
+"""
+Search latency as the journals table grows: FTS5 (search.py) against the LIKE '%...%' scan it replaces.
+
+Builds a scratch database, grows `journals` to each --sizes step with synthetic entries (the FTS
+triggers index them on insert) and times the first page of /search-style queries for a word with no
+match, a rare word, a common word (in ~30% of entries) and a two-word query. Reports the median
+per query in milliseconds.
+
+Usage: python benchmarks/bench_search.py [--sizes 10000,100000,500000] [--repeat 20] [--json]
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+SCRATCH = tempfile.mkdtemp(prefix='bench-search-')
+# db.py reads SQLITE_PATH at import, so it must be set before the app modules are imported
+os.environ['SQLITE_PATH'] = os.path.join(SCRATCH, 'stress_chat.db')
+os.environ.pop('DATABASE_URL', None)
+os.environ.pop('USE_MYSQL', None)
+
+import db  # noqa: E402
+import search  # noqa: E402
+
+COMMON = "today felt stressed tired work exam sleep anxious calm better worse friends family".split()
+QUERIES = {'no match': 'unicorn', 'rare': 'panic', 'common': 'stressed', 'two words': 'exam sleep'}
+
+
+def entry(rng, filler):
+    words = rng.choices(COMMON, k=4) + rng.choices(filler, k=8)
+    if rng.random() < 0.001:
+        words.append('panic')
+    rng.shuffle(words)
+    return ' '.join(words)
+
+
+def grow(conn, rng, filler, n):
+    batch = [(entry(rng, filler), '2025-01-01T00:00:00') for _ in range(n)]
+    conn.executemany("INSERT INTO journals (entry, created_at) VALUES (?, ?)", batch)
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+    return round(statistics.median(samples), 3)
+
+
+def like_scan(text):
+    sql = ("SELECT id, entry, created_at FROM journals WHERE "
+           + ' AND '.join('entry LIKE ?' for _ in search.terms(text)) + " ORDER BY id DESC LIMIT ?")
+    with db.connection() as conn:
+        conn.execute(sql, [f"%{w}%" for w in search.terms(text)] + [21]).fetchall()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', default='10000,100000,500000')
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--json', action='store_true', help='print machine-readable results')
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    filler = [''.join(rng.choices('abcdefghijklmnopqrstuvwxyz', k=rng.randint(4, 9))) for _ in range(5000)]
+    with db.connection() as conn:
+        conn.execute("CREATE TABLE journals (id INTEGER PRIMARY KEY AUTOINCREMENT, entry TEXT, created_at TEXT)")
+        conn.execute("CREATE TABLE chats (id INTEGER PRIMARY KEY AUTOINCREMENT, user TEXT, bot TEXT, label TEXT, "
+                     "created_at TEXT)")
+        search.ensure_schema(conn)
+
+    results, rows = {}, 0
+    for size in (int(s) for s in args.sizes.split(',')):
+        with db.connection(write=True) as conn:
+            grow(conn, rng, filler, size - rows)
+        rows = size
+        results[size] = {}
+        for name, text in QUERIES.items():
+            results[size][f'fts {name}'] = timed(lambda: search.search('journals', text), args.repeat)
+            results[size][f'like {name}'] = timed(lambda: like_scan(text), args.repeat)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'median ms':18}" + ''.join(f"{size:>12}" for size in results))
+    for k in next(iter(results.values())):
+        print(f"{k:18}" + ''.join(f"{results[size][k]:>12}" for size in results))
+
+
+if __name__ == '__main__':
+    main()
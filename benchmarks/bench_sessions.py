@@ -0,0 +1,117 @@
+"""
+Memory and latency of the in-memory session store (session_store.MemoryStore) with many sessions.
+
+Fills a store with --sessions sessions, each holding a full window of turns, and reports the
+memory held per session (tracemalloc: window and cache entry; the session id strings exist
+beforehand and are not counted) for the packed bytes windows next to the same windows kept as lists of tuples, plus the median cost of a context()
+read and a record() write. A last run pushes twice --maxsize sessions through a store capped at
+--maxsize to show that eviction keeps its memory bounded.
+
+Usage: python benchmarks/bench_sessions.py [--sessions 10000,100000] [--maxsize 50000] [--json]
+"""
+import argparse
+import json
+import os
+import random
+import secrets
+import statistics
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import matcher  # noqa: E402
+import session_store  # noqa: E402
+
+LABELS = ['Negative', 'Positive']
+STRESS_TYPES = [name for name, _ in matcher.STRESS_TYPES] + [matcher.GENERAL_STRESS]
+INTENTS = [name for name, _ in matcher.INTENTS] + [matcher.GENERAL_INTENT]
+
+
+def turns(rng, n):
+    return [(rng.choice(LABELS), rng.choice(STRESS_TYPES), rng.choice(INTENTS)) for _ in range(n)]
+
+
+class TupleStore(session_store.MemoryStore):
+    """The same LRU store keeping windows as lists of tuples, for comparison."""
+
+    def load(self, sid):
+        return list(self.cache.get(sid, []))
+
+    def save(self, sid, window):
+        self.cache.put(sid, window[-self.window:])
+
+
+def fill(store, sids, rng):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    for sid in sids:
+        store.save(sid, turns(rng, store.window))
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return used
+
+
+def timed(fn, sids, repeat=20000):
+    samples = []
+    for sid in random.Random(1).choices(sids, k=repeat):
+        t0 = time.perf_counter()
+        fn(sid)
+        samples.append((time.perf_counter() - t0) * 1e6)
+    return round(statistics.median(samples), 2)
+
+
+def run(n, window):
+    rng = random.Random(0)
+    # session ids as session_id() makes them, created before measuring
+    sids = [secrets.token_urlsafe(12) for _ in range(n)]
+    out = {}
+    for name, cls in (('packed', session_store.MemoryStore), ('tuples', TupleStore)):
+        store = cls(maxsize=n, window=window)
+        out[f'{name} bytes/session'] = round(fill(store, sids, rng) / n, 1)
+        if name == 'packed':
+            out['context() us'] = timed(store.load, sids)
+            out['record() us'] = timed(lambda sid: store.save(sid, store.load(sid) + turns(rng, 1)), sids)
+    return out
+
+
+def run_capped(maxsize, window):
+    rng = random.Random(0)
+    store = session_store.MemoryStore(maxsize=maxsize, window=window)
+    sids = [secrets.token_urlsafe(12) for _ in range(2 * maxsize)]
+    tracemalloc.start()
+    half = None
+    for i, sid in enumerate(sids, 1):
+        store.save(sid, turns(rng, window))
+        if i == maxsize:
+            half = tracemalloc.get_traced_memory()[0]
+    full = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return {'sessions pushed': len(sids), 'held': len(store.cache), 'evictions': store.cache.stats().get('evictions', 0),
+            'MB at maxsize': round(half / 2 ** 20, 2), 'MB at 2x maxsize': round(full / 2 ** 20, 2)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sessions', default='10000,100000')
+    parser.add_argument('--window', type=int, default=session_store.WINDOW)
+    parser.add_argument('--maxsize', type=int, default=50000)
+    parser.add_argument('--json', action='store_true', help='print machine-readable results')
+    args = parser.parse_args()
+
+    results = {int(n): run(int(n), args.window) for n in args.sessions.split(',')}
+    capped = run_capped(args.maxsize, args.window)
+    if args.json:
+        print(json.dumps({'sessions': results, 'capped': capped}, indent=2))
+        return
+    print(f"window of {args.window} turns")
+    print(f"{'':22}" + ''.join(f"{n:>12}" for n in results))
+    for k in next(iter(results.values())):
+        print(f"{k:22}" + ''.join(f"{results[n][k]:>12}" for n in results))
+    print(f"\nmaxsize {args.maxsize}: " + ', '.join(f"{k} {v}" for k, v in capped.items()))
+
+
+if __name__ == '__main__':
+    main()
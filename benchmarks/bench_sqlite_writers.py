@@ -0,0 +1,109 @@
+"""
+Concurrent-writer benchmark for the SQLite profiles in db.py (SQLITE_PROFILE).
+
+Starts --writers processes (like gunicorn workers) that each commit INSERTs into `chats` through
+db.connection(write=True) for --seconds, plus --readers processes paging recent chats, all on a
+scratch copy of stress_chat.db. For each profile it reports committed write transactions per
+second, reads per second, "database is locked" failures and the time writers spent waiting for
+the write lock.
+
+Usage: python benchmarks/bench_sqlite_writers.py [--writers 4] [--readers 2] [--seconds 5]
+                                                  [--rows-per-txn 1] [--json]
+"""
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import db  # noqa: E402  (for the profile table only; the work happens in child processes)
+
+WORKER = r"""
+import json, sqlite3, sys, time
+import db
+
+role, start, seconds, rows_per_txn = sys.argv[1], float(sys.argv[2]), float(sys.argv[3]), int(sys.argv[4])
+done = errors = 0
+time.sleep(max(start - time.time(), 0))
+deadline = time.perf_counter() + seconds
+while time.perf_counter() < deadline:
+    try:
+        if role == 'writer':
+            with db.connection(write=True) as conn:
+                conn.executemany("INSERT INTO chats (user, bot, label, created_at) VALUES (?, ?, ?, ?)",
+                                 [("I feel stressed about work", "Take a breath.", "Negative",
+                                   "2025-01-01T00:00:00")] * rows_per_txn)
+        else:
+            with db.connection() as conn:
+                conn.execute("SELECT id, user, bot, label FROM chats ORDER BY id DESC LIMIT 20").fetchall()
+        done += 1
+    except sqlite3.OperationalError as e:
+        if 'locked' not in str(e):
+            raise
+        errors += 1
+stats = db.pool_stats()
+print(json.dumps({'done': done, 'errors': errors, 'lock_wait_seconds': stats.get('lock_wait_seconds', 0.0)}))
+"""
+
+
+def run_profile(profile, args):
+    with tempfile.TemporaryDirectory(prefix='sqlite-writers-') as scratch:
+        path = os.path.join(scratch, 'stress_chat.db')
+        shutil.copyfile(os.path.join(ROOT, 'stress_chat.db'), path)
+        env = dict(os.environ, SQLITE_PATH=path, SQLITE_PROFILE=profile, PYTHONWARNINGS='ignore')
+        env.pop('DATABASE_URL', None)
+        env.pop('USE_MYSQL', None)
+        subprocess.run([sys.executable, '-c', 'import app; app.init_db()'], cwd=ROOT, env=env, check=True)
+        # switch the journal mode once, before several processes open the file
+        conn = sqlite3.connect(path)
+        conn.execute(f"PRAGMA journal_mode={db.SQLITE_PROFILES[profile]['journal_mode']}")
+        conn.close()
+
+        start = time.time() + 1.0  # every process begins together once all are imported
+        procs = [(role, subprocess.Popen(
+            [sys.executable, '-c', WORKER, role, str(start), str(args.seconds), str(args.rows_per_txn)],
+            cwd=ROOT, env=env, stdout=subprocess.PIPE, text=True))
+            for role in ['writer'] * args.writers + ['reader'] * args.readers]
+        results = [(role, json.loads(p.communicate()[0].strip().splitlines()[-1])) for role, p in procs]
+
+    writes = [r for role, r in results if role == 'writer']
+    reads = [r for role, r in results if role == 'reader']
+    return {
+        'write_txn_per_s': round(sum(r['done'] for r in writes) / args.seconds, 1),
+        'rows_per_s': round(sum(r['done'] for r in writes) * args.rows_per_txn / args.seconds, 1),
+        'reads_per_s': round(sum(r['done'] for r in reads) / args.seconds, 1),
+        'locked_errors': sum(r['errors'] for _, r in results),
+        'lock_wait_s': round(sum(r['lock_wait_seconds'] for r in writes), 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--readers', type=int, default=2)
+    parser.add_argument('--seconds', type=float, default=5.0)
+    parser.add_argument('--rows-per-txn', type=int, default=1, help='rows per transaction (write-behind batches)')
+    parser.add_argument('--profiles', default='legacy,tuned')
+    parser.add_argument('--json', action='store_true', help='print machine-readable results')
+    args = parser.parse_args()
+
+    results = {profile: run_profile(profile, args) for profile in args.profiles.split(',')}
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    keys = list(next(iter(results.values())))
+    print(f"{args.writers} writers, {args.readers} readers, {args.seconds:g}s, {args.rows_per_txn} row(s)/txn")
+    print(f"{'metric':18}" + ''.join(f"{name:>12}" for name in results))
+    for k in keys:
+        print(f"{k:18}" + ''.join(f"{results[name][k]:>12}" for name in results))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""
+Cold-start benchmark: time to import app.py and latency of the first requests in a fresh process.
+
+Each run starts a new interpreter (nothing cached in memory), imports app, then times the first
+GET /breathing (no model, no DB write) and the first POST /get (loads the model unless it was
+preloaded). Results are the median over --runs processes.
+
+Usage: python benchmarks/bench_startup.py [--runs N] [--json]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = r"""
+import json, sys, time, warnings
+warnings.filterwarnings('ignore')
+t0 = time.perf_counter()
+import app
+t1 = time.perf_counter()
+client = app.app.test_client()
+client.get('/breathing')
+t2 = time.perf_counter()
+client.post('/get', data={'msg': 'I feel anxious about exams'})
+t3 = time.perf_counter()
+client.post('/get', data={'msg': 'work deadlines keep me up'})
+t4 = time.perf_counter()
+print(json.dumps({
+    'import_ms': (t1 - t0) * 1000,
+    'first_light_request_ms': (t2 - t1) * 1000,
+    'first_chat_ms': (t3 - t2) * 1000,
+    'second_chat_ms': (t4 - t3) * 1000,
+}))
+"""
+
+
+def run_once(env_extra):
+    env = dict(os.environ, **env_extra)
+    out = subprocess.run([sys.executable, '-c', PROBE], cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--json', action='store_true', help='print machine-readable results')
+    args = parser.parse_args()
+
+    results = {}
+    for name, env in [('lazy', {'PRELOAD_MODEL': '0'}), ('preload', {'PRELOAD_MODEL': '1'})]:
+        samples = [run_once(env) for _ in range(args.runs)]
+        results[name] = {k: round(statistics.median(s[k] for s in samples), 2)
+                         for k in samples[0] if isinstance(samples[0][k], float)}
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    keys = list(next(iter(results.values())))
+    print(f"{'metric (median ms)':28}" + ''.join(f"{name:>12}" for name in results))
+    for k in keys:
+        print(f"{k:28}" + ''.join(f"{results[name][k]:>12.1f}" for name in results))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,569 @@
+"""
+Load generator: replays realistic traffic mixes against the app and reports throughput and latency.
+
+Modes:
+  inproc  the app runs in a child process and is driven through app.test_client() from
+          --concurrency threads (no network: the app, the model and the database only)
+  asgi    like inproc, but through asgi.app (the ASGI entry point) on one event loop thread:
+          --concurrency client threads wait on it the way network connections would
+  http    requests go over HTTP keep-alive connections to --url, or to a local server started
+          with --spawn: gunicorn (gunicorn.conf.py with WEB_CONCURRENCY=--workers), or with
+          --server uvicorn, `uvicorn asgi:app` with --workers processes
+
+A mix is a weighted set of operations (chat, journal writes, log_action bursts, knowledge /
+resources fetches, history reads...); see MIXES. Spawned runs work on a scratch copy of
+stress_chat.db (SQLITE_PATH), so the real database is never written. --backend mysql uses
+DATABASE_URL / USE_MYSQL like the app does and is reported as skipped when MySQL is not usable.
+
+For each run it reports overall and per-endpoint throughput, p50/p95/p99 latency and errors, plus
+(inproc and asgi) the database's lock waits from db.pool_stats() — time waiting for the SQLite write
+lock, for a pooled MySQL connection, and InnoDB row-lock waits — and write-behind / cache
+counters, and how many chats admission control admitted or shed. --json saves everything with
+the git commit; --compare prints the change against a saved result, and --fail-on-regression
+exits 1 when a p95 grows or throughput drops by more than --threshold percent.
+
+Usage:
+    python benchmarks/loadgen.py --mix default --duration 10 --concurrency 8 --json before.json
+    python benchmarks/loadgen.py --backend sqlite,mysql --mix write
+    python benchmarks/loadgen.py --mode http --spawn --workers 2 --mix chat
+    python benchmarks/loadgen.py --mode http --spawn --server uvicorn --concurrency 256 --mix chat
+    python benchmarks/loadgen.py --compare before.json --json after.json
+"""
+import argparse
+import asyncio
+import http.client
+import json
+import os
+import platform
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+CHAT_MESSAGES = [
+    'I am feeling anxious and overwhelmed', 'Exams are making me panic every night',
+    'My partner and I had a fight', 'I can\'t sleep, my mind keeps racing', 'Work deadlines are crushing me',
+    'I feel lonely and ignored lately', 'How do I calm down before an interview?', 'I feel happy today',
+    'Tell me a joke about cats', 'What is the weather tomorrow?',
+]
+JOURNAL_ENTRIES = [
+    'Today was heavy but I went for a walk and it helped a little.',
+    'Slept badly again, too much on my mind about the exams.',
+    'Good day overall, talked to a friend and felt lighter.',
+]
+ACTIONS = ['breathing_start', 'breathing_complete', 'tip_clicked', 'resource_opened', 'music_play']
+
+
+# ==========================================
+# Operations: each returns the requests of one user action
+# ==========================================
+def op_chat(rnd):
+    msg = rnd.choice(CHAT_MESSAGES)
+    if rnd.random() < 0.3:
+        # a third of the messages are new text, so the classification cache misses
+        msg = f"{msg} {rnd.randrange(10 ** 6)}"
+    return [('/get', 'POST', '/get', {'msg': msg})]
+
+
+def op_journal(rnd):
+    return [('/journal', 'POST', '/journal', {'entry': rnd.choice(JOURNAL_ENTRIES)})]
+
+
+def op_journal_recent(rnd):
+    return [('/journal/recent', 'GET', '/journal/recent?limit=10', None)]
+
+
+def op_log_action_burst(rnd):
+    # the page buffers several UI events and sends them in one request (static/script.js)
+    actions = [{'action_type': rnd.choice(ACTIONS), 'details': f'step {i}'} for i in range(rnd.randint(3, 8))]
+    return [('/log_actions', 'POST', '/log_actions', JsonBody({'actions': actions}))]
+
+
+
+def op_knowledge(rnd):
+    return [('/knowledge', 'GET', '/knowledge', None)]
+
+
+def op_resources(rnd):
+    return [('/resources_db', 'GET', '/resources_db', None)]
+
+
+def op_bootstrap(rnd):
+    # page load: every panel's initial data in one request
+    return [('/bootstrap', 'GET', '/bootstrap', None)]
+
+
+def op_breathing(rnd):
+    return [('/breathing', 'GET', '/breathing', None)]
+
+
+def op_history(rnd):
+    path = '/history?limit=20' if rnd.random() < 0.8 else '/history?limit=20&label=Negative'
+    return [('/history', 'GET', path, None)]
+
+
+def op_trends(rnd):
+    path = '/trends' if rnd.random() < 0.7 else '/trends?granularity=hour&by=stress_type'
+    return [('/trends', 'GET', path, None)]
+
+
+def op_search(rnd):
+    q = rnd.choice(['exams', 'slept badly', 'friend', 'walk'])
+    return [('/search', 'GET', f"/search?q={q.replace(' ', '+')}&limit=10", None)]
+
+
+OPS = {
+    'chat': op_chat,
+    'journal': op_journal,
+    'journal_recent': op_journal_recent,
+    'log_action_burst': op_log_action_burst,
+    'knowledge': op_knowledge,
+    'resources': op_resources,
+    'breathing': op_breathing,
+    'bootstrap': op_bootstrap,
+    'history': op_history,
+    'search': op_search,
+    'trends': op_trends,
+}
+
+MIXES = {
+    'default': {'chat': 45, 'history': 10, 'journal': 8, 'journal_recent': 5, 'log_action_burst': 10,
+                'knowledge': 8, 'resources': 8, 'breathing': 6},
+    'chat': {'chat': 90, 'history': 10},
+    'write': {'chat': 20, 'journal': 40, 'log_action_burst': 40},
+    'read': {'knowledge': 20, 'resources': 25, 'breathing': 10, 'history': 20, 'journal_recent': 10, 'search': 10,
+             'trends': 5, 'bootstrap': 10},
+}
+
+
+# ==========================================
+# Clients
+# ==========================================
+class JsonBody:
+    """An operation's request body sent as JSON rather than as a form."""
+
+    def __init__(self, obj):
+        self.obj = obj
+
+
+def encode_body(form):
+    """(body bytes, content type) for an operation's form dict or JsonBody; (None, None) without a body."""
+    if form is None:
+        return None, None
+    if isinstance(form, JsonBody):
+        return json.dumps(form.obj).encode(), 'application/json'
+    return urllib.parse.urlencode(form).encode(), 'application/x-www-form-urlencoded'
+
+
+class InprocClient:
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, form):
+        body, content_type = encode_body(form)
+        resp = self.client.open(path, method=method, data=body, content_type=content_type)
+        resp.get_data()
+        return resp.status_code
+
+
+class AsgiClient:
+    """Sends each request through an ASGI app running on `loop` (in another thread)."""
+
+    def __init__(self, app, loop):
+        self.app = app
+        self.loop = loop
+
+    def request(self, method, path, form):
+        return asyncio.run_coroutine_threadsafe(self._request(method, path, form), self.loop).result()
+
+    async def _request(self, method, path, form):
+        path, _, query = path.partition('?')
+        body, content_type = encode_body(form)
+        body = body or b''
+        headers = [(b'host', b'loadgen'), (b'content-length', str(len(body)).encode())]
+        if content_type:
+            headers.append((b'content-type', content_type.encode()))
+        scope = {'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': method,
+                 'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': query.encode(),
+                 'root_path': '', 'headers': headers, 'client': ('127.0.0.1', 0), 'server': ('loadgen', 80)}
+        messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+        status = []
+
+        async def receive():
+            return messages.pop() if messages else {'type': 'http.disconnect'}
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                status.append(message['status'])
+
+        await self.app(scope, receive, send)
+        return status[0]
+
+
+def start_loop():
+    """An event loop running forever in a daemon thread (for AsgiClient)."""
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, name='asgi-loop', daemon=True).start()
+    return loop
+
+
+class HttpClient:
+    def __init__(self, url):
+        parsed = urllib.parse.urlparse(url)
+        self.host, self.port = parsed.hostname, parsed.port or 80
+        self.conn = None
+
+    def request(self, method, path, form):
+        body, content_type = encode_body(form)
+        headers = {'Content-Type': content_type} if content_type else {}
+        for attempt in (1, 2):
+            if self.conn is None:
+                self.conn = http.client.HTTPConnection(self.host, self.port, timeout=30)
+            try:
+                self.conn.request(method, path, body=body, headers=headers)
+                resp = self.conn.getresponse()
+                resp.read()
+                return resp.status
+            except (http.client.HTTPException, OSError):
+                # the server closed an idle keep-alive connection; reconnect once
+                self.conn.close()
+                self.conn = None
+                if attempt == 2:
+                    raise
+
+
+def replay_once(client, mix, seed=0):
+    """Run every operation of `mix` once; returns [(endpoint, status), ...] (used by run_checks.py)."""
+    rnd = random.Random(seed)
+    out = []
+    for name in MIXES[mix]:
+        for endpoint, method, path, form in OPS[name](rnd):
+            out.append((endpoint, client.request(method, path, form)))
+    return out
+
+
+# ==========================================
+# Load loop and statistics
+# ==========================================
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(round(q / 100 * (len(sorted_values) - 1))))]
+
+
+def summarize(latencies, errors, seconds):
+    values = sorted(latencies)
+    return {
+        'requests': len(values),
+        'errors': errors,
+        'throughput_rps': round(len(values) / seconds, 1) if seconds else None,
+        'mean_ms': round(sum(values) / len(values), 3) if values else None,
+        'p50_ms': _round(percentile(values, 50)),
+        'p95_ms': _round(percentile(values, 95)),
+        'p99_ms': _round(percentile(values, 99)),
+        'max_ms': _round(values[-1] if values else None),
+    }
+
+
+def _round(v):
+    return round(v, 3) if v is not None else None
+
+
+def run_load(make_client, mix, concurrency, duration, warmup, seed):
+    names = list(MIXES[mix])
+    weights = [MIXES[mix][n] for n in names]
+    per_thread = []
+    start = time.perf_counter()
+    measure_from = start + warmup
+    deadline = measure_from + duration
+
+    def worker(i):
+        client = make_client()
+        rnd = random.Random(seed * 1000 + i)
+        latencies, errors = {}, {}
+        per_thread.append((latencies, errors))
+        while True:
+            name = rnd.choices(names, weights)[0]
+            for endpoint, method, path, form in OPS[name](rnd):
+                t0 = time.perf_counter()
+                if t0 >= deadline:
+                    return
+                try:
+                    ok = client.request(method, path, form) < 400
+                except Exception:
+                    ok = False
+                t1 = time.perf_counter()
+                if t0 < measure_from:
+                    continue
+                if ok:
+                    latencies.setdefault(endpoint, []).append((t1 - t0) * 1000)
+                else:
+                    errors[endpoint] = errors.get(endpoint, 0) + 1
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    seconds = max(time.perf_counter() - measure_from, 1e-9)
+    merged, merged_errors = {}, {}
+    for latencies, errors in per_thread:
+        for endpoint, values in latencies.items():
+            merged.setdefault(endpoint, []).extend(values)
+        for endpoint, n in errors.items():
+            merged_errors[endpoint] = merged_errors.get(endpoint, 0) + n
+    endpoints = {e: summarize(merged.get(e, []), merged_errors.get(e, 0), seconds)
+                 for e in sorted(set(merged) | set(merged_errors))}
+    overall = summarize([v for vs in merged.values() for v in vs], sum(merged_errors.values()), seconds)
+    return {'seconds': round(seconds, 3), 'overall': overall, 'endpoints': endpoints}
+
+
+# ==========================================
+# In-process child: imports the app with the environment the parent prepared
+# ==========================================
+def _innodb_row_locks(query):
+    rows = query.fetch_all("SHOW GLOBAL STATUS LIKE 'Innodb_row_lock%'")
+    return {r.get('Variable_name'): float(r.get('Value')) for r in rows}
+
+
+def child_main(args):
+    import warnings
+    warnings.filterwarnings('ignore')
+    import admission
+    import app as app_module
+    import db
+    import query
+    import writebehind
+
+    backend = db.backend()
+    if backend != args.backend:
+        print(json.dumps({'skipped': f"{args.backend} is not usable here (active backend: {backend})"}))
+        return
+    app_module.init_db()
+    # load the model before measuring, as gunicorn --preload would
+    app_module.load_model()
+    row_locks = _innodb_row_locks(query) if backend == 'mysql' else None
+    if args.mode == 'asgi':
+        import asgi
+        loop = start_loop()
+        make_client = lambda: AsgiClient(asgi.app, loop)  # noqa: E731
+    else:
+        make_client = lambda: InprocClient(app_module.app)  # noqa: E731
+    result = run_load(make_client, args.mix, args.concurrency, args.duration, args.warmup, args.seed)
+    writebehind.flush()
+    stats = db.pool_stats()
+    result['db'] = stats
+    if row_locks is not None:
+        after = _innodb_row_locks(query)
+        result['db']['innodb_row_lock'] = {k: after.get(k, 0) - row_locks.get(k, 0) for k in after}
+    result['writebehind'] = writebehind.stats()
+    result['classification_cache'] = app_module.classification_cache.stats()
+    result['admission'] = admission.stats()
+    print(json.dumps(result))
+
+
+# ==========================================
+# Parent: prepares environments, spawns children / gunicorn, reports
+# ==========================================
+def _backend_env(backend, scratch):
+    env = dict(os.environ, PYTHONWARNINGS='ignore')
+    if backend == 'sqlite':
+        env.pop('USE_MYSQL', None)
+        env.pop('DATABASE_URL', None)
+        path = os.path.join(scratch, 'stress_chat.db')
+        shutil.copyfile(os.path.join(ROOT, 'stress_chat.db'), path)
+        env['SQLITE_PATH'] = path
+    else:
+        env['USE_MYSQL'] = '1'
+    return env
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _wait_ready(url, proc, timeout=30):
+    client = HttpClient(url)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError("the server exited during startup")
+        try:
+            if client.request('GET', '/breathing', None) == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"the server did not answer on {url} within {timeout}s")
+
+
+def run_backend(args, backend):
+    if backend == 'mysql' and not (os.environ.get('DATABASE_URL') or os.environ.get('MYSQL_URL')):
+        return {'skipped': 'set DATABASE_URL (and install PyMySQL) to benchmark MySQL'}
+    with tempfile.TemporaryDirectory(prefix='loadgen-') as scratch:
+        env = _backend_env(backend, scratch)
+        if args.mode in ('inproc', 'asgi'):
+            cmd = [sys.executable, os.path.abspath(__file__), '--child', '--mode', args.mode, '--backend', backend,
+                   '--mix', args.mix,
+                   '--concurrency', str(args.concurrency), '--duration', str(args.duration),
+                   '--warmup', str(args.warmup), '--seed', str(args.seed)]
+            out = subprocess.run(cmd, cwd=ROOT, env=env, capture_output=True, text=True)
+            if out.returncode != 0:
+                raise RuntimeError(f"load child failed:\n{out.stderr[-2000:]}")
+            return json.loads(out.stdout.strip().splitlines()[-1])
+        if not args.spawn:
+            return run_load(lambda: HttpClient(args.url), args.mix, args.concurrency,
+                            args.duration, args.warmup, args.seed)
+        port = _free_port()
+        url = f"http://127.0.0.1:{port}"
+        if args.server == 'uvicorn':
+            if shutil.which('uvicorn') is None:
+                return {'skipped': 'uvicorn is not installed (pip install uvicorn)'}
+            # each worker imports the app itself; load the model before it reports ready
+            env['PRELOAD_MODEL'] = '1'
+            cmd = ['uvicorn', '--host', '127.0.0.1', '--port', str(port), '--workers', str(args.workers),
+                   '--no-access-log', 'asgi:app']
+        else:
+            env['WEB_CONCURRENCY'] = str(args.workers)
+            cmd = ['gunicorn', '-c', 'gunicorn.conf.py', '-b', url[len('http://'):], 'app:app']
+        proc = subprocess.Popen(cmd, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            _wait_ready(url, proc)
+            return run_load(lambda: HttpClient(url), args.mix, args.concurrency,
+                            args.duration, args.warmup, args.seed)
+        finally:
+            proc.terminate()
+            proc.wait(timeout=30)
+
+
+def _git_commit():
+    try:
+        sha = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                             text=True, check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=ROOT,
+                               capture_output=True, text=True).stdout.strip()
+        return sha + ('-dirty' if dirty else '')
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_run(run):
+    mode = f"{run['mode']} ({run['server']})" if 'server' in run else run['mode']
+    print(f"\n== {run['backend']} / {mode} / mix={run['mix']}")
+    if 'skipped' in run:
+        print(f"   skipped: {run['skipped']}")
+        return
+    print(f"{'endpoint':16} {'requests':>9} {'rps':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    for name, s in list(run['endpoints'].items()) + [('ALL', run['overall'])]:
+        print(f"{name:16} {s['requests']:>9} {s['throughput_rps'] or 0:>8.1f} {s['p50_ms'] or 0:>8.2f} "
+              f"{s['p95_ms'] or 0:>8.2f} {s['p99_ms'] or 0:>8.2f} {s['errors']:>7}")
+    stats = run.get('db')
+    if stats:
+        waits = {k: (round(v, 4) if isinstance(v, float) else v) for k, v in stats.items()
+                 if 'wait' in k or k == 'innodb_row_lock'}
+        print(f"   db lock waits: {waits or 'none recorded'}")
+    if run.get('writebehind'):
+        wb = run['writebehind']
+        print(f"   write-behind: {wb.get('flushed', 0)} rows in {wb.get('batches', 0)} batches, "
+              f"{wb.get('errors', 0)} errors")
+    if run.get('admission'):
+        adm = run['admission']
+        print(f"   admission: {adm.get('admitted', 0)} admitted ({adm.get('queued', 0)} after queueing), "
+              f"{adm.get('shed', 0)} shed, {adm.get('rate_limited', 0)} rate limited")
+
+
+def compare(result, baseline, threshold):
+    """Print per-endpoint changes against `baseline`; return the list of regressions."""
+    base_runs = {(r['backend'], r['mode'], r['mix']): r for r in baseline['runs']}
+    regressions = []
+    print(f"\n== compared with {baseline['meta'].get('commit')} (threshold {threshold}%)")
+    for run in result['runs']:
+        base = base_runs.get((run['backend'], run['mode'], run['mix']))
+        if base is None or 'skipped' in run or 'skipped' in base:
+            print(f"{run['backend']}/{run['mode']}/{run['mix']}: no comparable baseline run")
+            continue
+        print(f"{run['backend']}/{run['mode']}/{run['mix']}")
+        rows = list(run['endpoints'].items()) + [('ALL', run['overall'])]
+        base_endpoints = dict(base['endpoints'], ALL=base['overall'])
+        for name, s in rows:
+            b = base_endpoints.get(name)
+            if not b or not b['p95_ms'] or not s['p95_ms']:
+                continue
+            p95 = (s['p95_ms'] / b['p95_ms'] - 1) * 100
+            rps = (s['throughput_rps'] / b['throughput_rps'] - 1) * 100 if b['throughput_rps'] else 0.0
+            flag = ''
+            if p95 > threshold or rps < -threshold:
+                flag = '  <-- regression'
+                regressions.append((run['backend'], run['mix'], name))
+            print(f"   {name:16} p95 {b['p95_ms']:8.2f} -> {s['p95_ms']:8.2f} ms ({p95:+6.1f}%)   "
+                  f"rps {b['throughput_rps']:8.1f} -> {s['throughput_rps']:8.1f} ({rps:+6.1f}%){flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--mode', choices=('inproc', 'asgi', 'http'), default='inproc')
+    parser.add_argument('--mix', choices=sorted(MIXES), default='default')
+    parser.add_argument('--backend', default='sqlite', help="comma-separated: sqlite, mysql")
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=10.0, help="measured seconds")
+    parser.add_argument('--warmup', type=float, default=2.0, help="seconds of unmeasured traffic first")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--url', default='http://127.0.0.1:8000', help="http mode target (without --spawn)")
+    parser.add_argument('--spawn', action='store_true', help="http mode: start a local gunicorn per backend")
+    parser.add_argument('--server', choices=('gunicorn', 'uvicorn'), default='gunicorn',
+                        help="what --spawn starts: gunicorn app:app or uvicorn asgi:app")
+    parser.add_argument('--workers', type=int, default=2, help="server workers for --spawn")
+    parser.add_argument('--json', metavar='PATH', help="save results here")
+    parser.add_argument('--compare', metavar='BASELINE', help="a saved result to compare against")
+    parser.add_argument('--threshold', type=float, default=20.0, help="regression threshold in percent")
+    parser.add_argument('--fail-on-regression', action='store_true')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child_main(args)
+        return
+
+    result = {
+        'meta': {
+            'commit': _git_commit(),
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'python': platform.python_version(),
+            'cpus': os.cpu_count(),
+            'args': {k: v for k, v in vars(args).items() if k not in ('child', 'json', 'compare')},
+        },
+        'runs': [],
+    }
+    for backend in [b.strip() for b in args.backend.split(',') if b.strip()]:
+        run = {'backend': backend, 'mode': args.mode, 'mix': args.mix}
+        if args.mode == 'http' and args.spawn:
+            # same key as a gunicorn run, so --compare sets uvicorn against a saved gunicorn baseline
+            run['server'] = args.server
+        run.update(run_backend(args, backend))
+        result['runs'].append(run)
+        print_run(run)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(result, f, indent=2)
+        print(f"\nSaved {args.json}")
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            regressions = compare(result, json.load(f), args.threshold)
+        if regressions and args.fail_on_regression:
+            sys.exit(f"{len(regressions)} regression(s): {regressions}")
+
+
+if __name__ == '__main__':
+    main()
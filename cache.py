@@ -0,0 +1,62 @@
+"""
+Small thread-safe LRU cache with optional TTL and hit/miss counters.
+
+Used for per-message classification results and other read-mostly lookups. Entries older than `ttl`
+seconds are treated as misses; when the cache is full the least recently used entry is evicted.
+"""
+import collections
+import threading
+import time
+
+_MISSING = object()
+
+
+class LRUCache:
+    def __init__(self, maxsize=1024, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = collections.OrderedDict()  # key -> (stored_at, value)
+        self._lock = threading.Lock()
+        self._stats = collections.Counter()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is _MISSING:
+                self._stats['misses'] += 1
+                return default
+            stored_at, value = item
+            if self.ttl is not None and time.monotonic() - stored_at > self.ttl:
+                del self._data[key]
+                self._stats['expirations'] += 1
+                self._stats['misses'] += 1
+                return default
+            self._data.move_to_end(key)
+            self._stats['hits'] += 1
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic(), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    def invalidate(self, key=_MISSING):
+        """Drop one key, or everything when called without arguments."""
+        with self._lock:
+            if key is _MISSING:
+                self._data.clear()
+                self._stats['invalidations'] += 1
+            else:
+                self._data.pop(key, None)
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        with self._lock:
+            out = dict(self._stats)
+            out.update({'size': len(self._data), 'maxsize': self.maxsize})
+        return out
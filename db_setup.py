@@ -3,10 +3,40 @@ import os
 
 DB_PATH = "stress_chat.db"
 
+# (name, table, sqlite columns, mysql columns) — MySQL needs prefix lengths on TEXT columns.
+# Keyset pagination (see pagination.py) walks (label, id) and probes (created_at, id).
+INDEXES = [
+    ("idx_chats_label_id", "chats", "label, id", "label(64), id"),
+    ("idx_chats_created_id", "chats", "created_at, id", "created_at(32), id"),
+    ("idx_journals_created_id", "journals", "created_at, id", "created_at(32), id"),
+]
+
+
+def ensure_indexes(conn):
+    """Create the pagination indexes if they don't exist yet."""
+    from db import backend
+    mysql = backend() == 'mysql'
+    cur = conn.cursor()
+    for name, table, sqlite_cols, mysql_cols in INDEXES:
+        try:
+            if mysql:
+                # MySQL has no CREATE INDEX IF NOT EXISTS; a duplicate-key error means it's already there
+                cur.execute(f"CREATE INDEX {name} ON {table} ({mysql_cols})")
+            else:
+                cur.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({sqlite_cols})")
+        except Exception:
+            pass
+    conn.commit()
+
 def ensure_db():
     created = not os.path.exists(DB_PATH)
     # Use db abstraction so we can optionally switch to MySQL via env var
     from db import get_conn
+    import query
+    import resources
+    import rollups
+    import search
+    import session_store
     conn = get_conn()
     cur = conn.cursor()
 
@@ -77,12 +107,14 @@ def ensure_db():
     ''')
 
     conn.commit()
+    ensure_indexes(conn)
+    search.ensure_schema(conn)
+    rollups.ensure_schema(conn)
+    session_store.ensure_schema(conn)
 
     # Seed resources if table empty
     try:
-        cur.execute('SELECT COUNT(1) FROM resources')
-        row = cur.fetchone()
-        count = row[0] if isinstance(row, (list, tuple)) else list(row.values())[0] if isinstance(row, dict) else 0
+        count = query.fetch_one('SELECT COUNT(1) AS n FROM resources', conn=conn)['n']
     except Exception:
         count = 0
     if count == 0:
@@ -94,13 +126,10 @@ def ensure_db():
             ("Suicide prevention (international)", "https://www.opencounseling.com/suicide-hotlines", "suicidal"),
             ("Calmful Spotify playlist", "https://open.spotify.com/playlist/37i9dQZF1DX3PIPIT6lEg5", "music")
         ]
-        # executemany param style differs between sqlite3 (?) and pymysql (%s)
-        try:
-            cur.executemany('INSERT INTO resources (title, url, category) VALUES (?, ?, ?)', seeds)
-        except Exception:
-            # try alternative param style for MySQL drivers
-            cur.executemany('INSERT INTO resources (title, url, category) VALUES (%s, %s, %s)', seeds)
+        # query rewrites the placeholders for the active backend (sqlite3 ? / pymysql %s)
+        query.executemany('INSERT INTO resources (title, url, category) VALUES (?, ?, ?)', seeds, conn=conn)
         conn.commit()
+        resources.invalidate()
 
     conn.close()
     if created:
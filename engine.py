@@ -0,0 +1,253 @@
+"""
+Pure-NumPy scorer for the emotion classifier: TF-IDF features + a linear model, no scikit-learn.
+
+At serve time the classifier only needs tokenization, a sparse dot product with the model weights
+and a sigmoid/softmax. Engine does exactly that for a whole batch at once: messages are tokenized
+in Python, every n-gram of the batch is mapped to its feature column with one binary search over
+the sorted vocabulary, and the per-message TF-IDF weighting, row normalization and dot products are
+np.bincount() passes over the flattened (row, column, weight) triples.
+
+Outputs match the fitted TfidfVectorizer + LogisticRegression / SGDClassifier / linear SVM they
+were taken from (the check_engine_parity() sweep in run_checks.py compares them against
+scikit-learn across analyzers, n-gram ranges, stop words, accents, tf/idf/norm settings and
+binary/multiclass models).
+
+Two feature spaces are supported: a fitted TF-IDF vocabulary ('tfidf') and the stateless hashing
+trick of HashingVectorizer ('hashing', used by the streaming trainer in train_stream.py), for which
+n-grams are hashed with murmurhash3_32 exactly as scikit-learn does.
+
+Build one from an exported artifact (artifact.load) or directly from a fitted sklearn pair
+(Engine.from_sklearn).
+"""
+import functools
+import re
+import struct
+import unicodedata
+from collections import Counter
+
+import numpy as np
+
+import metrics
+
+_WHITE_SPACES = re.compile(r"\s\s+")
+
+
+def _strip_accents(text, mode):
+    if mode == 'ascii':
+        return unicodedata.normalize('NFKD', text).encode('ascii', 'ignore').decode('ascii')
+    if mode == 'unicode':
+        return ''.join(c for c in unicodedata.normalize('NFKD', text) if not unicodedata.combining(c))
+    return text
+
+
+_BLOCKS = struct.Struct('<I')
+
+
+def murmurhash3_32(data, seed=0):
+    """Signed 32-bit MurmurHash3 (x86) of `data` (bytes), as sklearn.utils.murmurhash3_32."""
+    c1, c2, mask = 0xcc9e2d51, 0x1b873593, 0xffffffff
+    h = seed & mask
+    n_blocks = len(data) // 4
+    for (k,) in _BLOCKS.iter_unpack(data[:n_blocks * 4]):
+        k = (k * c1) & mask
+        k = ((k << 15) | (k >> 17)) & mask
+        h ^= (k * c2) & mask
+        h = ((h << 13) | (h >> 19)) & mask
+        h = (h * 5 + 0xe6546b64) & mask
+    tail = data[n_blocks * 4:]
+    if tail:
+        k = int.from_bytes(tail, 'little')
+        k = (k * c1) & mask
+        k = ((k << 15) | (k >> 17)) & mask
+        h ^= (k * c2) & mask
+    h ^= len(data)
+    h ^= h >> 16
+    h = (h * 0x85ebca6b) & mask
+    h ^= h >> 13
+    h = (h * 0xc2b2ae35) & mask
+    h ^= h >> 16
+    return h - 0x100000000 if h & 0x80000000 else h
+
+
+@functools.lru_cache(maxsize=65536)
+def _hash_gram(gram):
+    return murmurhash3_32(gram.encode('utf-8'))
+
+
+def _expit(x):
+    return 1.0 / (1.0 + np.exp(-x))
+
+
+class Engine:
+    """TF-IDF + linear classifier over plain numpy arrays (see artifact.py for their layout)."""
+
+    def __init__(self, meta, arrays, path=None):
+        self.meta = meta
+        self.path = path
+        self.classes_ = list(meta['classes'])
+        # a hashing model has no vocabulary or idf arrays
+        self.terms = arrays.get('terms')
+        self.columns = arrays.get('columns')
+        self.idf = arrays.get('idf')
+        self.coef = arrays['coef']
+        self.intercept = arrays['intercept']
+        config = meta['vectorizer']
+        self.config = config
+        self.kind = config.get('kind', 'tfidf')
+        self.analyzer = config.get('analyzer', 'word')
+        self.dtype = np.dtype(config.get('dtype', 'float64'))
+        self._token_re = re.compile(config['token_pattern'])
+        self._stop_words = frozenset(config['stop_words'] or ())
+        self._ngram_range = tuple(config['ngram_range'])
+
+    @classmethod
+    def from_sklearn(cls, vectorizer, model):
+        """Build from a fitted (vectorizer, linear classifier) pair, e.g. the legacy pickle."""
+        import artifact
+        meta, arrays = artifact.to_arrays(vectorizer, model)
+        return cls(meta, arrays)
+
+    # ------------------------------------------
+    # Tokenization
+    # ------------------------------------------
+    def _preprocess(self, text):
+        if self.config['lowercase']:
+            text = text.lower()
+        if self.config['strip_accents']:
+            text = _strip_accents(text, self.config['strip_accents'])
+        return text
+
+    def analyze(self, text):
+        """Tokens and n-grams of `text`, as the exported vectorizer would produce them."""
+        text = self._preprocess(text)
+        lo, hi = self._ngram_range
+        if self.analyzer == 'char':
+            text = _WHITE_SPACES.sub(' ', text)
+            return [text[i:i + n] for n in range(lo, hi + 1) for i in range(len(text) - n + 1)]
+        if self.analyzer == 'char_wb':
+            grams = []
+            for word in _WHITE_SPACES.sub(' ', text).split():
+                word = f' {word} '
+                for n in range(lo, hi + 1):
+                    if n >= len(word):
+                        # a word shorter than n is counted once, then no longer n-grams
+                        grams.append(word)
+                        break
+                    grams.extend(word[i:i + n] for i in range(len(word) - n + 1))
+            return grams
+        tokens = self._token_re.findall(text)
+        if self._stop_words:
+            tokens = [t for t in tokens if t not in self._stop_words]
+        grams = list(tokens) if lo == 1 else []
+        for n in range(max(lo, 2), hi + 1):
+            grams.extend(' '.join(tokens[i:i + n]) for i in range(len(tokens) - n + 1))
+        return grams
+
+    def _hash(self, grams):
+        """(feature column, sign) of each gram under the hashing trick."""
+        h = np.fromiter((_hash_gram(g) for g in grams), dtype=np.int64, count=len(grams))
+        n_features = self.config['n_features']
+        cols = np.abs(h) % n_features
+        # sklearn maps -2**31 as if abs() did not overflow
+        cols[h == -2 ** 31] = (2 ** 31 - 1 - (n_features - 1)) % n_features
+        signs = np.where(h >= 0, 1, -1) if self.config['alternate_sign'] else np.ones(len(grams), dtype=np.int64)
+        return cols, signs
+
+    def _lookup(self, grams):
+        """Feature column of each gram, or -1 when it is not in the vocabulary."""
+        grams = np.array(grams, dtype=str)
+        pos = np.searchsorted(self.terms, grams)
+        pos[pos == len(self.terms)] = 0
+        return np.where(self.terms[pos] == grams, self.columns[pos], -1)
+
+    # ------------------------------------------
+    # Batched scoring
+    # ------------------------------------------
+    def transform(self, texts):
+        """Feature rows of `texts` as (n, rows, cols, weights) with flattened arrays; a str is one message."""
+        if isinstance(texts, str):
+            texts = [texts]
+        grams, counts, lengths = [], [], []
+        for text in texts:
+            c = Counter(self.analyze(text))
+            grams.extend(c)
+            counts.extend(c.values())
+            lengths.append(len(c))
+        n = len(lengths)
+        if not grams:
+            return n, np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp), np.empty(0, dtype=self.dtype)
+        rows = np.repeat(np.arange(n), lengths)
+        config = self.config
+        if self.kind == 'hashing':
+            cols, signs = self._hash(grams)
+            # n-grams that hash to the same column add up, as in sklearn's FeatureHasher
+            keys, inverse = np.unique(rows * config['n_features'] + cols, return_inverse=True)
+            tf = np.bincount(inverse, weights=np.asarray(counts) * signs).astype(self.dtype)
+            rows, cols = keys // config['n_features'], keys % config['n_features']
+            weights = np.ones_like(tf) if config['binary'] else tf
+        else:
+            cols = self._lookup(grams)
+            known = cols >= 0
+            rows, cols = rows[known], cols[known]
+            tf = np.asarray(counts, dtype=self.dtype)[known]
+            if config['binary']:
+                tf = np.ones_like(tf)
+            if config['sublinear_tf']:
+                tf = np.log(tf) + 1
+            weights = tf * self.idf[cols].astype(self.dtype)
+        if config['norm'] in ('l1', 'l2'):
+            mass = np.abs(weights) if config['norm'] == 'l1' else weights * weights
+            norms = np.bincount(rows, weights=mass, minlength=n)
+            if config['norm'] == 'l2':
+                norms = np.sqrt(norms)
+            norms[norms == 0] = 1
+            weights = weights / norms[rows].astype(self.dtype)
+        return n, rows, cols, weights
+
+    def decision_function(self, texts):
+        """Raw scores, shape (n,) for binary models and (n, n_classes) otherwise."""
+        with metrics.span('model.transform'):
+            n, rows, cols, weights = self.transform(texts)
+        with metrics.span('model.score'):
+            return self._scores(n, rows, cols, weights)
+
+    def _scores(self, n, rows, cols, weights):
+        contrib = self.coef[:, cols] * weights
+        scores = np.empty((n, self.coef.shape[0]))
+        for k in range(self.coef.shape[0]):
+            scores[:, k] = np.bincount(rows, weights=contrib[k], minlength=n)
+        scores += self.intercept
+        return scores[:, 0] if scores.shape[1] == 1 else scores
+
+    def _proba(self, scores):
+        if scores.ndim == 1:
+            p = _expit(scores)
+            return np.column_stack([1.0 - p, p])
+        if self.meta['proba'] == 'ovr':
+            p = _expit(scores)
+            total = p.sum(axis=1, keepdims=True)
+            p[total[:, 0] == 0] = 1
+            return p / p.sum(axis=1, keepdims=True)
+        e = np.exp(scores - scores.max(axis=1, keepdims=True))
+        return e / e.sum(axis=1, keepdims=True)
+
+    def _labels(self, scores):
+        best = (scores > 0).astype(np.intp) if scores.ndim == 1 else scores.argmax(axis=1)
+        return [self.classes_[i] for i in best]
+
+    def predict_proba(self, texts):
+        if self.meta['proba'] == 'none':
+            raise AttributeError("this model has no probability estimates")
+        return self._proba(self.decision_function(texts))
+
+    def predict(self, texts):
+        return self._labels(self.decision_function(texts))
+
+    def classify(self, texts):
+        """[(label, {class: probability}), ...] — same shape as inference.classify()."""
+        scores = self.decision_function(texts)
+        if self.meta['proba'] == 'none':
+            return [(label, {}) for label in self._labels(scores)]
+        probs = self._proba(scores)
+        return [(self.classes_[best], {c: float(p) for c, p in zip(self.classes_, row)})
+                for row, best in zip(probs, probs.argmax(axis=1))]
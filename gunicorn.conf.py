@@ -0,0 +1,18 @@
+# gunicorn settings for `gunicorn -c gunicorn.conf.py app:app` (see Procfile).
+#
+# The app is imported once in the master (preload_app) with PRELOAD_MODEL=1, so the model is
+# unpickled before the fork and every worker shares those pages copy-on-write instead of loading
+# its own copy. DB pools, the write-behind thread and the inference batcher are recreated per worker.
+import os
+
+os.environ.setdefault('PRELOAD_MODEL', '1')
+
+preload_app = True
+workers = int(os.environ.get('WEB_CONCURRENCY', '2'))
+threads = int(os.environ.get('GUNICORN_THREADS', '4'))
+
+
+def on_starting(server):
+    # migrate the schema once here rather than in every worker's first request
+    import app
+    app.init_db()
@@ -0,0 +1,74 @@
+"""
+Pre-serialized JSON responses for endpoints whose data rarely changes.
+
+A Payload serializes its data once (the same way jsonify does), compresses it once with gzip and —
+if the optional `brotli` package is installed — brotli, and derives a strong ETag from the bytes.
+respond() then serves the best encoding the client accepts, sets ETag / Cache-Control /
+Vary, and answers a matching If-None-Match with 304 and no body.
+"""
+import gzip
+import hashlib
+import json
+
+from flask import Response, request
+
+try:
+    import brotli
+except ImportError:  # optional; gzip is always available
+    brotli = None
+
+# compressing tiny bodies costs more than it saves
+MIN_COMPRESS_SIZE = 512
+
+
+def dumps(data):
+    """JSON text as jsonify writes it: sorted keys, ASCII-escaped, compact."""
+    return json.dumps(data, sort_keys=True, separators=(',', ':'))
+
+
+class Payload:
+    def __init__(self, data, body=None):
+        # `body` lets a caller assemble the JSON from pre-serialized parts
+        self.data = data
+        self.body = body if body is not None else (dumps(data) + '\n').encode('utf-8')
+        self.etag = hashlib.sha256(self.body).hexdigest()[:32]
+        self.encoded = {}
+        if len(self.body) >= MIN_COMPRESS_SIZE:
+            self.encoded['gzip'] = gzip.compress(self.body, compresslevel=9, mtime=0)
+            if brotli is not None:
+                self.encoded['br'] = brotli.compress(self.body)
+
+    def variant_etag(self, encoding):
+        # each content-coding is a different representation, so it gets its own strong validator
+        return self.etag if encoding is None else f"{self.etag}-{encoding}"
+
+
+def _pick_encoding(payload):
+    accepted = request.accept_encodings
+    for encoding in ('br', 'gzip'):
+        if encoding in payload.encoded and accepted[encoding]:
+            return encoding
+    return None
+
+
+def respond(payload, max_age=60, private=False):
+    """Serve `payload` for the current request, honouring Accept-Encoding and If-None-Match.
+
+    private=True keeps shared caches (proxies, CDNs) from storing it, for user content.
+    """
+    encoding = _pick_encoding(payload)
+    etag = payload.variant_etag(encoding)
+    headers = {
+        'Cache-Control': f"{'private' if private else 'public'}, max-age={max_age}",
+        'Vary': 'Accept-Encoding',
+    }
+    if request.if_none_match.contains_weak(etag):
+        resp = Response(status=304, headers=headers)
+        resp.set_etag(etag)
+        return resp
+    body = payload.encoded[encoding] if encoding else payload.body
+    resp = Response(body, mimetype='application/json', headers=headers)
+    if encoding:
+        resp.headers['Content-Encoding'] = encoding
+    resp.set_etag(etag)
+    return resp
@@ -0,0 +1,128 @@
+"""
+Batched inference for the emotion classifier.
+
+classify() runs one vectorizer.transform() and one predict_proba() for a whole list of messages and
+takes each label as the argmax of its probabilities, instead of separate predict() and
+predict_proba() passes per message.
+
+MicroBatcher coalesces concurrent single-message calls (e.g. parallel /get requests in a threaded
+worker) into one classify() call of up to INFERENCE_MAX_BATCH items, and each caller gets its own
+result back. A message that finds nothing else pending is classified at once, so a quiet worker adds
+no latency. Messages that arrive while a batch is being classified queue up and go together in the
+next one; only when several are already waiting does the batcher hold the batch open for up to
+INFERENCE_BATCH_WINDOW_MS to collect the rest of the burst. A window of 0 disables coalescing for
+submit(). submit_future() returns the result as a future instead of waiting for it, for the ASGI
+event loop.
+"""
+import concurrent.futures
+import os
+import queue
+import threading
+import time
+
+import metrics
+
+BATCH_WINDOW = float(os.environ.get('INFERENCE_BATCH_WINDOW_MS', '2')) / 1000.0
+MAX_BATCH = int(os.environ.get('INFERENCE_MAX_BATCH', '64'))
+
+
+def classify(vectorizer, model, texts):
+    """Return [(label, {class: probability}), ...] for `texts`, in order."""
+    with metrics.span('model.transform'):
+        X = vectorizer.transform(texts)
+    classes = [str(c) for c in model.classes_]
+    try:
+        with metrics.span('model.score'):
+            probs = model.predict_proba(X)
+    except Exception:
+        # classifiers without probabilities: fall back to plain labels
+        return [(str(p), {}) for p in model.predict(X)]
+    out = []
+    for row, best in zip(probs, probs.argmax(axis=1)):
+        out.append((classes[best], {c: float(p) for c, p in zip(classes, row)}))
+    return out
+
+
+class SklearnModel:
+    """The legacy pickled (vectorizer, model) pair, exposing the same classify() as engine.Engine."""
+
+    def __init__(self, vectorizer, model):
+        self.vectorizer = vectorizer
+        self.model = model
+        self.classes_ = [str(c) for c in model.classes_]
+
+    def classify(self, texts):
+        return classify(self.vectorizer, self.model, texts)
+
+
+class MicroBatcher:
+    """Groups concurrent submit() calls into batched calls of `fn(items) -> results`."""
+
+    def __init__(self, fn, window=BATCH_WINDOW, max_batch=MAX_BATCH):
+        self.fn = fn
+        self.window = window
+        self.max_batch = max_batch
+        self._reset()
+        if hasattr(os, 'register_at_fork'):
+            # a forked worker inherits neither the parent's thread nor its waiting callers
+            os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        self._queue = queue.SimpleQueue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.items = 0
+
+    def submit(self, item):
+        """Run `item` through fn (possibly batched with others) and return its result."""
+        if self.window <= 0:
+            return self.fn([item])[0]
+        return self.submit_future(item).result()
+
+    def submit_future(self, item):
+        """Queue `item` and return a concurrent.futures.Future of its result without waiting.
+
+        For callers that must not block (asgi.py awaits it with asyncio.wrap_future). The item is
+        always batched on the batcher thread, even with a window of 0.
+        """
+        fut = concurrent.futures.Future()
+        self._queue.put((item, fut))
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='inference-batcher', daemon=True)
+                    self._thread.start()
+        return fut
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            # everything already queued (what arrived during the previous batch) goes along
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if len(batch) > 1:
+                # a burst is under way: give the rest of it the window to join
+                deadline = time.monotonic() + self.window
+                while len(batch) < self.max_batch:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        batch.append(self._queue.get(timeout=remaining))
+                    except queue.Empty:
+                        break
+            items = [item for item, _ in batch]
+            try:
+                results = self.fn(items)
+            except Exception as exc:
+                for _, fut in batch:
+                    fut.set_exception(exc)
+                continue
+            self.batches += 1
+            self.items += len(batch)
+            for (_, fut), result in zip(batch, results):
+                fut.set_result(result)
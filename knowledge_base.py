@@ -0,0 +1,151 @@
+"""
+knowledge.json loader and retrieval index.
+
+The file is parsed once and kept in memory together with a pre-serialized /knowledge payload and
+an Index over the article text. Each access stats the file and reloads only when its mtime has
+changed, so edits show up without a restart and unchanged content is never re-serialized or
+re-indexed.
+
+Index is a TF-IDF model over the title, content, how_it_comes and how_it_goes fields, stored as
+an inverted index in flat NumPy arrays (term -> slice of (article, weight) postings). Terms are
+words plus their character 4- and 5-grams, so "anxious" still finds the article about anxiety.
+related() scores a message against every article with one np.bincount over the postings of its
+terms and returns the top k by cosine similarity; the cost follows the postings touched, not the
+number of articles.
+"""
+import functools
+import json
+import os
+import re
+import threading
+from collections import Counter
+
+import numpy as np
+
+import http_cache
+
+KB_PATH = os.path.join(os.path.dirname(__file__), 'knowledge.json')
+
+FIELDS = ('title', 'content', 'how_it_comes', 'how_it_goes')
+# cosine similarity below this is noise: shared filler n-grams rather than a shared topic
+MIN_SCORE = 0.1
+
+_WORD_RE = re.compile(r"[a-z]{3,}")
+_STOP_WORDS = frozenset("""
+about after again also and any are because been being both but can could does doing down during
+each few for from further had has have having her here hers him his how into its itself just
+like may more most much not now off once only other our out over own same she should some such
+than that the their them then there these they this those through too under until very was way
+were what when where which while who why will with would you your
+""".split())
+
+_lock = threading.Lock()
+
+
+def _words(text):
+    return [w for w in _WORD_RE.findall(text.lower()) if w not in _STOP_WORDS]
+
+
+@functools.lru_cache(maxsize=65536)
+def _word_terms(word):
+    """The word itself and its character 4- and 5-grams (with word boundaries)."""
+    padded = f" {word} "
+    return (word,) + tuple(padded[i:i + n] for n in (4, 5) for i in range(len(padded) - n + 1))
+
+
+class Index:
+    """Inverted TF-IDF index over knowledge base articles (see the module docstring)."""
+
+    def __init__(self, items):
+        self.items = items
+        vocab, word_cols = {}, {}
+        # one entry per distinct word of each article: its term columns, its count, its article
+        parts, word_counts, word_docs = [], [], []
+        for doc, item in enumerate(items):
+            wc = Counter(_words(' '.join(str(item.get(f) or '') for f in FIELDS)))
+            for word, n in wc.items():
+                c = word_cols.get(word)
+                if c is None:
+                    c = word_cols[word] = np.array([vocab.setdefault(t, len(vocab)) for t in _word_terms(word)],
+                                                   dtype=np.intp)
+                parts.append(c)
+                word_counts.append(n)
+                word_docs.append(doc)
+        self.vocab = vocab
+        n_docs, n_terms = len(items), max(len(vocab), 1)
+        lengths = [len(c) for c in parts]
+        rows = np.repeat(np.asarray(word_docs, dtype=np.intp), lengths)
+        cols = np.concatenate(parts) if parts else np.empty(0, dtype=np.intp)
+        # different words share n-grams: add up the counts of each (article, term) pair
+        keys, inverse = np.unique(rows * n_terms + cols, return_inverse=True)
+        counts = np.bincount(inverse, weights=np.repeat(np.asarray(word_counts, dtype=np.float64), lengths))
+        rows, cols = keys // n_terms, keys % n_terms
+        df = np.bincount(cols, minlength=len(vocab))
+        # smoothed idf and sublinear tf, as TfidfVectorizer(smooth_idf=True, sublinear_tf=True)
+        self.idf = np.log((1 + n_docs) / (1 + df)) + 1
+        weights = (np.log(counts) + 1) * self.idf[cols]
+        norms = np.sqrt(np.bincount(rows, weights=weights * weights, minlength=n_docs))
+        norms[norms == 0] = 1
+        weights = weights / norms[rows]
+        # postings sorted by term: the postings of term t are docs[starts[t]:starts[t + 1]]
+        order = np.argsort(cols, kind='stable')
+        self.docs = rows[order]
+        self.weights = weights[order]
+        self.starts = np.concatenate(([0], np.cumsum(df)))
+
+    def related(self, text, k=3, min_score=MIN_SCORE):
+        """[(score, item), ...] for the k articles most similar to `text`, best first."""
+        tf = Counter(col for word in _words(text) for col in map(self.vocab.get, _word_terms(word))
+                     if col is not None)
+        if not tf or not self.items:
+            return []
+        cols = np.fromiter(tf, dtype=np.intp, count=len(tf))
+        q = (np.log(np.fromiter(tf.values(), dtype=np.float64, count=len(tf))) + 1) * self.idf[cols]
+        q /= np.sqrt(q @ q)
+        # every posting of every query term, with the query weight of its term
+        lengths = self.starts[cols + 1] - self.starts[cols]
+        idx = np.repeat(self.starts[cols] - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+        scores = np.bincount(self.docs[idx], weights=self.weights[idx] * np.repeat(q, lengths),
+                             minlength=len(self.items))
+        top = np.argpartition(-scores, k - 1)[:k] if k < len(scores) else np.arange(len(scores))
+        top = top[np.argsort(-scores[top])]
+        return [(float(scores[i]), self.items[i]) for i in top if scores[i] >= min_score]
+
+
+_state = (None, [], http_cache.Payload([]), Index([]))  # (mtime, items, payload, index)
+
+
+def _current():
+    global _state
+    try:
+        mtime = os.stat(KB_PATH).st_mtime_ns
+    except OSError:
+        mtime = None
+    state = _state
+    if mtime == state[0]:
+        return state
+    with _lock:
+        if _state[0] != mtime:
+            items = []
+            if mtime is not None:
+                with open(KB_PATH, 'r', encoding='utf-8') as f:
+                    items = json.load(f)
+            _state = (mtime, items, http_cache.Payload(items), Index(items))
+        return _state
+
+
+def items():
+    """The knowledge base entries as parsed from knowledge.json."""
+    return _current()[1]
+
+
+def payload():
+    """Pre-serialized (and pre-compressed) /knowledge response body."""
+    return _current()[2]
+
+
+def related(text, k=3):
+    """Up to k articles relevant to `text` as {'id', 'title', 'category', 'score'}, best first."""
+    return [{'id': item.get('id'), 'title': item.get('title'), 'category': item.get('category'),
+             'score': round(score, 4)}
+            for score, item in _current()[3].related(text, k)]
@@ -0,0 +1,76 @@
+"""
+Keyword matcher behind is_mental_health_query / detect_stress_type / detect_intent.
+
+The keyword tables live here and are compiled once at import into scan plans. match() lowercases the
+text once and answers all three questions in a single call, so a /get request scans its message once
+instead of once per detector.
+
+Scan order keeps the original semantics: the first stress type / intent (in table order) with any
+keyword occurring as a substring wins. Keywords already known to be absent are pruned from later
+scans: when no stress type matched, the intent scan skips keywords shared with the stress table, and
+the scope scan only checks the keywords that appear in neither table.
+"""
+import collections
+
+GENERAL_STRESS = "General Stress"
+GENERAL_INTENT = 'general'
+
+STRESS_TYPES = [
+    ("Anxiety", ["anxious", "panic", "worry", "nervous"]),
+    ("Depression", ["hopeless", "sad", "empty", "alone"]),
+    ("Work/Academic", ["work", "exam", "study", "deadline", "project", "college"]),
+    ("Burnout", ["tired", "exhaust", "overwhelm"]),
+    ("Relationship", ["partner", "friend", "breakup", "love"]),
+]
+
+INTENTS = [
+    ('workload', ['work', 'exam', 'deadline', 'project', 'study', 'assignment']),
+    ('sleep', ['sleep', 'tired', 'rest', 'insomnia']),
+    ('panic', ['panic', 'hypervent', 'shortness of breath']),
+    ('relationship', ['partner', 'relationship', 'friend', 'breakup']),
+    ('suicidal', ['suicide', 'kill myself', 'worthless', 'end my life']),
+]
+
+SCOPE_KEYWORDS = [
+    'stress', 'depress', 'anxious', 'tired', 'sad', 'panic', 'lonely',
+    'hopeless', 'burnout', 'overwhelm', 'fear', 'sleep', 'mental', 'worry'
+]
+
+TextMatch = collections.namedtuple('TextMatch', 'stress_type intent in_scope')
+
+
+def _plan(table, absent=frozenset()):
+    return tuple((label, tuple(kw for kw in kws if kw not in absent)) for label, kws in table)
+
+
+def _keywords(table):
+    return frozenset(kw for _, kws in table for kw in kws)
+
+
+_STRESS_PLAN = _plan(STRESS_TYPES)
+_INTENT_PLAN = _plan(INTENTS)
+# used when no stress keyword occurred: those keywords cannot match an intent either
+_INTENT_PLAN_NO_STRESS = _plan(INTENTS, _keywords(STRESS_TYPES))
+# used when neither table matched
+_SCOPE_ONLY = tuple(kw for kw in SCOPE_KEYWORDS if kw not in _keywords(STRESS_TYPES) | _keywords(INTENTS))
+
+
+def _first(t, plan, default):
+    for label, kws in plan:
+        for kw in kws:
+            if kw in t:
+                return label
+    return default
+
+
+def match(text):
+    """Return TextMatch(stress_type, intent, in_scope) for `text`."""
+    t = text.lower()
+    stress_type = _first(t, _STRESS_PLAN, GENERAL_STRESS)
+    if stress_type == GENERAL_STRESS:
+        intent = _first(t, _INTENT_PLAN_NO_STRESS, GENERAL_INTENT)
+    else:
+        intent = _first(t, _INTENT_PLAN, GENERAL_INTENT)
+    in_scope = (stress_type != GENERAL_STRESS or intent != GENERAL_INTENT
+                or any(kw in t for kw in _SCOPE_ONLY))
+    return TextMatch(stress_type, intent, in_scope)
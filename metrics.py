@@ -0,0 +1,183 @@
+"""
+Lightweight timing spans, histograms and a Prometheus-style text exposition.
+
+Enable with METRICS=1. Then:
+ - `with metrics.span('stage'):` times a block into the escapestress_stage_seconds histogram
+   (label stage=...). Spans on the request thread are also collected per request and, with
+   METRICS_SERVER_TIMING=1, returned in a `Server-Timing` response header.
+ - init_app(app) adds escapestress_request_seconds per endpoint.
+ - render() produces the /metrics text: the histograms plus the counters of every collector added
+   with add_collector() (DB pool, caches, write-behind...).
+
+When METRICS is not set, span() returns one shared no-op context manager and init_app() installs
+no hooks, so instrumented code pays a function call per span and nothing else.
+
+Metrics are per process: under gunicorn each worker keeps its own, and a scrape sees the worker
+that answered it.
+"""
+import bisect
+import contextlib
+import os
+import threading
+import time
+
+ENABLED = os.environ.get('METRICS') == '1'
+SERVER_TIMING = ENABLED and os.environ.get('METRICS_SERVER_TIMING') == '1'
+
+PREFIX = 'escapestress'
+# seconds; from 50 µs (a cache hit) to 2.5 s (a cold model load)
+BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+_NOOP = contextlib.nullcontext()
+
+
+class Histogram:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # the last slot is +Inf
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+
+    def snapshot(self):
+        with self._lock:
+            return list(self.counts), self.sum
+
+
+class Family:
+    """Histograms of one metric, one per label value."""
+
+    def __init__(self, name, label, help_text):
+        self.name = name
+        self.label = label
+        self.help = help_text
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, value):
+        child = self._children.get(value)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(value, Histogram())
+        return child
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            # labels() may add a child while a scrape renders
+            children = list(self._children.items())
+        for value, hist in sorted(children):
+            counts, total = hist.snapshot()
+            label = f'{self.label}="{_escape(value)}"'
+            cumulative = 0
+            for bound, n in zip(hist.buckets + ('+Inf',), counts):
+                cumulative += n
+                lines.append(f'{self.name}_bucket{{{label},le="{bound}"}} {cumulative}')
+            lines.append(f"{self.name}_sum{{{label}}} {total!r}")
+            lines.append(f"{self.name}_count{{{label}}} {cumulative}")
+        return lines
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+stages = Family(f'{PREFIX}_stage_seconds', 'stage', 'Time spent in each stage of request handling.')
+requests = Family(f'{PREFIX}_request_seconds', 'endpoint', 'Request latency by endpoint.')
+
+_local = threading.local()
+_collectors = []
+
+
+# ==========================================
+# Spans
+# ==========================================
+class _Span:
+    __slots__ = ('name', 't0')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.t0
+        stages.labels(self.name).observe(elapsed)
+        timings = getattr(_local, 'timings', None)
+        if timings is not None:
+            timings.append((self.name, elapsed))
+        return False
+
+
+def span(name):
+    """Context manager timing a block as stage `name` (a shared no-op when metrics are off)."""
+    if not ENABLED:
+        return _NOOP
+    return _Span(name)
+
+
+# ==========================================
+# Flask integration
+# ==========================================
+def init_app(app):
+    """Time every request and, with METRICS_SERVER_TIMING=1, add a Server-Timing header."""
+    if not ENABLED:
+        return
+    from flask import request
+
+    @app.before_request
+    def _start_request():
+        _local.started = time.perf_counter()
+        _local.timings = [] if SERVER_TIMING else None
+
+    @app.after_request
+    def _finish_request(response):
+        started = getattr(_local, 'started', None)
+        if started is None:
+            return response
+        elapsed = time.perf_counter() - started
+        endpoint = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        requests.labels(endpoint).observe(elapsed)
+        timings = _local.timings
+        if timings is not None:
+            totals = {}
+            for name, seconds in timings:
+                totals[name] = totals.get(name, 0.0) + seconds
+            parts = [f"{name};dur={seconds * 1000:.3f}" for name, seconds in totals.items()]
+            parts.append(f"total;dur={elapsed * 1000:.3f}")
+            response.headers['Server-Timing'] = ', '.join(parts)
+        _local.started = _local.timings = None
+        return response
+
+
+# ==========================================
+# Exposition
+# ==========================================
+def add_collector(name, fn):
+    """Export the numeric values of the dict fn() returns as PREFIX_<name>_<key> gauges."""
+    _collectors.append((name, fn))
+
+
+def render():
+    """The Prometheus text exposition format (version 0.0.4)."""
+    lines = stages.render() + requests.render()
+    for name, fn in _collectors:
+        try:
+            values = fn()
+        except Exception as e:
+            lines.append(f"# {name} collector failed: {type(e).__name__}")
+            continue
+        for key, value in sorted(values.items()):
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            metric = f"{PREFIX}_{name}_{key}"
+            lines.append(f"# TYPE {metric} gauge")
+            lines.append(f"{metric} {value!r}")
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,238 @@
+"""
+Model registry: versioned model artifacts, a pointer to the active one, and hot reload.
+
+Layout under model/:
+ - versions/<version>/            artifacts written by train_stream.py (see artifact.py)
+ - ACTIVE                         name of the version to serve, one line
+ - emotion_model/, emotion_model.pkl
+                                  served when there is no ACTIVE pointer (artifact preferred)
+
+current() returns the loaded model as a Loaded tuple, loading it on first use. A background
+watcher then polls every MODEL_WATCH_INTERVAL seconds (default 5, 0 disables it) for a change of
+the pointer or of the files it resolves to. A new model is loaded and warmed up on the watcher
+thread, off the request path, and swapped in with a single reference assignment: calls that
+already hold the old model finish on it, the next call gets the new one. If a load fails the old
+model keeps serving and the error is reported by info().
+
+The watcher is per process. Under gunicorn --preload the master's thread does not survive the fork,
+so each worker starts its own on first use.
+
+Usage:
+    python model_registry.py list
+    python model_registry.py activate <version>
+"""
+import collections
+import logging
+import os
+import pickle
+import sys
+import threading
+import time
+
+MODEL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "model")
+VERSIONS_DIR = os.path.join(MODEL_DIR, "versions")
+
+WATCH_INTERVAL = float(os.environ.get('MODEL_WATCH_INTERVAL', '5'))
+
+log = logging.getLogger(__name__)
+
+Loaded = collections.namedtuple('Loaded', 'model version path loaded_at load_seconds')
+
+
+def _is_artifact(path):
+    # same check as artifact.is_artifact, without importing numpy
+    return os.path.isfile(os.path.join(path, 'meta.json'))
+
+
+def list_versions(versions_dir=VERSIONS_DIR):
+    """Complete versions, oldest first (version names sort by creation time)."""
+    if not os.path.isdir(versions_dir):
+        return []
+    return sorted(v for v in os.listdir(versions_dir)
+                  if not v.startswith('.') and _is_artifact(os.path.join(versions_dir, v)))
+
+
+class Registry:
+    def __init__(self, model_dir=MODEL_DIR, interval=WATCH_INTERVAL):
+        self.versions_dir = os.path.join(model_dir, "versions")
+        self.active_file = os.path.join(model_dir, "ACTIVE")
+        # exported, memory-mapped artifact (see artifact.py); the pickle is only a fallback
+        self.default_artifact = os.path.join(model_dir, "emotion_model")
+        self.default_pickle = os.path.join(model_dir, "emotion_model.pkl")
+        self.interval = interval
+        self._loaded = None
+        self._stamp = None
+        self.swaps = 0
+        self.errors = 0
+        self.last_error = None
+        self._reset_threads()
+        if hasattr(os, 'register_at_fork'):
+            # the watcher thread does not survive a fork; the loaded model does (shared pages)
+            os.register_at_fork(after_in_child=self._reset_threads)
+
+    def _reset_threads(self):
+        self._lock = threading.Lock()
+        self._thread = None
+
+    # ------------------------------------------
+    # Resolving the pointer
+    # ------------------------------------------
+    def active_version(self):
+        try:
+            with open(self.active_file, encoding='utf-8') as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def resolve(self):
+        """(version, path) the registry should serve right now."""
+        version = self.active_version()
+        if version:
+            path = os.path.join(self.versions_dir, version)
+            if not _is_artifact(path):
+                raise FileNotFoundError(f"ACTIVE points to {version!r}, which is not in {self.versions_dir}")
+            return version, path
+        if _is_artifact(self.default_artifact):
+            return os.path.basename(self.default_artifact), self.default_artifact
+        if os.path.exists(self.default_pickle):
+            return os.path.basename(self.default_pickle), self.default_pickle
+        raise FileNotFoundError(
+            f"Model not found at {self.default_artifact} or {self.default_pickle}. Run train_model.py first.")
+
+    def _stamp_of(self, path):
+        # meta.json is the last file an export writes, so its mtime identifies the artifact
+        target = path if path.endswith('.pkl') else os.path.join(path, 'meta.json')
+        return path, os.stat(target).st_mtime_ns
+
+    # ------------------------------------------
+    # Loading and swapping
+    # ------------------------------------------
+    def _load(self, version, path):
+        # imported here so importing the registry stays free of numpy/scikit-learn
+        import artifact
+        import engine
+        t0 = time.perf_counter()
+        if path.endswith('.pkl'):
+            with open(path, "rb") as f:
+                model = engine.Engine.from_sklearn(*pickle.load(f))
+        else:
+            model = artifact.load(path)
+        # the first call compiles the token pattern and faults in the mapped arrays
+        model.classify(["warm up"])
+        return Loaded(model, version, path, time.time(), time.perf_counter() - t0)
+
+    def reload(self, force=False):
+        """Load whatever the pointer selects if it changed (or always, with force) and swap it in."""
+        with self._lock:
+            version, path = self.resolve()
+            stamp = self._stamp_of(path)
+            if self._loaded is not None and stamp == self._stamp and not force:
+                return self._loaded
+            loaded = self._load(version, path)
+            if self._loaded is not None:
+                self.swaps += 1
+                log.info("model swapped: %s -> %s (loaded in %.0f ms)",
+                         self._loaded.version, version, loaded.load_seconds * 1000)
+            self._loaded, self._stamp = loaded, stamp
+            return loaded
+
+    def current(self):
+        """The model to use for this call (loads it on first use)."""
+        loaded = self._loaded
+        if loaded is None:
+            loaded = self.reload()
+        elif self._thread is None and self.interval > 0:
+            # first call in a forked worker: the inherited model may be older than the pointer
+            loaded = self.reload()
+        if self._thread is None and self.interval > 0:
+            self._start_watcher()
+        return loaded
+
+    def loaded(self):
+        """The current Loaded, or None if nothing has been loaded yet (never triggers a load)."""
+        return self._loaded
+
+    def _start_watcher(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._watch, name='model-watcher', daemon=True)
+                self._thread.start()
+
+    def _watch(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.reload()
+                self.last_error = None
+            except Exception as e:
+                self.errors += 1
+                error = f"{type(e).__name__}: {e}"
+                if error != self.last_error:
+                    # log a broken pointer once, not on every poll
+                    log.exception("model reload failed; still serving %s",
+                                  self._loaded.version if self._loaded else None)
+                self.last_error = error
+
+    # ------------------------------------------
+    # Pointer updates and reporting
+    # ------------------------------------------
+    def activate(self, version):
+        """Point ACTIVE at `version`; every process picks it up on its next watcher poll."""
+        if not version or os.sep in version or version.startswith('.') \
+                or not _is_artifact(os.path.join(self.versions_dir, version)):
+            raise ValueError(f"unknown model version {version!r}")
+        tmp = f"{self.active_file}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            f.write(version + "\n")
+        # rename is atomic: readers see the old pointer or the new one, never a partial write
+        os.replace(tmp, self.active_file)
+
+    def info(self):
+        loaded = self._loaded
+        return {
+            'active': self.active_version(),
+            'version': loaded.version if loaded else None,
+            'path': loaded.path if loaded else None,
+            'loaded_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(loaded.loaded_at)) if loaded else None,
+            'load_ms': round(loaded.load_seconds * 1000, 2) if loaded else None,
+            'swaps': self.swaps,
+            'errors': self.errors,
+            'last_error': self.last_error,
+            'watch_interval': self.interval,
+            'versions': list_versions(self.versions_dir),
+        }
+
+
+_registry = Registry()
+
+
+def current():
+    return _registry.current()
+
+
+def loaded():
+    return _registry.loaded()
+
+
+def reload(force=False):
+    return _registry.reload(force=force)
+
+
+def activate(version):
+    _registry.activate(version)
+
+
+def info():
+    return _registry.info()
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['list'] and len(sys.argv) == 2:
+        active = _registry.active_version()
+        for v in list_versions():
+            print(f"{'*' if v == active else ' '} {v}")
+    elif sys.argv[1:2] == ['activate'] and len(sys.argv) == 3:
+        activate(sys.argv[2])
+        print(f"Activated {sys.argv[2]}")
+    else:
+        sys.exit("usage: python model_registry.py list | activate <version>")
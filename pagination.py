@@ -0,0 +1,124 @@
+"""
+Keyset pagination for the append-only history tables (chats, journals).
+
+Pages are ordered newest first by `id`. The cursor is the id of the last row of a page and the next
+page is simply `id < cursor`, so reading page 1000 costs the same as reading page 1.
+
+ids are assigned in insertion order, and that is almost created_at order: the write-behind queue
+stamps created_at when a row is queued but the row gets its id when its batch is flushed, and each
+worker flushes its own queue. A since/until time range is therefore translated into an id range
+widened by ID_ORDER_SLACK seconds on each side (one probe each of the (created_at, id) index), and
+the exact range is applied to created_at within it (time_filters()). The page query itself then
+only walks `limit` entries of the primary key (or of the (label, id) index when filtering by
+label), plus the rows of the slack at the edges of the range, however much history the table
+holds. The indexes are created by db_setup.ensure_indexes().
+"""
+import collections
+import os
+from datetime import datetime, timedelta
+
+import query
+
+MAX_LIMIT = 500
+# how far created_at order may run ahead of id order: the write-behind flush interval, plus the
+# back-off while a failing flush is retried (writebehind.py)
+ID_ORDER_SLACK = float(os.environ.get('PAGINATION_ID_ORDER_SLACK', '300'))
+
+PageArgs = collections.namedtuple('PageArgs', 'limit cursor since until')
+
+
+def parse_args(args, default_limit):
+    """Read limit/cursor/since/until from request args. Raises ValueError on bad input."""
+    try:
+        limit = int(args.get('limit', default_limit))
+        cursor = int(args['cursor']) if args.get('cursor') else None
+    except ValueError:
+        raise ValueError("limit and cursor must be integers")
+    if not 1 <= limit <= MAX_LIMIT:
+        raise ValueError(f"limit must be between 1 and {MAX_LIMIT}")
+    return PageArgs(limit, cursor, parse_time(args, 'since'), parse_time(args, 'until'))
+
+
+def parse_time(args, name):
+    """The ISO-8601 time in args[name], or None when absent. Raises ValueError when it doesn't parse."""
+    value = args.get(name) or None
+    if value is not None:
+        try:
+            datetime.fromisoformat(value)
+        except ValueError:
+            raise ValueError(f"{name} must be an ISO-8601 date or time")
+    # ISO-8601 timestamps compare correctly as strings, which is how created_at is stored
+    return value
+
+
+def _shifted(ts, seconds):
+    """ISO timestamp `ts` moved by `seconds`, or None when it doesn't parse."""
+    try:
+        return (datetime.fromisoformat(ts) + timedelta(seconds=seconds)).isoformat()
+    except ValueError:
+        return None
+
+
+def id_bounds(table, since, until):
+    """An inclusive id range (None for an open end) holding every row with created_at in [since, until).
+
+    A row stamped more than ID_ORDER_SLACK before `since` was committed before any row stamped from
+    `since` on, so the range starts after the last such row; likewise it ends before the first row
+    stamped ID_ORDER_SLACK after `until`. It is a pre-filter: time_filters() applies the exact range.
+    """
+    lo = hi = None
+    before = since and _shifted(since, -ID_ORDER_SLACK)
+    if before:
+        row = query.fetch_one(
+            f"SELECT id FROM {table} WHERE created_at < ? ORDER BY created_at DESC, id DESC LIMIT 1", (before,))
+        if row is not None:
+            lo = row['id'] + 1
+    after = until and _shifted(until, ID_ORDER_SLACK)
+    if after:
+        row = query.fetch_one(
+            f"SELECT id FROM {table} WHERE created_at >= ? ORDER BY created_at ASC, id ASC LIMIT 1", (after,))
+        if row is not None:
+            hi = row['id'] - 1
+    return lo, hi
+
+
+def time_filters(since, until, column='created_at'):
+    """(sql, value) filters for created_at in [since, until)."""
+    filters = []
+    if since:
+        filters.append((f"{column} >= ?", since))
+    if until:
+        filters.append((f"{column} < ?", until))
+    return filters
+
+
+def fetch_page(table, columns, page, filters=()):
+    """Return (rows, next_cursor) for one page of `table`, newest first.
+
+    `filters` are (sql, value) pairs such as ("label = ?", "Negative"); `table` and `columns` come
+    from code, never from the request.
+    """
+    lo, hi = id_bounds(table, page.since, page.until)
+    where, params = [], []
+    for sql, value in list(filters) + time_filters(page.since, page.until):
+        where.append(sql)
+        params.append(value)
+    if page.cursor is not None:
+        where.append("id < ?")
+        params.append(page.cursor)
+    if lo is not None:
+        where.append("id >= ?")
+        params.append(lo)
+    if hi is not None:
+        where.append("id <= ?")
+        params.append(hi)
+    sql = f"SELECT {columns} FROM {table}"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    # one extra row tells us whether there is a next page without a COUNT(*)
+    sql += " ORDER BY id DESC LIMIT ?"
+    rows = query.fetch_all(sql, params + [page.limit + 1])
+    if len(rows) > page.limit:
+        rows = rows[:page.limit]
+        return rows, rows[-1]['id']
+    return rows, None
@@ -0,0 +1,95 @@
+"""
+Dialect-aware query helpers on top of db.connection().
+
+SQL is written once, with sqlite-style `?` placeholders. When the active backend is MySQL the
+statement is rewritten to pymysql's `%s` style the first time it is seen and the rewritten text is
+cached, so every statement is executed exactly once on either backend. Rows always come back as
+dicts, whether the driver returned tuples (sqlite3) or dicts (pymysql DictCursor).
+
+Passing the same SQL string every time also lets sqlite3 reuse its prepared statement from the
+per-connection statement cache.
+
+Functions:
+ - fetch_all(sql, params) / fetch_one(sql, params): SELECT helpers returning dicts
+ - execute(sql, params): run one write statement, returns the cursor's lastrowid
+ - executemany(sql, rows): run one statement for many parameter tuples in a single transaction
+All of them accept conn=... to run inside a connection the caller already holds.
+"""
+import contextlib
+import functools
+import re
+
+import db
+
+# single-quoted literals are matched first so placeholders inside them are left alone
+_TOKEN_RE = re.compile(r"'(?:[^']|'')*'|\?|%")
+
+
+@functools.lru_cache(maxsize=256)
+def _to_format_style(sql):
+    def sub(m):
+        tok = m.group(0)
+        if tok == '?':
+            return '%s'
+        # pymysql %-formats the statement whenever params are passed, so literal % must be doubled
+        return tok.replace('%', '%%')
+    return _TOKEN_RE.sub(sub, sql)
+
+
+def sql_for(sql, dialect=None):
+    """Return `sql` in the paramstyle of `dialect` (default: the active backend)."""
+    if (dialect or db.backend()) == 'mysql':
+        return _to_format_style(sql)
+    return sql
+
+
+@contextlib.contextmanager
+def _using(conn, write=False):
+    if conn is not None:
+        yield conn
+    else:
+        with db.connection(write=write) as own:
+            yield own
+
+
+def _as_dicts(cur, rows):
+    if not rows or isinstance(rows[0], dict):
+        return list(rows)
+    names = [d[0] for d in cur.description]
+    return [dict(zip(names, r)) for r in rows]
+
+
+def fetch_all(sql, params=(), conn=None):
+    """Run a SELECT and return every row as a dict."""
+    with _using(conn) as c:
+        cur = c.cursor()
+        cur.execute(sql_for(sql), tuple(params))
+        return _as_dicts(cur, cur.fetchall())
+
+
+def fetch_one(sql, params=(), conn=None):
+    """Run a SELECT and return the first row as a dict, or None."""
+    with _using(conn) as c:
+        cur = c.cursor()
+        cur.execute(sql_for(sql), tuple(params))
+        row = cur.fetchone()
+        return _as_dicts(cur, [row])[0] if row is not None else None
+
+
+def execute(sql, params=(), conn=None):
+    """Run a single write statement. Commits unless running inside a caller-held connection."""
+    with _using(conn, write=True) as c:
+        cur = c.cursor()
+        cur.execute(sql_for(sql), tuple(params))
+        return cur.lastrowid
+
+
+def executemany(sql, rows, conn=None):
+    """Run one statement for every parameter tuple in `rows`, in a single transaction."""
+    rows = [tuple(r) for r in rows]
+    if not rows:
+        return 0
+    with _using(conn, write=True) as c:
+        cur = c.cursor()
+        cur.executemany(sql_for(sql), rows)
+        return len(rows)
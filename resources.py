@@ -0,0 +1,50 @@
+"""
+Read-through cache for the `resources` table.
+
+The table is seeded once by db_setup.py and rarely changes, so lookups are served from memory after
+the first query per category. Anything that writes to `resources` must call invalidate(); entries
+also expire after RESOURCES_CACHE_TTL seconds so other worker processes pick up changes.
+"""
+import os
+
+import http_cache
+import query
+from cache import LRUCache
+
+CACHE_TTL = float(os.environ.get('RESOURCES_CACHE_TTL', '300'))
+
+_cache = LRUCache(maxsize=128, ttl=CACHE_TTL)
+
+
+def for_category(kind):
+    """Up to 5 resources for a stress type, plus the 'general' ones."""
+    rows = _cache.get(('category', kind))
+    if rows is None:
+        rows = query.fetch_all(
+            "SELECT title, url, category FROM resources WHERE category=? OR category='general' ORDER BY id ASC LIMIT 5",
+            (kind,))
+        _cache.put(('category', kind), rows)
+    return rows
+
+
+def cached(kind):
+    """for_category(kind) if it is in memory, else None; never queries the database."""
+    return _cache.get(('category', kind))
+
+
+def all_payload():
+    """Every resource as a pre-serialized /resources_db response body."""
+    payload = _cache.get('all')
+    if payload is None:
+        payload = http_cache.Payload(query.fetch_all("SELECT id, title, url, category FROM resources ORDER BY id ASC"))
+        _cache.put('all', payload)
+    return payload
+
+
+def invalidate():
+    """Forget every cached lookup; call after writing to the resources table."""
+    _cache.invalidate()
+
+
+def stats():
+    return _cache.stats()
@@ -0,0 +1,141 @@
+"""
+Incremental chat aggregates: counts per hour and per day by label, stress type and intent.
+
+record() is called on the write path next to the chat INSERT and queues one upsert row per
+(granularity, dimension) into `chat_rollups`, all in one executemany; the write-behind queue commits them in the same
+transaction as the chat rows, so the rollups never count a chat that was not stored. trends()
+then reads a window of buckets from the primary key (granularity, dimension, bucket, value): its
+cost depends on the window asked for, not on how many chats were ever logged, unlike a GROUP BY
+over `chats`.
+
+Buckets are UTC: 'YYYY-MM-DDTHH' for hours, 'YYYY-MM-DD' for days, so they sort and compare as
+strings like created_at.
+
+backfill() rebuilds the table from `chats` (`flask --app app backfill-rollups`). `chats` does not
+store stress type and intent, so they are recomputed from the message with matcher.match().
+"""
+import collections
+from datetime import datetime, timedelta
+
+import db
+import matcher
+import query
+import writebehind
+
+DIMENSIONS = ('label', 'stress_type', 'intent')
+# granularity -> (length of the created_at prefix that names the bucket, bucket width)
+GRANULARITIES = {
+    'hour': (13, timedelta(hours=1)),
+    'day': (10, timedelta(days=1)),
+}
+MAX_BUCKETS = 366
+BACKFILL_CHUNK = 5000
+
+_SQLITE_UPSERT = ("INSERT INTO chat_rollups (granularity, dimension, bucket, value, n) VALUES (?, ?, ?, ?, ?) "
+                  "ON CONFLICT (granularity, dimension, bucket, value) DO UPDATE SET n = n + excluded.n")
+_MYSQL_UPSERT = ("INSERT INTO chat_rollups (granularity, dimension, bucket, value, n) VALUES (?, ?, ?, ?, ?) "
+                 "ON DUPLICATE KEY UPDATE n = n + VALUES(n)")
+
+
+def ensure_schema(conn):
+    """Create the chat_rollups table if it doesn't exist yet."""
+    cur = conn.cursor()
+    cur.execute("CREATE TABLE IF NOT EXISTS chat_rollups (granularity VARCHAR(8) NOT NULL, "
+                "dimension VARCHAR(16) NOT NULL, bucket VARCHAR(13) NOT NULL, value VARCHAR(64) NOT NULL, "
+                "n INTEGER NOT NULL, PRIMARY KEY (granularity, dimension, bucket, value))")
+    conn.commit()
+
+
+def _upsert_sql():
+    return _MYSQL_UPSERT if db.backend() == 'mysql' else _SQLITE_UPSERT
+
+
+def _keys(created_at, values):
+    """(granularity, dimension, bucket, value) counted by one chat logged at ISO time `created_at`."""
+    keys = []
+    for granularity, (width, _) in GRANULARITIES.items():
+        bucket = created_at[:width]
+        for dimension, value in zip(DIMENSIONS, values):
+            keys.append((granularity, dimension, bucket, value or 'unknown'))
+    return keys
+
+
+def record(created_at, label, stress_type, intent):
+    """Count one logged chat; queued with the chat INSERT (call right after enqueuing it).
+
+    The upserts for every bucket go in as one executemany, so with write-behind off they are still
+    a single transaction.
+    """
+    keys = _keys(created_at, (label, stress_type, intent))
+    writebehind.enqueue_many(_upsert_sql(), [key + (1,) for key in keys])
+
+
+# ==========================================
+# Reading
+# ==========================================
+def window_start(granularity, buckets, until=None):
+    """First bucket of a window of `buckets` buckets ending with the one containing `until`."""
+    width, step = GRANULARITIES[granularity]
+    end = datetime.fromisoformat(until) if until else datetime.utcnow()
+    return (end - step * (buckets - 1)).isoformat()[:width]
+
+
+def trends(granularity, dimension, since, until=None):
+    """{'buckets': [{'bucket', 'total', 'counts': {value: n}}], 'totals': {value: n}} for [since, until]."""
+    width, _ = GRANULARITIES[granularity]
+    sql = "SELECT bucket, value, n FROM chat_rollups WHERE granularity = ? AND dimension = ? AND bucket >= ?"
+    params = [granularity, dimension, since[:width]]
+    if until:
+        sql += " AND bucket <= ?"
+        params.append(until[:width])
+    buckets = collections.OrderedDict()
+    totals = collections.Counter()
+    for row in query.fetch_all(sql + " ORDER BY bucket ASC", params):
+        buckets.setdefault(row['bucket'], {})[row['value']] = row['n']
+        totals[row['value']] += row['n']
+    return {
+        'buckets': [{'bucket': b, 'total': sum(c.values()), 'counts': c} for b, c in buckets.items()],
+        'totals': dict(totals.most_common()),
+    }
+
+
+# ==========================================
+# Backfill
+# ==========================================
+def _aggregate(rows, counts):
+    for row in rows:
+        if not row['created_at'] or not row['label'] or row['label'] == 'OutOfScope':
+            continue
+        tm = matcher.match(row['user'] or '')
+        # rows inserted by db_setup's DEFAULT CURRENT_TIMESTAMP use a space instead of 'T'
+        for key in _keys(str(row['created_at']).replace(' ', 'T'), (row['label'], tm.stress_type, tm.intent)):
+            counts[key] += 1
+
+
+def _scan(counts, after_id=0, conn=None):
+    """Aggregate chats with id > after_id into `counts` (keyset chunks); returns the last id seen."""
+    last_id = after_id
+    while True:
+        rows = query.fetch_all("SELECT id, user, label, created_at FROM chats WHERE id > ? ORDER BY id ASC LIMIT ?",
+                               (last_id, BACKFILL_CHUNK), conn=conn)
+        if not rows:
+            return last_id
+        _aggregate(rows, counts)
+        last_id = rows[-1]['id']
+
+
+def backfill():
+    """Rebuild chat_rollups from every logged chat; returns the number of rollup rows written.
+
+    The bulk of `chats` is aggregated without holding the write lock; chats logged meanwhile are
+    added inside the short transaction that replaces the table contents.
+    """
+    writebehind.flush()
+    counts = collections.Counter()
+    last_id = _scan(counts)
+    with db.connection(write=True) as conn:
+        # rows committed since the scan already updated chat_rollups, which is about to be replaced
+        _scan(counts, after_id=last_id, conn=conn)
+        query.execute("DELETE FROM chat_rollups", conn=conn)
+        query.executemany(_upsert_sql(), [key + (n,) for key, n in counts.items()], conn=conn)
+    return len(counts)
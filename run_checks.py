@@ -1,4 +1,239 @@
-from app import app
+import os
+import shutil
+import tempfile
+
+# the checks log chats, journals and actions: run them against a scratch copy of the database
+if not os.environ.get('SQLITE_PATH'):
+    _db = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'stress_chat.db')
+    os.environ['SQLITE_PATH'] = os.path.join(tempfile.mkdtemp(prefix='run-checks-'), 'stress_chat.db')
+    if os.path.exists(_db):
+        shutil.copyfile(_db, os.environ['SQLITE_PATH'])
+
+from app import app  # noqa: E402
+
+
+ENGINE_SAMPLES = [
+    'I am feeling anxious and overwhelmed', 'I feel calm and happy today', 'Exams are stressing me out!!',
+    'My partner and I had a fight', 'I can\'t sleep, I keep overthinking', 'Work is fine, I feel great',
+    'Café résumé naïve — I feel low', 'so so so tired', 'ok', '', '   ', 'Deadlines deadlines DEADLINES',
+    'I feel lonely and sad', 'Today was a good day with friends', 'Panic attack before the interview',
+]
+ENGINE_LABELS = ['Negative', 'Positive', 'Negative', 'Negative', 'Negative', 'Positive', 'Negative',
+                 'Negative', 'Positive', 'Positive', 'Positive', 'Negative', 'Negative', 'Positive', 'Negative']
+
+
+def check_engine_parity():
+    """engine.Engine vs scikit-learn across vectorizer settings and classifier types."""
+    import numpy as np
+    from sklearn.feature_extraction.text import HashingVectorizer, TfidfVectorizer
+    from sklearn.linear_model import LogisticRegression, SGDClassifier
+    from sklearn.svm import LinearSVC
+    from sklearn.utils import murmurhash3_32
+    import engine
+
+    for text in ENGINE_SAMPLES + ['a', 'ab', 'abc', 'abcd', 'abcde', '😀 ünï']:
+        for seed in (0, 42):
+            assert engine.murmurhash3_32(text.encode('utf-8'), seed) == murmurhash3_32(text, seed=seed), text
+
+    vectorizers = [
+        (TfidfVectorizer, {}),
+        (TfidfVectorizer, {'ngram_range': (1, 2), 'stop_words': 'english'}),
+        (TfidfVectorizer, {'ngram_range': (2, 3), 'lowercase': False, 'token_pattern': r'(?u)\b\w+\b'}),
+        (TfidfVectorizer, {'strip_accents': 'unicode', 'sublinear_tf': True, 'norm': 'l1'}),
+        (TfidfVectorizer, {'strip_accents': 'ascii', 'binary': True, 'use_idf': False, 'norm': None}),
+        (TfidfVectorizer, {'smooth_idf': False, 'max_features': 20, 'min_df': 1, 'stop_words': ['i', 'and', 'the']}),
+        (TfidfVectorizer, {'analyzer': 'char', 'ngram_range': (2, 4)}),
+        (TfidfVectorizer, {'analyzer': 'char_wb', 'ngram_range': (1, 5)}),
+        (TfidfVectorizer, {'dtype': np.float32}),
+        (HashingVectorizer, {}),
+        (HashingVectorizer, {'n_features': 16, 'ngram_range': (1, 2), 'binary': True}),
+        (HashingVectorizer, {'n_features': 64, 'alternate_sign': False, 'analyzer': 'char_wb', 'norm': 'l1'}),
+    ]
+    three_labels = [label if i % 3 else 'Neutral' for i, label in enumerate(ENGINE_LABELS)]
+    classifiers = [
+        (lambda: LogisticRegression(), ENGINE_LABELS),
+        (lambda: LogisticRegression(max_iter=1000), three_labels),
+        (lambda: SGDClassifier(loss='log_loss', random_state=0), three_labels),
+        (lambda: LinearSVC(), three_labels),
+    ]
+    unseen = ENGINE_SAMPLES + ['completely unseen words here', 'ANXIOUS anxious Anxious', 'résumé']
+    worst = 0.0
+    for make_vectorizer, params in vectorizers:
+        for make_model, labels in classifiers:
+            vectorizer = make_vectorizer(**params)
+            model = make_model().fit(vectorizer.fit_transform(ENGINE_SAMPLES), labels)
+            fast = engine.Engine.from_sklearn(vectorizer, model)
+            X = vectorizer.transform(unseen)
+            tol = 1e-5 if params.get('dtype') == np.float32 else 1e-10
+            diff = np.abs(fast.decision_function(unseen) - model.decision_function(X)).max()
+            assert diff < tol, (params, model, diff)
+            assert fast.predict(unseen) == [str(c) for c in model.predict(X)], (params, model)
+            if hasattr(model, 'predict_proba'):
+                diff = max(diff, np.abs(fast.predict_proba(unseen) - model.predict_proba(X)).max())
+                assert diff < tol, (params, model, diff)
+            # one message at a time scores the same as the batch
+            assert np.allclose(fast.decision_function(unseen[0]), fast.decision_function(unseen[:1]))
+            worst = max(worst, diff)
+    print(f'engine parity: {len(vectorizers) * len(classifiers)} configurations, max abs diff {worst:.2e}')
+
+
+def check_traffic_mixes():
+    """Every request the load generator (benchmarks/loadgen.py) replays must succeed, under app and asgi.app."""
+    from benchmarks import loadgen
+
+    import app as app_module
+    import asgi
+    import writebehind
+
+    clients = {'wsgi': loadgen.InprocClient(app), 'asgi': loadgen.AsgiClient(asgi.app, loadgen.start_loop())}
+    for name, client in clients.items():
+        for mix in loadgen.MIXES:
+            for seed in range(4):
+                failed = [(endpoint, status) for endpoint, status in loadgen.replay_once(client, mix, seed)
+                          if status >= 400]
+                assert not failed, (name, mix, seed, failed)
+        # every chat message, new to the classification cache, so the in-scope ones reach the model,
+        # the session store and the write-behind queue through this client's /get
+        classified = app_module.batcher.items
+        failed = [(msg, status) for msg in loadgen.CHAT_MESSAGES
+                  for status in [client.request('POST', '/get', {'msg': f"{msg} ({name} check)"})] if status >= 400]
+        assert not failed, (name, failed)
+        assert app_module.batcher.items > classified, (name, 'no message reached the model')
+    writebehind.flush()
+    assert not writebehind.stats().get('errors'), writebehind.stats()
+    print(f'traffic mixes: {len(loadgen.MIXES)} replayed without errors (wsgi and asgi)')
+
+
+def check_write_behind():
+    """A row that can never be written is dropped after the retries; the rest of its batch commits."""
+    import logging
+
+    import query
+    import writebehind
+
+    def count(marker):
+        return query.fetch_one("SELECT COUNT(*) AS n FROM actions WHERE details = ?", (marker,))['n']
+
+    insert = "INSERT INTO actions (action_type, details, created_at) VALUES (?, ?, ?)"
+    # a long interval keeps the background thread out of the way; the check flushes by hand
+    queue = writebehind.WriteBehindQueue(interval=60, max_retries=2)
+    queue.enqueue(insert, ('check', 'write-behind good 1', None))
+    queue.enqueue("INSERT INTO no_such_table (x) VALUES (?)", (1,))
+    queue.enqueue(insert, ('check', 'write-behind good 2', None))
+    log = logging.getLogger('writebehind')
+    level, log.level = log.level, logging.CRITICAL  # the failures are expected
+    try:
+        assert queue.flush() == 0 and queue.flush() == 0, queue.stats()
+        assert queue.depth() == 3 and count('write-behind good 1') == 0, queue.stats()
+        # past max_retries: one transaction per row, the poisoned one is dropped
+        assert queue.flush() == 2, queue.stats()
+    finally:
+        log.level = level
+    stats = queue.stats()
+    assert stats['dropped'] == 1 and stats['errors'] == 2 and stats['depth'] == 0, stats
+    assert count('write-behind good 1') == 1 and count('write-behind good 2') == 1
+    assert queue.flush() == 0
+
+    # whatever is still queued at interpreter exit is written by the atexit flush
+    writebehind.enqueue(insert, ('check', 'write-behind at exit', None))
+    writebehind._shutdown_flush()
+    assert writebehind.queue_depth() == 0 and count('write-behind at exit') == 1
+    print('write-behind: poisoned row dropped, the rest of its batch committed, drained at exit')
+
+
+def check_time_ranges():
+    """since/until are exact even when ids and created_at disagree (write-behind flush order)."""
+    import query
+
+    client = app.test_client()
+    # ids in insertion order, created_at out of it by less than pagination.ID_ORDER_SLACK, as two
+    # workers flushing their queues can leave them
+    for entry, created_at in [('before', '2031-05-01T11:59:59'), ('late', '2031-05-01T12:00:02'),
+                              ('first', '2031-05-01T12:00:00'), ('last', '2031-05-01T12:00:03'),
+                              ('middle', '2031-05-01T12:00:01'), ('after', '2031-05-01T12:00:04')]:
+        query.execute("INSERT INTO journals (entry, created_at) VALUES (?, ?)", (f"rangecheck {entry}", created_at))
+    expected = {'rangecheck first', 'rangecheck middle', 'rangecheck late', 'rangecheck last'}
+    since, until = '2031-05-01T12:00:00', '2031-05-01T12:00:04'
+    for path in (f'/journal/recent?limit=50&since={since}&until={until}',
+                 f'/search?in=journals&q=rangecheck&since={since}&until={until}'):
+        r = client.get(path)
+        assert r.status_code == 200 and {j['entry'] for j in r.get_json()} == expected, (path, r.get_json())
+    for path in ('/history?since=garbage', '/journal/recent?until=2031-13-01', '/search?q=rangecheck&since=x'):
+        assert client.get(path).status_code == 400, path
+    print('time ranges: exact at both ends with out-of-order ids; bad since/until rejected')
+
+
+def check_search_window():
+    """Matches older than the ranking window are reported, not silently dropped from the paging."""
+    import search
+
+    client = app.test_client()
+    path = '/search?in=journals&q=rangecheck&limit=2'  # the six rows check_time_ranges() inserted
+    r = client.get(path)
+    assert len(r.get_json()) == 2 and 'X-Search-Truncated' not in r.headers, r.headers
+    window = search.RANK_WINDOW
+    search.RANK_WINDOW = 3
+    try:
+        r = client.get(path)
+        assert r.headers.get('X-Search-Truncated') == '3', r.headers
+        r = client.get(f"{path}&cursor={r.headers['X-Next-Cursor']}")
+        assert len(r.get_json()) == 1 and 'X-Next-Cursor' not in r.headers, r.get_json()
+        assert r.headers.get('X-Search-Truncated') == '3', r.headers
+    finally:
+        search.RANK_WINDOW = window
+    print('search window: truncation reported on every page')
+
+
+def check_admission():
+    """Slots are handed over in arrival order; shed, crisis and rate-limited requests get their replies."""
+    import threading
+    import time
+
+    import admission
+
+    limiter = admission.Limiter(concurrency=1, queue_size=3, timeout=5)
+    assert limiter.acquire() == 'taken'
+    order, waiters = [], []
+    for i in range(3):
+        waiters.append(threading.Thread(target=lambda i=i: (order.append((i, limiter.acquire())), limiter.release())))
+        waiters[-1].start()
+        while limiter.waiting() <= i:
+            time.sleep(0.001)
+    assert limiter.acquire() == 'full'
+    limiter.release()
+    for t in waiters:
+        t.join()
+    assert order == [(0, 'queued'), (1, 'queued'), (2, 'queued')] and limiter.active == 0, order
+
+    anxious, crisis = 'I am feeling anxious and overwhelmed', 'I want to kill myself'
+    saved = admission.limiter, admission.buckets
+    try:
+        for admission.limiter in (admission.Limiter(concurrency=0, queue_size=1, timeout=0.05),
+                                  admission.Limiter(concurrency=0, queue_size=0)):
+            r = app.test_client().post('/get', data={'msg': anxious})
+            assert r.status_code == 200 and r.get_json().get('degraded') is True, r.get_json()
+            r = app.test_client().post('/get', data={'msg': crisis})
+            assert r.status_code == 200 and 'degraded' not in r.get_json(), r.get_json()
+        assert admission.limiter.active == 0
+
+        admission.limiter = admission.Limiter()
+        admission.buckets = admission.TokenBuckets(rate=0.5, burst=2)
+        client = app.test_client()
+        statuses = [client.post('/get', data={'msg': anxious}).status_code for _ in range(2)]
+        r = client.post('/get', data={'msg': anxious})
+        assert statuses == [200, 200] and r.status_code == 429 and r.headers['Retry-After'] == '2', r.headers
+        assert client.post('/get', data={'msg': crisis}).status_code == 200
+
+        # a batch above the burst goes through from a full bucket and is charged in full
+        admission.buckets = admission.TokenBuckets(rate=0.5, burst=2)
+        r = client.post('/get_batch', json=[anxious, 'I feel stressed', 'I feel nervous', 'my workload is overwhelming',
+                                            'I feel anxious about exams', 'I feel so stressed'])
+        assert r.status_code == 200 and all('degraded' not in a for a in r.get_json()), r.get_json()
+        r = client.post('/get', data={'msg': anxious})
+        assert r.status_code == 429 and r.headers['Retry-After'] == '10', r.headers
+    finally:
+        admission.limiter, admission.buckets = saved
+    print('admission: FIFO handover; timed-out and full queues shed; crisis bypass; 429 with Retry-After')
 
 
 def run():
@@ -28,6 +263,13 @@ def run():
     r3 = client.get('/history')
     print('GET /history ->', r3.status_code, r3.get_json())
 
+    check_engine_parity()
+    check_traffic_mixes()
+    check_write_behind()
+    check_time_ranges()
+    check_search_window()
+    check_admission()
+
 
 if __name__ == '__main__':
     run()
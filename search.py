@@ -0,0 +1,183 @@
+"""
+Full-text search over journal entries and chat history.
+
+SQLite: FTS5 indexes `journals_fts` and `chats_fts` are external-content tables over `journals`
+and `chats` (the text is stored once, in the base table). Triggers on the base tables keep them
+in sync, so the write-behind INSERTs need no changes, and ensure_schema() fills them from the rows
+already there the first time it runs. Results are ranked with bm25().
+
+MySQL: FULLTEXT indexes on the same columns, queried with MATCH ... AGAINST in boolean mode (every
+word required) and ranked by its relevance; InnoDB maintains them on every write.
+
+A lookup reads the inverted index for the query terms only, newest match first, and ranks at most
+SEARCH_RANK_WINDOW matches, unlike the LIKE '%...%' scans it replaces. What still grows with the
+table is bm25()'s document count per term, one sequential pass over each term's postings
+(about 20 ms for a word found in 150k of 500k entries; see benchmarks/bench_search.py).
+If this SQLite build has no FTS5, search() falls back to a LIKE scan (unranked, newest first).
+
+Pages are ranked, so the cursor is an offset into the ranking rather than an id, and paging ends
+with the window: search() reports when matches older than it exist (X-Search-Truncated on /search). since/until are
+turned into an id range by pagination.id_bounds(), as for /history, and the exact range is then
+applied to created_at.
+"""
+import logging
+import os
+import re
+
+import db
+import pagination
+import query
+
+log = logging.getLogger(__name__)
+
+MAX_LIMIT = 100
+# ranking looks at this many of the newest matches; a word found in most entries would otherwise
+# cost a bm25() evaluation per matching row on every query
+RANK_WINDOW = int(os.environ.get('SEARCH_RANK_WINDOW', '1000'))
+PREFIX_MIN_CHARS = 3
+
+# scope -> (table, searchable columns, returned columns)
+SCOPES = {
+    'journals': ('journals', ('entry',), 'id, entry, created_at'),
+    'chats': ('chats', ('user', 'bot'), 'id, user, bot, label, created_at'),
+}
+
+_TERM_RE = re.compile(r"\w+", re.UNICODE)
+
+_fts5 = None  # whether the SQLite FTS tables exist; None until ensure_schema() or the first search
+
+
+# ==========================================
+# Schema
+# ==========================================
+def _sqlite_statements(table, columns):
+    fts = f"{table}_fts"
+    cols = ', '.join(columns)
+    new = ', '.join(f"new.{c}" for c in columns)
+    old = ', '.join(f"old.{c}" for c in columns)
+    delete = f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old});"
+    insert = f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new});"
+    return [
+        f"CREATE VIRTUAL TABLE {fts} USING fts5({cols}, content='{table}', content_rowid='id', "
+        f"tokenize='porter unicode61')",
+        f"CREATE TRIGGER {fts}_ai AFTER INSERT ON {table} BEGIN {insert} END",
+        f"CREATE TRIGGER {fts}_ad AFTER DELETE ON {table} BEGIN {delete} END",
+        f"CREATE TRIGGER {fts}_au AFTER UPDATE ON {table} BEGIN {delete} {insert} END",
+        # index the rows written before the FTS table existed
+        f"INSERT INTO {fts}({fts}) VALUES ('rebuild')",
+    ]
+
+
+def ensure_schema(conn):
+    """Create the full-text indexes (and for SQLite, the sync triggers) if they don't exist yet."""
+    global _fts5
+    cur = conn.cursor()
+    if db.backend() == 'mysql':
+        for table, columns, _ in SCOPES.values():
+            try:
+                # a duplicate-key error means the index is already there
+                cur.execute(f"ALTER TABLE {table} ADD FULLTEXT INDEX ft_{table} ({', '.join(columns)})")
+            except Exception:
+                pass
+        conn.commit()
+        return
+    for table, columns, _ in SCOPES.values():
+        cur.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (f"{table}_fts",))
+        if cur.fetchone():
+            continue
+        try:
+            for sql in _sqlite_statements(table, columns):
+                cur.execute(sql)
+            conn.commit()
+        except Exception:
+            # no FTS5 in this SQLite build: search() scans with LIKE instead
+            conn.rollback()
+            log.warning("FTS5 unavailable; /search on %s falls back to LIKE scans", table, exc_info=True)
+            _fts5 = False
+            return
+    _fts5 = True
+
+
+def _has_fts5():
+    global _fts5
+    if _fts5 is None:
+        _fts5 = query.fetch_one("SELECT COUNT(1) AS n FROM sqlite_master WHERE name IN ('journals_fts', 'chats_fts')")['n'] == 2
+    return _fts5
+
+
+# ==========================================
+# Queries
+# ==========================================
+def terms(text):
+    """Words of a search box query; operators and punctuation are dropped, never interpreted."""
+    return _TERM_RE.findall(text or '')
+
+
+def search(scope, text, limit=20, offset=0, since=None, until=None):
+    """Return (rows, next_offset, truncated) for the best matches of `text` in `scope`, best first.
+
+    Every word must match; the last one also matches as a prefix (partial input while typing)
+    once it has PREFIX_MIN_CHARS characters. Only the newest RANK_WINDOW matches are ranked, which bounds the cost
+    of common words; truncated is True when older matches were left out, and they are reached by
+    narrowing the query or moving `until` back. Rows carry a `score` where higher is better;
+    next_offset is None on the last page.
+    """
+    table, columns, returned = SCOPES[scope]
+    words = terms(text)
+    if not words:
+        return [], None, False
+    # a very short prefix would expand to most of the vocabulary
+    prefix = len(words[-1]) >= PREFIX_MIN_CHARS
+    bounds = pagination.id_bounds(table, since, until)
+    # "{id}" is filled in with the id column of the table each backend filters on
+    where, params = [], []
+    for op, bound in zip(('>=', '<='), bounds):
+        if bound is not None:
+            where.append(f"{{id}} {op} ?")
+            params.append(bound)
+    times = pagination.time_filters(since, until)
+    returned = ', '.join(f"t.{c.strip()}" for c in returned.split(','))
+
+    if db.backend() == 'mysql':
+        # boolean mode: +word requires the word, word* matches prefixes
+        match = ' '.join(f"+{w}" for w in words) + ('*' if prefix else '')
+        against = f"MATCH ({', '.join(columns)}) AGAINST (? IN BOOLEAN MODE)"
+        where = [c.format(id='id') for c in where] + [c for c, _ in times]
+        sql = (f"SELECT {returned}, m.score FROM (SELECT id, {against} AS score FROM {table} "
+               f"WHERE {' AND '.join([against] + where)} ORDER BY id DESC LIMIT ?) m "
+               f"JOIN {table} t ON t.id = m.id ORDER BY m.score DESC, t.id DESC LIMIT ? OFFSET ?")
+        params = [match, match] + params + [v for _, v in times] + [RANK_WINDOW]
+        beyond = (f"SELECT id FROM {table} WHERE {' AND '.join([against] + where)} "
+                  f"ORDER BY id DESC LIMIT 1 OFFSET ?", params[1:-1] + [RANK_WINDOW])
+    elif _has_fts5():
+        fts = f"{table}_fts"
+        # each word quoted, so FTS5 syntax (AND/OR/NEAR, column filters, quotes) in the input is inert
+        match = ' '.join(f'"{w}"' for w in words) + ('*' if prefix else '')
+        # FTS5 walks its doclists newest first and stops after the window; bm25() is lower-is-better,
+        # negated so every backend returns higher-is-better scores
+        where = [c.format(id='rowid') for c in where]
+        # the FTS table has no created_at: the exact time range is applied after the join
+        outer = ''.join(f" AND t.{c}" for c, _ in times)
+        sql = (f"SELECT {returned}, -m.rank AS score FROM (SELECT rowid, bm25({fts}) AS rank FROM {fts} "
+               f"WHERE {' AND '.join([f'{fts} MATCH ?'] + where)} ORDER BY rowid DESC LIMIT ?) m "
+               f"JOIN {table} t ON t.id = m.rowid{outer} ORDER BY m.rank, t.id DESC LIMIT ? OFFSET ?")
+        beyond = (f"SELECT rowid FROM {fts} WHERE {' AND '.join([f'{fts} MATCH ?'] + where)} "
+                  f"ORDER BY rowid DESC LIMIT 1 OFFSET ?", [match] + params + [RANK_WINDOW])
+        params = [match] + params + [RANK_WINDOW] + [v for _, v in times]
+    else:
+        likes, patterns = [], []
+        for w in words:
+            likes.append('(' + ' OR '.join(f"t.{c} LIKE ?" for c in columns) + ')')
+            patterns += [f"%{w}%"] * len(columns)
+        params = patterns + params + [v for _, v in times]
+        where = [c.format(id='t.id') for c in where] + [f"t.{c}" for c, _ in times]
+        sql = (f"SELECT {returned}, 0 AS score FROM {table} t WHERE {' AND '.join(likes + where)} "
+               f"ORDER BY t.id DESC LIMIT ? OFFSET ?")
+        beyond = None  # unranked, so every match is reachable by paging
+    # one extra row tells us whether there is a next page without a COUNT(*)
+    rows = query.fetch_all(sql, params + [limit + 1, offset])
+    # a match past the window means the ranking (and so the paging) stopped short of the oldest ones
+    truncated = beyond is not None and query.fetch_one(*beyond) is not None
+    if len(rows) > limit:
+        return rows[:limit], offset + limit, truncated
+    return rows, None, truncated
@@ -0,0 +1,175 @@
+"""
+Server-side conversation context per browser session.
+
+Each session keeps a rolling window of its last SESSION_CONTEXT_WINDOW turns as (label,
+stress_type, intent), so /get can take the conversation so far into account without re-reading
+`chats`. The browser only carries a random session id in Flask's signed session cookie
+(session_id()).
+
+SESSION_STORE selects where the windows live:
+ - memory (default): an LRUCache of at most SESSION_MAX sessions, each expiring SESSION_TTL
+   seconds after its last turn. A window is packed into bytes, one byte per value (codes into a
+   per-process table of the labels, stress types and intents seen so far), so a session costs a
+   few hundred bytes including the cache entry; see benchmarks/bench_sessions.py. State is per
+   process: under several workers a session only sees the turns its worker handled.
+ - db: the `sessions` table (db_setup.py) with a token and a JSON context column added by
+   ensure_schema(). Reads are one lookup on the unique token index; writes are upserts committed
+   before the reply is sent, so the session's next message reads this turn in any worker. (Queued on
+   the write-behind queue, the next message could read the window before the flush and its save
+   would overwrite this turn.) Sessions idle for longer than SESSION_TTL read as empty and are
+   deleted by purge().
+"""
+import json
+import os
+import secrets
+import threading
+from datetime import datetime, timedelta
+
+import db
+import query
+from cache import LRUCache
+
+BACKEND = os.environ.get('SESSION_STORE', 'memory')
+WINDOW = int(os.environ.get('SESSION_CONTEXT_WINDOW', '5'))
+MAX_SESSIONS = int(os.environ.get('SESSION_MAX', '50000'))
+TTL = float(os.environ.get('SESSION_TTL', '1800'))
+
+_SQLITE_UPSERT = ("INSERT INTO sessions (token, context, started_at, last_active) VALUES (?, ?, ?, ?) "
+                  "ON CONFLICT (token) DO UPDATE SET context = excluded.context, last_active = excluded.last_active")
+_MYSQL_UPSERT = ("INSERT INTO sessions (token, context, started_at, last_active) VALUES (?, ?, ?, ?) "
+                 "ON DUPLICATE KEY UPDATE context = VALUES(context), last_active = VALUES(last_active)")
+
+
+def session_id(session):
+    """The session's id, creating one in `session` (Flask's session or a dict) on first use."""
+    sid = session.get('sid')
+    if not isinstance(sid, str):
+        sid = session['sid'] = secrets.token_urlsafe(12)
+    return sid
+
+
+def ensure_schema(conn):
+    """Add the token and context columns (and the token index) to `sessions`."""
+    cur = conn.cursor()
+    try:
+        # db_setup.py creates the table; databases made by the app alone may not have it
+        cur.execute("CREATE TABLE IF NOT EXISTS sessions (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, "
+                    "started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, last_active TIMESTAMP)")
+    except Exception:
+        pass
+    for sql in ("ALTER TABLE sessions ADD COLUMN token VARCHAR(32)",
+                "ALTER TABLE sessions ADD COLUMN context TEXT",
+                "CREATE UNIQUE INDEX idx_sessions_token ON sessions (token)"):
+        try:
+            # fails when the column or index is already there
+            cur.execute(sql)
+        except Exception:
+            pass
+    conn.commit()
+
+
+# ==========================================
+# Packed windows (memory store)
+# ==========================================
+_values = []  # code -> value
+_codes = {}  # value -> code
+_codes_lock = threading.Lock()
+# one byte per value; values past the 255th distinct one are all stored as None
+_OVERFLOW = 255
+
+
+def _code(value):
+    code = _codes.get(value)
+    if code is None:
+        with _codes_lock:
+            code = _codes.get(value)
+            if code is None:
+                code = len(_values) if len(_values) < _OVERFLOW else _OVERFLOW
+                if code < _OVERFLOW:
+                    _values.append(value)
+                    _codes[value] = code
+    return code
+
+
+def _value(code):
+    return _values[code] if code < len(_values) else None
+
+
+def pack(turns):
+    """Encode [(label, stress_type, intent), ...] as bytes (see the module docstring)."""
+    return bytes(_code(v) for turn in turns for v in turn)
+
+
+def unpack(blob):
+    return [tuple(_value(c) for c in blob[i:i + 3]) for i in range(0, len(blob), 3)]
+
+
+# ==========================================
+# Stores
+# ==========================================
+class MemoryStore:
+    def __init__(self, maxsize=MAX_SESSIONS, ttl=TTL, window=WINDOW):
+        self.window = window
+        self.cache = LRUCache(maxsize=maxsize, ttl=ttl)
+
+    def load(self, sid):
+        return unpack(self.cache.get(sid, b''))
+
+    def save(self, sid, turns):
+        self.cache.put(sid, pack(turns[-self.window:]))
+
+    def stats(self):
+        return self.cache.stats()
+
+
+class DBStore:
+    def __init__(self, ttl=TTL, window=WINDOW):
+        self.window = window
+        self.ttl = ttl
+
+    def _cutoff(self):
+        return (datetime.utcnow() - timedelta(seconds=self.ttl)).isoformat()
+
+    def load(self, sid):
+        row = query.fetch_one("SELECT context, last_active FROM sessions WHERE token = ?", (sid,))
+        if row is None or not row['context'] or str(row['last_active']).replace(' ', 'T') < self._cutoff():
+            return []
+        return [tuple(turn) for turn in json.loads(row['context'])]
+
+    def save(self, sid, turns):
+        now = datetime.utcnow().isoformat()
+        sql = _MYSQL_UPSERT if db.backend() == 'mysql' else _SQLITE_UPSERT
+        query.execute(sql, (sid, json.dumps(turns[-self.window:], separators=(',', ':')), now, now))
+
+    def purge(self):
+        """Delete sessions idle for longer than the TTL; returns how many."""
+        with db.connection(write=True) as conn:
+            cur = conn.cursor()
+            cur.execute(query.sql_for("DELETE FROM sessions WHERE token IS NOT NULL AND last_active < ?"),
+                        (self._cutoff(),))
+            return cur.rowcount
+
+    def stats(self):
+        return {}
+
+
+store = DBStore() if BACKEND == 'db' else MemoryStore()
+
+
+def context(sid):
+    """The session's recent turns as [(label, stress_type, intent), ...], oldest first."""
+    return store.load(sid)
+
+
+def record(sid, history, label, stress_type, intent):
+    """Store `history` (as returned by context()) plus this turn, keeping the last SESSION_CONTEXT_WINDOW."""
+    store.save(sid, history + [(label, stress_type, intent)])
+
+
+def purge():
+    """Delete expired sessions from the db store (the memory store evicts on its own)."""
+    return store.purge() if isinstance(store, DBStore) else 0
+
+
+def stats():
+    return dict(store.stats(), backend=BACKEND)
@@ -76,6 +76,10 @@ async function sendMessage(){
       headers:{'Content-Type':'application/x-www-form-urlencoded'},
       body: new URLSearchParams({msg})
     });
+    if(res.status === 429){
+      appendMessage(`You're sending messages quickly — give it ${res.headers.get('Retry-After') || 'a few'} seconds and try again.`, 'bot');
+      return;
+    }
     if(!res.ok) throw new Error('Server error');
     const data = await res.json();
 
@@ -83,8 +87,8 @@ async function sendMessage(){
 
     // Update analysis panel
     analysisEl.innerHTML = `
-      <div class="label">Emotion: ${data.label} </div>
-      <div class="confidence">Confidence: ${Object.entries(data.confidence).map(([k,v])=>`${k}: ${Math.round(v*100)}%`).join(' · ')}</div>
+      ${data.degraded ? '' : `<div class="label">Emotion: ${data.label} </div>
+      <div class="confidence">Confidence: ${Object.entries(data.confidence).map(([k,v])=>`${k}: ${Math.round(v*100)}%`).join(' · ')}</div>`}
       <div class="stresstype">Type: ${data.stress_type}</div>
       <div class="tips">
         <h4>Suggested tips</h4>
@@ -98,6 +102,10 @@ async function sendMessage(){
         <h4>Resources</h4>
         <ul>${data.resources.map(r=>`<li><a href="${r.url}" target="_blank" rel="noopener">${r.title}</a></li>`).join('')}</ul>
       </div>
+      ${(data.articles || []).length ? `<div class="articles">
+        <h4>Related reading</h4>
+        <ul>${data.articles.map(a=>`<li>${a.title} <small>(${a.category})</small></li>`).join('')}</ul>
+      </div>` : ''}
     `;
 
   }catch(err){
@@ -146,75 +154,137 @@ profileOpen.addEventListener('click', ()=>{
 
 // Load resources from DB
 function loadResources(){
-  fetch('/resources_db').then(r=>r.json()).then(list=>{
-    resourceList.innerHTML = list.map(r=>`<li><a href="${r.url}" target="_blank" rel="noopener">${r.title}</a> <small class="muted">(${r.category})</small></li>`).join('');
-  }).catch(()=>{resourceList.innerHTML = '<li>Unable to load resources</li>'});
+  fetch('/resources_db').then(r=>r.json()).then(renderResources)
+    .catch(()=>{resourceList.innerHTML = '<li>Unable to load resources</li>'});
+}
+
+function renderResources(list){
+  resourceList.innerHTML = list.map(r=>`<li><a href="${r.url}" target="_blank" rel="noopener">${r.title}</a> <small class="muted">(${r.category})</small></li>`).join('');
 }
 
 // Load recent journals
 function loadRecentJournals(){
-  fetch('/journal/recent').then(r=>r.json()).then(list=>{
-    const panel = document.getElementById('journaling');
-    const html = list.map(j=>`<div class="card" style="margin-bottom:8px"><small class="muted">${j.created_at}</small><div>${escapeHtml(j.entry)}</div></div>`).join('');
-    const container = panel.querySelector('#journal-list');
-    if(container) container.innerHTML = html;
-    else panel.insertAdjacentHTML('beforeend', `<div id="journal-list">${html}</div>`)
-  }).catch(()=>{});
+  fetch('/journal/recent').then(r=>r.json()).then(renderJournals).catch(()=>{});
+}
+
+let shownJournals = [];
+
+function renderJournals(list){
+  shownJournals = list;
+  const panel = document.getElementById('journaling');
+  const html = list.map(j=>`<div class="card" style="margin-bottom:8px"><small class="muted">${j.created_at}</small><div>${escapeHtml(j.entry)}</div></div>`).join('');
+  const container = panel.querySelector('#journal-list');
+  if(container) container.innerHTML = html;
+  else panel.insertAdjacentHTML('beforeend', `<div id="journal-list">${html}</div>`)
 }
 
 function escapeHtml(s){ return String(s).replace(/[&<>"']/g, c=>({ '&':'&amp;','<':'&lt;','>':'&gt;','"':'&quot;',"'":'&#39;' }[c])); }
 
 // Load breathing guide
+// the steps come with /bootstrap; fetched again only if that failed
+let breathingLoaded = false;
+
 function loadBreathing(){
-  fetch('/breathing').then(r=>r.json()).then(data=>{
-    breathingSteps.innerHTML = data.steps.map(s=>`<li>${s.text}</li>`).join('');
-    resetBreathingStepHighlight();
-    if(breathPlaying){
-      if(breathStepTimer){
-        clearTimeout(breathStepTimer);
-        breathStepTimer = null;
-      }
-      highlightBreathingSteps();
-    }
-    // init lottie if available
-    if(window.lottie && !lottiePlayer){
-      try{
-        lottiePlayer = lottie.loadAnimation({container: document.getElementById('lottieBreath'), renderer: 'svg', loop: true, autoplay:true, path: 'https://assets9.lottiefiles.com/packages/lf20_touohxv0.json'});
-      }catch(e){console.warn('Lottie failed', e)}
+  if(breathingLoaded){
+    renderBreathing(null);
+    return;
+  }
+  fetch('/breathing').then(r=>r.json()).then(data=>renderBreathing(data.steps)).catch(()=>{});
+}
+
+function renderBreathing(steps){
+  if(steps){
+    breathingSteps.innerHTML = steps.map(s=>`<li>${s.text}</li>`).join('');
+    breathingLoaded = true;
+  }
+  resetBreathingStepHighlight();
+  if(breathPlaying){
+    if(breathStepTimer){
+      clearTimeout(breathStepTimer);
+      breathStepTimer = null;
     }
-  }).catch(()=>{});
+    highlightBreathingSteps();
+  }
+  // init lottie if available
+  if(window.lottie && !lottiePlayer){
+    try{
+      lottiePlayer = lottie.loadAnimation({container: document.getElementById('lottieBreath'), renderer: 'svg', loop: true, autoplay:true, path: 'https://assets9.lottiefiles.com/packages/lf20_touohxv0.json'});
+    }catch(e){console.warn('Lottie failed', e)}
+  }
+}
+
+// UI actions are buffered and sent to /log_actions in bulk: every ACTION_FLUSH_MS, when the
+// buffer fills up, and with sendBeacon when the page is hidden or closed
+const ACTION_FLUSH_MS = 10000;
+const ACTION_MAX_BUFFER = 20;
+let actionBuffer = [];
+
+function logAction(action_type, details){
+  actionBuffer.push({action_type, details});
+  if(actionBuffer.length >= ACTION_MAX_BUFFER) flushActions(false);
 }
 
-// initial load
-loadResources();
+function flushActions(leaving){
+  if(!actionBuffer.length) return;
+  const body = JSON.stringify({actions: actionBuffer});
+  actionBuffer = [];
+  // sendBeacon survives the page unloading; fetch keepalive is the fallback when it refuses
+  if(leaving && navigator.sendBeacon && navigator.sendBeacon('/log_actions', new Blob([body], {type:'application/json'}))) return;
+  fetch('/log_actions', {method:'POST', headers:{'Content-Type':'application/json'}, body, keepalive: true}).catch(()=>{});
+}
+
+setInterval(()=>flushActions(false), ACTION_FLUSH_MS);
+document.addEventListener('visibilitychange', ()=>{
+  if(document.visibilityState === 'hidden') flushActions(true);
+});
+window.addEventListener('pagehide', ()=>flushActions(true));
+
+// initial load: every panel's data in one request (/bootstrap), with the per-panel endpoints as fallback
+function loadBootstrap(){
+  fetch('/bootstrap').then(r=>{
+    if(!r.ok) throw new Error(r.status);
+    return r.json();
+  }).then(data=>{
+    renderResources(data.resources);
+    renderJournals(data.journals);
+    breathingSteps.innerHTML = data.breathing.map(s=>`<li>${s.text}</li>`).join('');
+    breathingLoaded = true;
+    renderLearn(data.knowledge);
+  }).catch(()=>{
+    loadResources();
+    loadLearn();
+  });
+}
 // load knowledge / learn entries
 function loadLearn(){
-  fetch('/knowledge').then(r=>r.json()).then(list=>{
-    const container = document.getElementById('learn-list');
-    container.innerHTML = list.map(k=>`
-      <div class="card" style="margin-bottom:8px">
-        <h5>${k.title}</h5>
-        <p class="muted">${k.category}</p>
-        <p>${k.content.substring(0,200)}... <a href="#" data-id="${k.id}" class="learn-more">Read more</a></p>
-      </div>
-    `).join('');
-    // attach listeners
-    document.querySelectorAll('.learn-more').forEach(a=>a.addEventListener('click', (e)=>{
-      e.preventDefault();
-      const id = a.dataset.id;
-      const item = list.find(x=>String(x.id)===String(id));
-      if(item){
-        // insert modal-like detail below
-        const modalHtml = `<div class="card glass"><h4>${item.title}</h4><p><strong>How it comes:</strong> ${item.how_it_comes}</p><p><strong>How it goes:</strong> ${item.how_it_goes}</p><p>${item.content}</p></div>`;
-        const container = document.getElementById('learn-list');
-        container.insertAdjacentHTML('afterbegin', modalHtml);
-        // log action
-        fetch('/log_action', {method:'POST', body: new URLSearchParams({action_type:'view_learn', details: item.title})});
-      }
-    }))
-  }).catch(()=>{})
-}
-loadLearn();
+  fetch('/knowledge').then(r=>r.json()).then(renderLearn).catch(()=>{})
+}
+
+function renderLearn(list){
+  const container = document.getElementById('learn-list');
+  container.innerHTML = list.map(k=>`
+    <div class="card" style="margin-bottom:8px">
+      <h5>${k.title}</h5>
+      <p class="muted">${k.category}</p>
+      <p>${k.content.substring(0,200)}... <a href="#" data-id="${k.id}" class="learn-more">Read more</a></p>
+    </div>
+  `).join('');
+  // attach listeners
+  document.querySelectorAll('.learn-more').forEach(a=>a.addEventListener('click', (e)=>{
+    e.preventDefault();
+    const id = a.dataset.id;
+    const item = list.find(x=>String(x.id)===String(id));
+    if(item){
+      // insert modal-like detail below
+      const modalHtml = `<div class="card glass"><h4>${item.title}</h4><p><strong>How it comes:</strong> ${item.how_it_comes}</p><p><strong>How it goes:</strong> ${item.how_it_goes}</p><p>${item.content}</p></div>`;
+      const container = document.getElementById('learn-list');
+      container.insertAdjacentHTML('afterbegin', modalHtml);
+      // log action
+      logAction('view_learn', item.title);
+    }
+  }))
+}
+loadBootstrap();
 // load journals when journaling panel is visible
 document.querySelectorAll('.side-btn').forEach(b=>{
   b.addEventListener('click', ()=>{
@@ -232,7 +302,8 @@ if(saveJournalBtn){
       .then(r=>r.json()).then(j=>{
         document.getElementById('journal-text').value = '';
         document.getElementById('journal-saved').textContent = 'Saved';
-        loadRecentJournals();
+        // shown right away: the server writes entries in batches, so a refetch may not include it yet
+        renderJournals([{entry: text, created_at: j.created_at}, ...shownJournals].slice(0, 10));
       }).catch(()=>alert('Save failed'));
   });
 }
@@ -5,6 +5,7 @@ from sklearn.model_selection import train_test_split
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.linear_model import LogisticRegression
 from sklearn.metrics import classification_report, accuracy_score
+from artifact import export as export_artifact
 
 # ===================================================
 # 🎯 TRAINING DATA (Expanded for mental stress domain)
@@ -98,3 +99,7 @@ print("\n", classification_report(y_test, y_pred))
 os.makedirs("model", exist_ok=True)
 pickle.dump((vectorizer, model), open("model/emotion_model.pkl", "wb"))
 print("\n✅ ML Model saved successfully at model/emotion_model.pkl")
+
+# pickle-free, memory-mappable copy that app.py loads by default
+export_artifact(vectorizer, model, "model/emotion_model")
+print("✅ Exported model artifact at model/emotion_model/")
@@ -0,0 +1,239 @@
+"""
+Streaming, incremental trainer for the emotion classifier.
+
+train_model.py fits a TF-IDF model on a small in-memory dataset. This trainer instead streams
+labelled messages in chunks and never holds more than one chunk in memory:
+ - from the `chats` table (user message + stored label, OutOfScope/unlabelled rows skipped), read
+   with keyset pagination on id so every chunk is one index range scan;
+ - or from a JSONL file, one object per line (--text-field / --label-field pick the keys).
+
+Features come from a HashingVectorizer (stateless, so there is no vocabulary to grow) and the
+classifier is an SGDClassifier(loss='log_loss') updated with partial_fit(), so memory stays flat
+however many messages are streamed. Each chunk is scored before it is learned from (progressive
+validation), which gives a running accuracy without a held-out set.
+
+Every run writes a new versioned artifact (see artifact.py) to model/versions/<version>/. With
+--resume the run starts from an earlier version's weights, classes and learning-rate schedule and,
+for the chats source, only reads rows added since that version was trained — an incremental
+update instead of a retrain from scratch. --activate then points model/ACTIVE at the new version
+(only with the default --versions-dir, the one the app serves from),
+which running workers pick up without a restart (see model_registry.py).
+
+Usage:
+    python train_stream.py --source chats
+    python train_stream.py --source chats --resume latest --activate
+    python train_stream.py --source corpus.jsonl --text-field text --label-field label
+"""
+import argparse
+import json
+import os
+import time
+import warnings
+
+import numpy as np
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.linear_model import SGDClassifier
+
+import artifact
+import model_registry
+import query
+
+VERSIONS_DIR = model_registry.VERSIONS_DIR
+CHUNK_SIZE = 1000
+N_FEATURES = 2 ** 18
+
+_CHATS_SQL = ("SELECT id, user, label FROM chats WHERE id > ? AND label IS NOT NULL AND label != 'OutOfScope' "
+              "ORDER BY id ASC LIMIT ?")
+
+
+# ===================================================
+# 📥 Sources: (texts, labels, cursor) chunks
+# ===================================================
+def chat_chunks(chunk_size=CHUNK_SIZE, after_id=0):
+    """Labelled chats with id > after_id, oldest first; the cursor is the last id of the chunk."""
+    last_id = after_id
+    while True:
+        rows = query.fetch_all(_CHATS_SQL, (last_id, chunk_size))
+        if not rows:
+            return
+        last_id = rows[-1]['id']
+        yield [r['user'] or '' for r in rows], [r['label'] for r in rows], last_id
+
+
+def jsonl_chunks(path, text_field='text', label_field='label', chunk_size=CHUNK_SIZE):
+    """Objects from a JSONL file that have both fields; the cursor is the line number reached."""
+    texts, labels = [], []
+    with open(path, encoding='utf-8') as f:
+        for lineno, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            if item.get(text_field) is None or item.get(label_field) is None:
+                continue
+            texts.append(str(item[text_field]))
+            labels.append(str(item[label_field]))
+            if len(texts) == chunk_size:
+                yield texts, labels, lineno
+                texts, labels = [], []
+    if texts:
+        yield texts, labels, lineno
+
+
+def discover_classes(source, text_field, label_field):
+    """Label set of a source, needed up front by partial_fit (one cheap pass, labels only)."""
+    if source == 'chats':
+        rows = query.fetch_all("SELECT DISTINCT label FROM chats WHERE label IS NOT NULL AND label != 'OutOfScope'")
+        return sorted(r['label'] for r in rows)
+    classes = set()
+    for _, labels, _ in jsonl_chunks(source, text_field, label_field):
+        classes.update(labels)
+    return sorted(classes)
+
+
+# ===================================================
+# 🗂️ Versions
+# ===================================================
+def new_version_name(versions_dir=VERSIONS_DIR):
+    base = time.strftime('%Y%m%d-%H%M%S', time.gmtime())
+    name, n = base, 1
+    while os.path.exists(os.path.join(versions_dir, name)):
+        n += 1
+        name = f"{base}-{n}"
+    return name
+
+
+def _vectorizer_from(config):
+    return HashingVectorizer(
+        n_features=config['n_features'], alternate_sign=config['alternate_sign'], analyzer=config['analyzer'],
+        ngram_range=tuple(config['ngram_range']), lowercase=config['lowercase'],
+        strip_accents=config['strip_accents'], token_pattern=config['token_pattern'],
+        stop_words=config['stop_words'], binary=config['binary'], norm=config['norm'],
+        dtype=np.dtype(config['dtype']).type,
+    )
+
+
+def resume_from(version, versions_dir=VERSIONS_DIR):
+    """(vectorizer, model, meta) restored from a saved version, ready for more partial_fit calls."""
+    parent = artifact.load(os.path.join(versions_dir, version), mmap=False)
+    if parent.kind != 'hashing' or 'training' not in parent.meta:
+        raise ValueError(f"version {version} was not written by train_stream.py and cannot be resumed")
+    training = parent.meta['training']
+    model = SGDClassifier(loss='log_loss', alpha=training['alpha'], random_state=0)
+    model.classes_ = np.array(parent.classes_)
+    model.coef_ = np.array(parent.coef, dtype=np.float64)
+    model.intercept_ = np.array(parent.intercept, dtype=np.float64)
+    # the learning-rate schedule continues where the parent stopped
+    model.t_ = float(training['t'])
+    return _vectorizer_from(parent.config), model, parent.meta
+
+
+# ===================================================
+# ⚙️ Train
+# ===================================================
+def train(chunks, vectorizer, model, classes):
+    """partial_fit over `chunks`; returns (rows, skipped, correct, scored, last cursor)."""
+    known = set(classes)
+    rows = skipped = correct = scored = 0
+    cursor = None
+    for texts, labels, cursor in chunks:
+        keep = [i for i, label in enumerate(labels) if label in known]
+        skipped += len(labels) - len(keep)
+        if not keep:
+            continue
+        X = vectorizer.transform([texts[i] for i in keep])
+        y = np.array([labels[i] for i in keep])
+        if hasattr(model, 'coef_'):
+            # progressive validation: score the chunk before learning from it
+            correct += int((model.predict(X) == y).sum())
+            scored += len(y)
+        model.partial_fit(X, y, classes=classes)
+        rows += len(y)
+    return rows, skipped, correct, scored, cursor
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--source', default='chats', help="'chats' or a path to a .jsonl file")
+    parser.add_argument('--text-field', default='text')
+    parser.add_argument('--label-field', default='label')
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+    parser.add_argument('--resume', metavar='VERSION', help="continue from a saved version ('latest' for the newest)")
+    parser.add_argument('--classes', help="comma-separated labels (default: every label in the source)")
+    parser.add_argument('--n-features', type=int, default=N_FEATURES)
+    parser.add_argument('--alpha', type=float, default=1e-5)
+    parser.add_argument('--versions-dir', default=VERSIONS_DIR)
+    parser.add_argument('--activate', action='store_true', help="serve the new version once it is saved")
+    args = parser.parse_args()
+    if args.activate and os.path.realpath(args.versions_dir) != os.path.realpath(model_registry.VERSIONS_DIR):
+        # the app only serves versions from model_registry's directory; ACTIVE anywhere else is never read
+        parser.error(f"--activate needs the default --versions-dir ({model_registry.VERSIONS_DIR})")
+
+    parent_meta = None
+    after_id = 0
+    if args.resume:
+        version = args.resume
+        if version == 'latest':
+            versions = model_registry.list_versions(args.versions_dir)
+            if not versions:
+                raise SystemExit(f"no versions to resume in {args.versions_dir}")
+            version = versions[-1]
+        vectorizer, model, parent_meta = resume_from(version, args.versions_dir)
+        classes = [str(c) for c in model.classes_]
+        if args.source == 'chats' and parent_meta['training']['source'] == 'chats':
+            # only rows added since the parent was trained
+            after_id = parent_meta['training']['cursor'] or 0
+        print(f"🔁 Resuming from {version} ({parent_meta['training']['rows']} rows so far)")
+    else:
+        classes = args.classes.split(',') if args.classes else discover_classes(
+            args.source, args.text_field, args.label_field)
+        if len(classes) < 2:
+            raise SystemExit(f"need at least two labels to train, found {classes}")
+        vectorizer = HashingVectorizer(n_features=args.n_features, ngram_range=(1, 2))
+        model = SGDClassifier(loss='log_loss', alpha=args.alpha, random_state=0)
+
+    if args.source == 'chats':
+        chunks = chat_chunks(args.chunk_size, after_id)
+    else:
+        chunks = jsonl_chunks(args.source, args.text_field, args.label_field, args.chunk_size)
+
+    t0 = time.perf_counter()
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        rows, skipped, correct, scored, cursor = train(chunks, vectorizer, model, classes)
+    elapsed = time.perf_counter() - t0
+    print(f"🧩 Streamed {rows} rows in {elapsed:.2f}s ({skipped} skipped: label not in {classes})")
+    if scored:
+        print(f"📈 Progressive accuracy: {correct / scored * 100:.2f}% over {scored} rows")
+    if not rows:
+        raise SystemExit("nothing new to train on; no version written")
+
+    previous = parent_meta['training'] if parent_meta else {'rows': 0, 'cursor': None}
+    version = new_version_name(args.versions_dir)
+    training = {
+        'source': 'chats' if args.source == 'chats' else os.path.abspath(args.source),
+        'parent': parent_meta['version'] if parent_meta else None,
+        'rows': previous['rows'] + rows,
+        'new_rows': rows,
+        # a chats cursor is the last trained id; a JSONL cursor is not reusable across files
+        'cursor': cursor if args.source == 'chats' else previous['cursor'],
+        'alpha': model.alpha,
+        't': float(model.t_),
+        'progressive_accuracy': correct / scored if scored else None,
+    }
+    os.makedirs(args.versions_dir, exist_ok=True)
+    # export to a hidden directory and rename, so a half-written version is never listed
+    tmp = os.path.join(args.versions_dir, f".tmp-{version}")
+    artifact.export(vectorizer, model, tmp, extra_meta={
+        'version': version,
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'training': training,
+    })
+    os.rename(tmp, os.path.join(args.versions_dir, version))
+    print(f"✅ Saved model version {version} at {os.path.join(args.versions_dir, version)}")
+    if args.activate:
+        model_registry.activate(version)
+        print(f"🚀 Activated {version}; running workers switch on their next poll")
+
+
+if __name__ == '__main__':
+    main()
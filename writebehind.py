@@ -0,0 +1,212 @@
+"""
+Write-behind logger for the request path.
+
+Handlers enqueue their INSERTs (chats, journals, actions) and return as soon as the row is queued.
+A background thread flushes queued rows in batched transactions — one executemany() per distinct
+statement — when WRITE_BEHIND_BATCH rows are pending or WRITE_BEHIND_INTERVAL_MS has elapsed since
+the oldest pending row. Anything still queued is flushed at interpreter exit.
+
+A failed flush puts its rows back and is retried with a growing back-off. After
+WRITE_BEHIND_MAX_RETRIES failures in a row the next flush writes each row in its own transaction,
+so one row that can never be written (a constraint or schema error) doesn't hold up the rest; the
+rows that fail on their own are logged and dropped, and counted as 'dropped' in stats(). A
+database that stays unreachable through all the retries loses the rows queued meanwhile.
+
+Reads don't flush: a queued row shows up in /history, /journal/recent, /trends or /search once its
+batch commits, normally within WRITE_BEHIND_INTERVAL_MS. (Flushing on reads would put them behind
+the write lock and still only cover the rows queued in the same worker.) Set WRITE_BEHIND=0 to
+write synchronously instead.
+
+Functions:
+ - enqueue(sql, params): queue one write (sql uses `?` placeholders, see query.py)
+ - enqueue_many(sql, rows): queue several rows of one statement, committed together
+ - flush(): write everything pending now, returns the number of rows written
+ - queue_depth(): rows waiting to be written
+ - stats(): counters (enqueued, flushed, batches, errors, dropped) plus the current depth
+"""
+import atexit
+import collections
+import logging
+import os
+import threading
+import time
+
+import db
+import metrics
+import query
+
+ENABLED = os.environ.get('WRITE_BEHIND', '1') != '0'
+BATCH_SIZE = int(os.environ.get('WRITE_BEHIND_BATCH', '200'))
+INTERVAL = float(os.environ.get('WRITE_BEHIND_INTERVAL_MS', '250')) / 1000.0
+# beyond this many pending rows enqueue() flushes inline so memory stays bounded
+MAX_PENDING = int(os.environ.get('WRITE_BEHIND_MAX_PENDING', '10000'))
+MAX_RETRIES = int(os.environ.get('WRITE_BEHIND_MAX_RETRIES', '5'))
+
+log = logging.getLogger(__name__)
+
+
+class WriteBehindQueue:
+    def __init__(self, batch_size=BATCH_SIZE, interval=INTERVAL, max_pending=MAX_PENDING, max_retries=MAX_RETRIES):
+        self.batch_size = batch_size
+        self.interval = interval
+        self.max_pending = max_pending
+        self.max_retries = max_retries
+        self._reset()
+
+    def _reset(self):
+        self._pending = []  # (sql, params)
+        self._oldest = None
+        self._in_flight = 0
+        self._failures = 0  # flushes failed in a row
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self._stats = collections.Counter()
+
+    def enqueue(self, sql, params):
+        self.enqueue_many(sql, [params])
+
+    def enqueue_many(self, sql, rows):
+        # queued under one lock, so a flush takes all of the rows or none: they commit together
+        with self._cond:
+            if not self._pending:
+                self._oldest = time.monotonic()
+            self._pending.extend((sql, tuple(params)) for params in rows)
+            self._stats['enqueued'] += len(rows)
+            depth = len(self._pending)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+                self._thread.start()
+            if depth >= self.batch_size:
+                self._cond.notify()
+        if depth >= self.max_pending:
+            # the writer can't keep up — make this request pay for a flush rather than grow unbounded
+            self.flush()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                # a flush from another thread (max_pending, atexit) may empty the queue meanwhile
+                while self._pending and len(self._pending) < self.batch_size:
+                    remaining = self._oldest + self.interval - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                if not self._pending:
+                    continue
+            if not self.flush() and self._failures:
+                # the flush failed and requeued its rows; back off before retrying
+                time.sleep(self.interval * 2 ** min(self._failures - 1, 5))
+
+    def flush(self):
+        with self._flush_lock:
+            with self._cond:
+                batch, self._pending = self._pending, []
+                self._oldest = None
+                self._in_flight = len(batch)
+            if not batch:
+                return 0
+            if self._failures >= self.max_retries:
+                return self._flush_rows(batch)
+            # group by statement, keeping first-seen order so related rows commit together
+            groups = collections.OrderedDict()
+            for sql, params in batch:
+                groups.setdefault(sql, []).append(params)
+            try:
+                with metrics.span('db.flush'), db.connection(write=True) as conn:
+                    for sql, rows in groups.items():
+                        query.executemany(sql, rows, conn=conn)
+            except Exception:
+                log.exception("write-behind flush of %d rows failed; requeueing", len(batch))
+                with self._cond:
+                    self._pending[:0] = batch
+                    self._oldest = time.monotonic()
+                    self._in_flight = 0
+                    self._failures += 1
+                    self._stats['errors'] += 1
+                return 0
+            with self._cond:
+                self._in_flight = 0
+                self._failures = 0
+                self._stats['flushed'] += len(batch)
+                self._stats['batches'] += 1
+            return len(batch)
+
+    def _flush_rows(self, batch):
+        """Write a batch that keeps failing one row per transaction, dropping the rows that fail."""
+        written = 0
+        for sql, params in batch:
+            try:
+                with db.connection(write=True) as conn:
+                    query.executemany(sql, [params], conn=conn)
+                written += 1
+            except Exception:
+                log.exception("write-behind dropped a row that failed %d times: %s %r",
+                              self.max_retries + 1, sql, params)
+                with self._cond:
+                    self._stats['dropped'] += 1
+        with self._cond:
+            self._in_flight = 0
+            self._failures = 0
+            self._stats['flushed'] += written
+            self._stats['batches'] += 1
+        return written
+
+    def depth(self):
+        with self._cond:
+            return len(self._pending) + self._in_flight
+
+    def stats(self):
+        with self._cond:
+            out = dict(self._stats)
+            out['depth'] = len(self._pending) + self._in_flight
+        return out
+
+
+_queue = WriteBehindQueue()
+
+
+def _shutdown_flush():
+    try:
+        _queue.flush()
+    except Exception:
+        log.exception("final write-behind flush failed")
+
+
+atexit.register(_shutdown_flush)
+
+if hasattr(os, 'register_at_fork'):
+    # rows queued before a fork belong to the parent; the child starts empty with its own thread
+    os.register_at_fork(after_in_child=_queue._reset)
+
+
+def enqueue(sql, params=()):
+    """Queue one INSERT. Written synchronously when WRITE_BEHIND=0."""
+    if not ENABLED:
+        query.execute(sql, params)
+        return
+    _queue.enqueue(sql, params)
+
+
+def enqueue_many(sql, rows):
+    """Queue several rows of one INSERT; they are written in the same transaction."""
+    if not ENABLED:
+        query.executemany(sql, rows)
+        return
+    _queue.enqueue_many(sql, rows)
+
+
+def flush():
+    """Write everything pending now. Returns the number of rows written."""
+    return _queue.flush()
+
+
+def queue_depth():
+    """Rows queued or currently being written."""
+    return _queue.depth()
+
+
+def stats():
+    return _queue.stats()